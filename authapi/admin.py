@@ -1 +1,9 @@
-# Register your models here.
+from django.contrib import admin
+
+from authapi.models import Webhook
+
+
+@admin.register(Webhook)
+class WebhookAdmin(admin.ModelAdmin):
+    list_display = ('url', 'active', 'last_seq', 'failures', 'next_attempt_at')
+    readonly_fields = ('failures', 'next_attempt_at', 'created_at')
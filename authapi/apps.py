@@ -5,3 +5,6 @@ from django.apps import AppConfig
 
 class AuthapiConfig(AppConfig):
     name = 'authapi'
+
+    def ready(self):
+        from authapi import signals  # noqa
@@ -0,0 +1,36 @@
+import copy
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from authapi.cache import get_token_cache, token_cache_key
+from authapi.metrics import TOKEN_LOOKUPS
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    '''
+    Extends TokenAuthentication to cache the token, and its user, in the
+    cache configured in the TOKEN_CACHE setting. Cached tokens are removed
+    when the token is deleted, or when the user is changed.
+    '''
+
+    def authenticate_credentials(self, key):
+        cache = get_token_cache()
+        cache_key = token_cache_key(key)
+        token = cache.get(cache_key)
+        if token is None:
+            try:
+                user, token = super(
+                    CachedTokenAuthentication, self).authenticate_credentials(
+                        key)
+            except AuthenticationFailed:
+                TOKEN_LOOKUPS.labels('invalid').inc()
+                raise
+            TOKEN_LOOKUPS.labels('database').inc()
+            # Local caches return the same instance to every request, so
+            # requests get their own copy to modify.
+            cache.set(cache_key, copy.deepcopy(token))
+        else:
+            TOKEN_LOOKUPS.labels('cached').inc()
+            token = copy.deepcopy(token)
+        return (token.user, token)
@@ -0,0 +1,575 @@
+import io
+import json
+import math
+import random
+import sys
+import time
+from collections import Counter, OrderedDict, namedtuple
+from contextlib import contextmanager
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.signals import request_finished, request_started
+from django.core.wsgi import get_wsgi_application
+from django.db import close_old_connections, connection
+from rest_framework.authtoken.models import Token
+
+from authapi.db import record_queries
+from authapi.export import EXPORTS
+from authapi.models import (
+    SeedOrganization, SeedPermission, SeedTeam, UserEffectivePermission)
+
+
+Dataset = namedtuple('Dataset', [
+    'organization_ids', 'team_ids', 'user_ids', 'permission_ids', 'tokens',
+    'login', 'spare_user_ids'])
+
+# undo, if given, is called with the driver and token after each request to
+# the endpoint, to undo the changes that it made, so that every request
+# makes the same changes. It is also called before the first request, so that
+# the first request starts from the same state as the others.
+Endpoint = namedtuple(
+    'Endpoint', ['name', 'role', 'method', 'path', 'data', 'undo'])
+Endpoint.__new__.__defaults__ = (None,)
+
+PASSWORD = 'password'
+
+# Users that aren't members of any team or organization, which endpoints add
+# to, and remove from, teams and organizations
+SPARE_USERS = 5
+
+# The title, email, and namespace of the objects created by endpoints, which
+# are deleted again after each request
+CREATED_TITLE = 'Benchmark'
+CREATED_EMAIL = 'benchmark@example.org'
+CREATED_NAMESPACE = 'benchmark'
+NEW_PERMISSION = {
+    'type': 'app:read', 'object_id': '1', 'namespace': CREATED_NAMESPACE}
+
+
+def insert_rows(model, fields, rows, batch_size=1000):
+    '''Inserts the rows of values for the fields, batch_size rows in each
+    statement. This avoids creating and preparing a model instance for each
+    row, so it is only for values that need no conversion, like ids.'''
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(
+        connection.ops.quote_name(model._meta.get_field(f).column)
+        for f in fields)
+    placeholder = '(%s)' % ', '.join(['%s'] * len(fields))
+    with connection.cursor() as cursor:
+        for offset in range(0, len(rows), batch_size):
+            batch = rows[offset:offset + batch_size]
+            cursor.execute(
+                'INSERT INTO %s (%s) VALUES %s' % (
+                    table, columns, ', '.join([placeholder] * len(batch))),
+                [value for row in batch for value in row])
+
+
+class TeamSampler(object):
+    '''Picks distinct teams at random, where the team with rank r, in a
+    random order, has the weight 1 / r ** exponent. This gives a power law
+    of team sizes, or teams of about the same size for an exponent of 0.'''
+    def __init__(self, rng, teams, exponent=0):
+        self.rng = rng
+        self.teams = list(teams)
+        self.exponent = exponent
+        if exponent:
+            rng.shuffle(self.teams)
+            self.cum_weights = list(accumulate(
+                (r + 1) ** -exponent for r in range(len(self.teams))))
+
+    def sample(self, k):
+        if k >= len(self.teams):
+            return list(self.teams)
+        if not self.exponent:
+            return self.rng.sample(self.teams, k)
+        chosen = set()
+        while len(chosen) < k:
+            chosen.update(self.rng.choices(
+                range(len(self.teams)), cum_weights=self.cum_weights,
+                k=k - len(chosen)))
+        return [self.teams[i] for i in sorted(chosen)]
+
+
+def seed_dataset(
+        organizations=10, teams_per_organization=20, users=2000,
+        teams_per_user=3, permissions_per_team=5, team_size_exponent=0,
+        shared_users=1.0, admin_teams=0.1, seed=0, batch_size=1000,
+        progress=None):
+    '''Creates a synthetic dataset with bulk_create, and returns a Dataset
+    of the created ids. The same seed always creates the same dataset.
+
+    Each user is a member of teams_per_user teams, picked with a
+    TeamSampler with team_size_exponent, and of the organizations of those
+    teams. A shared_users fraction of the users are picked from the teams of
+    all organizations, and the rest from the teams of one organization. An
+    admin_teams fraction of the teams have team:admin for themselves, and
+    the other permissions are in app namespaces. Tokens are created for an
+    admin and for a member, with the role as the key.
+
+    Users and their memberships are created batch_size users at a time, and
+    progress, if given, is called with the number of users created after
+    each batch.'''
+    rng = random.Random(seed)
+
+    orgs = SeedOrganization.objects.bulk_create([
+        SeedOrganization(title='Organization %d' % i)
+        for i in range(organizations)])
+    teams = SeedTeam.objects.bulk_create([
+        SeedTeam(title='Team %d.%d' % (o, i), organization=org)
+        for o, org in enumerate(orgs)
+        for i in range(teams_per_organization)], batch_size=batch_size)
+
+    permissions = []
+    team_permissions = []
+    for team in teams:
+        team_perms = [
+            SeedPermission(
+                type='app:%s' % rng.choice(('read', 'write', 'admin')),
+                object_id=str(rng.randint(1, 1000)),
+                namespace='app%d' % rng.randint(1, 5))
+            for _ in range(permissions_per_team)]
+        if rng.random() < admin_teams:
+            team_perms.append(SeedPermission(
+                type='team:admin', object_id=str(team.pk),
+                namespace=settings.PERMISSION_NAMESPACE))
+        permissions.extend(team_perms)
+        team_permissions.append((team, team_perms))
+    SeedPermission.objects.bulk_create(permissions, batch_size=batch_size)
+    TeamPermission = SeedTeam.permissions.through
+    insert_rows(TeamPermission, ('seedteam', 'seedpermission'), [
+        (team.pk, p.pk) for team, perms in team_permissions for p in perms],
+        batch_size)
+
+    shared_sampler = TeamSampler(rng, teams, team_size_exponent)
+    org_samplers = [
+        TeamSampler(rng, [t for t in teams if t.organization_id == org.pk],
+                    team_size_exponent)
+        for org in orgs]
+    # Hashing each password would take longer than the rest of the seeding
+    password = make_password(PASSWORD)
+    TeamUser = SeedTeam.users.through
+    OrgUser = SeedOrganization.users.through
+    user_ids = []
+    for offset in range(0, users, batch_size):
+        user_objs = User.objects.bulk_create([
+            User(
+                username='user%d@example.org' % i,
+                email='user%d@example.org' % i, password=password)
+            for i in range(offset, min(offset + batch_size, users))])
+        team_users = []
+        org_users = []
+        for user in user_objs:
+            if rng.random() < shared_users:
+                sampler = shared_sampler
+            else:
+                sampler = rng.choice(org_samplers)
+            user_org_ids = set()
+            for team in sampler.sample(teams_per_user):
+                team_users.append((team.pk, user.pk))
+                user_org_ids.add(team.organization_id)
+            org_users.extend((o, user.pk) for o in sorted(user_org_ids))
+        insert_rows(TeamUser, ('seedteam', 'user'), team_users, batch_size)
+        insert_rows(
+            OrgUser, ('seedorganization', 'user'), org_users, batch_size)
+        user_ids.extend(u.pk for u in user_objs)
+        if progress is not None:
+            progress(len(user_ids))
+    UserEffectivePermission.objects.add(team_ids=[t.pk for t in teams])
+
+    admin = User.objects.create_superuser(
+        'admin@example.org', 'admin@example.org', PASSWORD)
+    # A separate user logs in, because that replaces the user's token
+    login = User.objects.create_user(
+        'login@example.org', 'login@example.org', PASSWORD)
+    spare_users = User.objects.bulk_create([
+        User(
+            username='spare%d@example.org' % i,
+            email='spare%d@example.org' % i, password=password)
+        for i in range(SPARE_USERS)])
+    member = User.objects.get(pk=user_ids[0]) if user_ids else login
+    tokens = {
+        'admin': Token.objects.create(user=admin).key,
+        'member': Token.objects.create(user=member).key,
+    }
+    return Dataset(
+        organization_ids=[o.pk for o in orgs],
+        team_ids=[t.pk for t in teams],
+        user_ids=user_ids,
+        permission_ids=[p.pk for p in permissions],
+        tokens=tokens, login=login.email,
+        spare_user_ids=[u.pk for u in spare_users])
+
+
+def undo_request(method, path, data=None):
+    '''Returns an undo function that makes a request, like the inverse
+    request of a pair.'''
+    def undo(driver, token):
+        driver.request(method, path, data, token)
+    return undo
+
+
+def undo_create(model, **filters):
+    '''Returns an undo function that deletes the created objects.'''
+    def undo(driver, token):
+        model.objects.filter(**filters).delete()
+    return undo
+
+
+def undo_update(model, pk, **values):
+    '''Returns an undo function that sets the values of the object again,
+    like un-archiving it.'''
+    def undo(driver, token):
+        obj = model.objects.get(pk=pk)
+        for name, value in values.items():
+            setattr(obj, name, value)
+        obj.save()
+    return undo
+
+
+def undo_delete_permissions(team_id, permissions):
+    '''Returns an undo function that creates the deleted permissions again,
+    with the same ids, and adds them to the team.'''
+    def undo(driver, token):
+        existing = set(SeedPermission.objects.filter(
+            pk__in=[p.pk for p in permissions]).values_list('pk', flat=True))
+        for permission in permissions:
+            if permission.pk not in existing:
+                permission.save(force_insert=True)
+        SeedTeam.objects.get(pk=team_id).permissions.add(*permissions)
+    return undo
+
+
+def get_team_endpoints(prefix, path, team, permissions, spares):
+    '''Returns the Endpoints of the users and permissions of the team, with
+    the given name prefix, through the team route at path.'''
+    spare = spares['users'][0]
+    return [
+        Endpoint(
+            '%s-users-add' % prefix, 'admin', 'PUT',
+            '%susers/%d/' % (path, spare), None,
+            undo_request('DELETE', '%susers/%d/' % (path, spare))),
+        Endpoint(
+            '%s-users-remove' % prefix, 'admin', 'DELETE',
+            '%susers/%d/' % (path, spare), None,
+            undo_request('PUT', '%susers/%d/' % (path, spare))),
+        Endpoint(
+            '%s-users-bulk-add' % prefix, 'admin', 'POST',
+            path + 'users/add/', spares,
+            undo_request('POST', path + 'users/remove/', spares)),
+        Endpoint(
+            '%s-users-bulk-remove' % prefix, 'admin', 'POST',
+            path + 'users/remove/', spares,
+            undo_request('POST', path + 'users/add/', spares)),
+        Endpoint(
+            '%s-permissions-create' % prefix, 'admin', 'POST',
+            path + 'permissions/', NEW_PERMISSION,
+            undo_create(SeedPermission, namespace=CREATED_NAMESPACE)),
+        Endpoint(
+            '%s-permissions-delete' % prefix, 'admin', 'DELETE',
+            '%spermissions/%d/' % (path, permissions[0].pk), None,
+            undo_delete_permissions(team, permissions[:1])),
+        Endpoint(
+            '%s-permissions-bulk-add' % prefix, 'admin', 'POST',
+            path + 'permissions/add/',
+            {'permissions': [NEW_PERMISSION] * 3},
+            undo_create(SeedPermission, namespace=CREATED_NAMESPACE)),
+        Endpoint(
+            '%s-permissions-bulk-remove' % prefix, 'admin', 'POST',
+            path + 'permissions/remove/',
+            {'permissions': [p.pk for p in permissions]},
+            undo_delete_permissions(team, permissions)),
+    ]
+
+
+def get_endpoints(dataset):
+    '''Returns an Endpoint for each route and action in authapi.urls, using
+    objects from the dataset. Requests that change the data are undone
+    after each request, or change it in the same way each time.'''
+    org = dataset.organization_ids[0]
+    team = dataset.team_ids[0]
+    user = dataset.user_ids[0]
+    spare = dataset.spare_user_ids[0]
+    spares = {'users': dataset.spare_user_ids}
+    team_permissions = list(
+        SeedPermission.objects.filter(seedteam=team).order_by('pk'))
+    checks = {'permissions': [
+        {'type': 'app:read', 'object_id': str(i), 'namespace': 'app1'}
+        for i in range(1, 21)]}
+    org_path = '/organizations/%d/' % org
+    team_path = '/teams/%d/' % team
+    endpoints = [
+        Endpoint(
+            'organizations-list', 'admin', 'GET', '/organizations/', None),
+        Endpoint(
+            'organizations-create', 'admin', 'POST', '/organizations/',
+            {'title': CREATED_TITLE},
+            undo_create(SeedOrganization, title=CREATED_TITLE)),
+        Endpoint('organizations-detail', 'admin', 'GET', org_path, None),
+        Endpoint(
+            'organizations-update', 'admin', 'PUT', org_path,
+            {'title': CREATED_TITLE}),
+        Endpoint(
+            'organizations-partial-update', 'admin', 'PATCH', org_path,
+            {'title': CREATED_TITLE}),
+        Endpoint(
+            'organizations-delete', 'admin', 'DELETE', org_path, None,
+            undo_update(SeedOrganization, org, archived=False)),
+        Endpoint(
+            'organization-teams-list', 'admin', 'GET',
+            org_path + 'teams/', None),
+        Endpoint(
+            'organization-teams-create', 'admin', 'POST',
+            org_path + 'teams/', {'title': CREATED_TITLE},
+            undo_create(SeedTeam, title=CREATED_TITLE)),
+        Endpoint(
+            'organization-users-add', 'admin', 'PUT',
+            '%susers/%d/' % (org_path, spare), None,
+            undo_request('DELETE', '%susers/%d/' % (org_path, spare))),
+        Endpoint(
+            'organization-users-remove', 'admin', 'DELETE',
+            '%susers/%d/' % (org_path, spare), None,
+            undo_request('PUT', '%susers/%d/' % (org_path, spare))),
+        Endpoint(
+            'organization-users-bulk-add', 'admin', 'POST',
+            org_path + 'users/add/', spares,
+            undo_request('POST', org_path + 'users/remove/', spares)),
+        Endpoint(
+            'organization-users-bulk-remove', 'admin', 'POST',
+            org_path + 'users/remove/', spares,
+            undo_request('POST', org_path + 'users/add/', spares)),
+        Endpoint('teams-list', 'admin', 'GET', '/teams/', None),
+        Endpoint('teams-list-member', 'member', 'GET', '/teams/', None),
+        Endpoint(
+            'teams-list-cursor', 'admin', 'GET',
+            '/teams/?pagination=cursor', None),
+        Endpoint('teams-detail', 'admin', 'GET', team_path, None),
+        Endpoint(
+            'teams-update', 'admin', 'PUT', team_path,
+            {'title': CREATED_TITLE}),
+        Endpoint(
+            'teams-partial-update', 'admin', 'PATCH', team_path,
+            {'title': CREATED_TITLE}),
+        Endpoint(
+            'teams-delete', 'admin', 'DELETE', team_path, None,
+            undo_update(SeedTeam, team, archived=False)),
+    ]
+    endpoints.extend(get_team_endpoints(
+        'team', team_path, team, team_permissions, spares))
+    # The same views are nested under the team's organization
+    org_team_path = '%steams/%d/' % (org_path, team)
+    endpoints.extend([
+        Endpoint(
+            'organization-teams-detail', 'admin', 'GET', org_team_path,
+            None),
+        Endpoint(
+            'organization-teams-update', 'admin', 'PUT', org_team_path,
+            {'title': CREATED_TITLE}),
+        Endpoint(
+            'organization-teams-partial-update', 'admin', 'PATCH',
+            org_team_path, {'title': CREATED_TITLE}),
+        Endpoint(
+            'organization-teams-delete', 'admin', 'DELETE', org_team_path,
+            None, undo_update(SeedTeam, team, archived=False)),
+    ])
+    endpoints.extend(get_team_endpoints(
+        'organization-team', org_team_path, team, team_permissions, spares))
+    endpoints.extend([
+        Endpoint('users-list', 'admin', 'GET', '/users/', None),
+        Endpoint(
+            'users-create', 'admin', 'POST', '/users/',
+            {'email': CREATED_EMAIL, 'password': PASSWORD},
+            undo_create(User, username=CREATED_EMAIL)),
+        Endpoint('users-detail', 'admin', 'GET', '/users/%d/' % user, None),
+        Endpoint(
+            'users-update', 'admin', 'PUT', '/users/%d/' % spare,
+            {'email': 'spare0@example.org'}),
+        Endpoint(
+            'users-partial-update', 'admin', 'PATCH', '/users/%d/' % spare,
+            {'first_name': 'Spare'}),
+        Endpoint(
+            'users-delete', 'admin', 'DELETE', '/users/%d/' % spare, None,
+            undo_update(User, spare, is_active=True)),
+        Endpoint('user', 'member', 'GET', '/user/', None),
+        Endpoint(
+            'user-permissions-check', 'member', 'POST',
+            '/user/permissions/check/', checks),
+        Endpoint(
+            'user-tokens', None, 'POST', '/user/tokens/',
+            {'email': dataset.login, 'password': PASSWORD}),
+        Endpoint('changes', 'admin', 'GET', '/changes/?since=0', None),
+    ])
+    endpoints.extend(
+        Endpoint(
+            'export-%s' % name, 'admin', 'GET', '/export/%s/' % name, None)
+        for name in EXPORTS)
+    endpoints.append(Endpoint('metrics', None, 'GET', '/metrics', None))
+    return endpoints
+
+
+class WSGIDriver(object):
+    '''Makes requests to the WSGI application in this process, reading the
+    whole response, like a WSGI server would.'''
+    def __init__(self, application=None):
+        self.application = application or get_wsgi_application()
+
+    def request(self, method, path, data=None, token=None):
+        '''Returns the status code of the response.'''
+        path, _, query = path.partition('?')
+        body = b'' if data is None else json.dumps(data).encode('utf-8')
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': 'testserver',
+            'HTTP_ACCEPT': '*/*',
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': False,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        if token is not None:
+            environ['HTTP_AUTHORIZATION'] = 'Token ' + token
+        statuses = []
+
+        def start_response(status, headers, exc_info=None):
+            statuses.append(int(status.split(' ', 1)[0]))
+
+        result = self.application(environ, start_response)
+        try:
+            for _ in result:
+                pass
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return statuses[0]
+
+
+def percentile(values, p):
+    '''Returns the nearest-rank percentile of the sorted values.'''
+    if not values:
+        return None
+    rank = int(math.ceil(p / 100.0 * len(values)))
+    return values[max(rank, 1) - 1]
+
+
+def benchmark_endpoint(driver, endpoint, tokens, requests=100, warmup=10):
+    '''Makes warmup and then requests requests to the endpoint, and returns
+    the latency percentiles in milliseconds, throughput, query counts, and
+    response status counts.'''
+    token = tokens.get(endpoint.role)
+    if endpoint.undo is not None:
+        endpoint.undo(driver, token)
+    for _ in range(warmup):
+        driver.request(endpoint.method, endpoint.path, endpoint.data, token)
+        if endpoint.undo is not None:
+            endpoint.undo(driver, token)
+
+    latencies = []
+    queries = []
+    statuses = Counter()
+    for _ in range(requests):
+        with record_queries() as stats:
+            start = time.perf_counter()
+            status = driver.request(
+                endpoint.method, endpoint.path, endpoint.data, token)
+            latencies.append((time.perf_counter() - start) * 1000)
+        queries.append(stats.count)
+        statuses[status] += 1
+        if endpoint.undo is not None:
+            endpoint.undo(driver, token)
+    # Undoing the requests isn't included in the throughput
+    elapsed = sum(latencies) / 1000
+
+    latencies.sort()
+    return {
+        'name': endpoint.name,
+        'method': endpoint.method,
+        'path': endpoint.path,
+        'requests': requests,
+        'statuses': dict((str(s), c) for s, c in sorted(statuses.items())),
+        'latency_ms': {
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'mean': sum(latencies) / len(latencies) if latencies else None,
+            'max': latencies[-1] if latencies else None,
+        },
+        'throughput_rps': requests / elapsed if elapsed > 0 else None,
+        'queries': {
+            'mean': sum(queries) / len(queries) if queries else None,
+            'max': max(queries) if queries else None,
+        },
+    }
+
+
+def select_endpoints(dataset, names=None):
+    '''Returns the endpoints for the dataset, or only those with the given
+    names. Raises ValueError if any of the names are unknown.'''
+    endpoints = get_endpoints(dataset)
+    if names:
+        unknown = set(names) - set(e.name for e in endpoints)
+        if unknown:
+            raise ValueError(
+                'Unknown endpoints: %s' % ', '.join(sorted(unknown)))
+        endpoints = [e for e in endpoints if e.name in names]
+    return endpoints
+
+
+@contextmanager
+def persistent_connections():
+    '''Keeps database connections open between requests, as they are with
+    CONN_MAX_AGE, so that connecting to the database isn't measured.'''
+    request_started.disconnect(close_old_connections)
+    request_finished.disconnect(close_old_connections)
+    try:
+        yield
+    finally:
+        request_started.connect(close_old_connections)
+        request_finished.connect(close_old_connections)
+
+
+def run_benchmark(dataset, names=None, requests=100, warmup=10, driver=None):
+    '''Benchmarks each endpoint, or only those with the given names, and
+    returns a list of results.'''
+    driver = driver or WSGIDriver()
+    endpoints = select_endpoints(dataset, names)
+    with persistent_connections():
+        return [
+            benchmark_endpoint(
+                driver, endpoint, dataset.tokens, requests, warmup)
+            for endpoint in endpoints]
+
+
+def count_queries(dataset, names=None, driver=None):
+    '''Returns an OrderedDict of the number of queries made by a request to
+    each endpoint, or only to those with the given names. A request is made
+    to each endpoint first, so that caches are filled.'''
+    driver = driver or WSGIDriver()
+    counts = OrderedDict()
+    with persistent_connections():
+        for endpoint in select_endpoints(dataset, names):
+            token = dataset.tokens.get(endpoint.role)
+            if endpoint.undo is not None:
+                endpoint.undo(driver, token)
+            driver.request(
+                endpoint.method, endpoint.path, endpoint.data, token)
+            if endpoint.undo is not None:
+                endpoint.undo(driver, token)
+            with record_queries() as stats:
+                driver.request(
+                    endpoint.method, endpoint.path, endpoint.data, token)
+            counts[endpoint.name] = stats.count
+            if endpoint.undo is not None:
+                endpoint.undo(driver, token)
+    return counts
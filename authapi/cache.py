@@ -0,0 +1,257 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache as DjangoDummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from authapi.metrics import CACHE_LOOKUPS
+
+
+class BaseCache(object):
+    '''Base class for the caches used for the effective permissions of users,
+    and for authentication tokens. Keeps count of the hits and misses of the
+    cache.'''
+    # The setting that the cache is configured in, used to label its metrics
+    name = None
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        '''Returns the cached value for the key, or None if it is not
+        cached.'''
+        value = self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        CACHE_LOOKUPS.labels(
+            self.name, 'miss' if value is None else 'hit').inc()
+        return value
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def _get(self, key):
+        raise NotImplementedError()
+
+    def set(self, key, value):
+        raise NotImplementedError()
+
+    def delete_many(self, keys):
+        raise NotImplementedError()
+
+    def clear(self):
+        raise NotImplementedError()
+
+
+class DummyCache(BaseCache):
+    '''A cache that doesn't store anything. Values will be loaded from the
+    database on every request.'''
+    def _get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete_many(self, keys):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LocalMemoryCache(BaseCache):
+    '''A least recently used cache, stored in the memory of the current
+    process. It is only invalidated by changes made by the current process,
+    so entries expire after timeout seconds, to limit how long other
+    processes can return stale values.'''
+    def __init__(self, max_entries=10000, timeout=60):
+        if timeout is None:
+            raise ImproperlyConfigured(
+                'LocalMemoryCache needs a timeout, as it is not invalidated '
+                'by other processes')
+        super(LocalMemoryCache, self).__init__(timeout)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires = None
+        if self.timeout is not None:
+            expires = time.time() + self.timeout
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        stats = super(LocalMemoryCache, self).stats()
+        stats['size'] = len(self._entries)
+        return stats
+
+
+class SharedCache(BaseCache):
+    '''Stores the values in one of the caches configured in the CACHES
+    setting, so that the cache, and its invalidation, can be shared between
+    processes. The CACHES entry must be a backend that is shared between
+    processes, like memcached or the database.
+
+    Other keys may be stored in the same cache, so it can't be cleared.
+    Instead the keys include a generation number, which is also stored in the
+    cache, and clearing the cache increments it, so that none of the old keys
+    are used again. The old values expire after their timeout.'''
+    def __init__(
+            self, cache_alias='default', timeout=300,
+            key_prefix='authapi:permissions:'):
+        if timeout is None:
+            raise ImproperlyConfigured('SharedCache needs a timeout')
+        if not is_shared_cache(cache_alias):
+            raise ImproperlyConfigured(
+                'SharedCache needs a CACHES entry that is shared between '
+                'processes, but %r is stored in each process' % (
+                    cache_alias,))
+        super(SharedCache, self).__init__(timeout)
+        self.cache_alias = cache_alias
+        self.key_prefix = key_prefix
+        self.generation_key = '%sgeneration' % key_prefix
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def get_generation(self):
+        '''Returns the current generation. If it isn't in the cache, because
+        it was evicted or the cache was restarted, it is started from the
+        current time in milliseconds, which is later than any generation that
+        older values could have been stored with.'''
+        generation = self.cache.get(self.generation_key)
+        if generation is None:
+            generation = int(time.time() * 1000)
+            if not self.cache.add(self.generation_key, generation, None):
+                # Another process started it first
+                generation = self.cache.get(self.generation_key, generation)
+        return generation
+
+    def make_key(self, key, generation=None):
+        if generation is None:
+            generation = self.get_generation()
+        return '%s%s:%s' % (self.key_prefix, generation, key)
+
+    def _get(self, key):
+        return self.cache.get(self.make_key(key))
+
+    def set(self, key, value):
+        self.cache.set(self.make_key(key), value, self.timeout)
+
+    def delete_many(self, keys):
+        generation = self.get_generation()
+        self.cache.delete_many([self.make_key(k, generation) for k in keys])
+
+    def clear(self):
+        try:
+            self.cache.incr(self.generation_key)
+        except ValueError:
+            # The generation isn't in the cache, so there are no keys of the
+            # current generation yet
+            self.get_generation()
+
+
+def is_shared_cache(alias):
+    '''Returns whether the CACHES entry can be shared between processes.
+    The local memory and dummy backends are stored in each process, or not at
+    all.'''
+    return not isinstance(caches[alias], (LocMemCache, DjangoDummyCache))
+
+
+_caches = {}
+
+
+def get_cache(setting):
+    '''Returns the cache configured in the given setting.'''
+    if setting not in _caches:
+        config = getattr(settings, setting, {})
+        backend = import_string(config.get(
+            'BACKEND', 'authapi.cache.DummyCache'))
+        _caches[setting] = backend(**config.get('OPTIONS', {}))
+        _caches[setting].name = setting
+    return _caches[setting]
+
+
+def get_permission_cache():
+    '''Returns the permission cache configured in the PERMISSION_CACHE
+    setting.'''
+    return get_cache('PERMISSION_CACHE')
+
+
+def get_token_cache():
+    '''Returns the token cache configured in the TOKEN_CACHE setting.'''
+    return get_cache('TOKEN_CACHE')
+
+
+@receiver(setting_changed)
+def reset_cache(setting, **kwargs):
+    _caches.pop(setting, None)
+
+
+def invalidate_users(user_ids):
+    '''Removes the cached permissions for the given users.'''
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    cache = get_permission_cache()
+    cache.delete_many(user_ids)
+    # Requests that read the permissions before this transaction is committed
+    # could cache the old permissions, so we invalidate again after commit.
+    transaction.on_commit(lambda: cache.delete_many(user_ids))
+
+
+def invalidate_tokens(keys):
+    '''Removes the cached users for the given token keys.'''
+    cache = get_token_cache()
+    if isinstance(cache, DummyCache):
+        return
+    keys = [token_cache_key(k) for k in keys]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def token_cache_key(key):
+    '''Tokens are cached by a hash of their key, so that the keys aren't
+    stored in shared caches.'''
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
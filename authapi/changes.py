@@ -0,0 +1,56 @@
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from authapi.models import Change
+
+
+# The advisory lock that orders the commits of changes
+CHANGES_LOCK_ID = 0x5eedc4a9
+
+MEMBERSHIP = 'membership'
+PERMISSIONS = 'permissions'
+ARCHIVE = 'archive'
+USER = 'user'
+DEACTIVATION = 'deactivation'
+
+
+def record_changes(change_type, user_ids):
+    '''Records a change of the given type for each of the users, once the
+    current transaction is committed. Nothing is recorded if the transaction
+    is rolled back.'''
+    user_ids = sorted(set(user_ids))
+    if user_ids:
+        transaction.on_commit(lambda: create_changes(change_type, user_ids))
+
+
+def create_changes(change_type, user_ids):
+    '''Creates the changes in their own transaction. On Postgres, the
+    transaction holds an advisory lock until it is committed, so that
+    changes are committed in the order of their sequence numbers, and a
+    consumer can never see a change before one with a lower number has been
+    committed.'''
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT pg_advisory_xact_lock(%s)', [CHANGES_LOCK_ID])
+        Change.objects.bulk_create(
+            [Change(type=change_type, user_id=u) for u in user_ids],
+            batch_size=1000)
+
+
+def wait_for_changes(since, limit, wait):
+    '''Returns up to limit changes after the since sequence number. If there
+    are none, the database is polled every CHANGES['POLL_INTERVAL'] seconds
+    until there are, or until wait seconds have passed.'''
+    interval = settings.CHANGES['POLL_INTERVAL']
+    deadline = time.monotonic() + wait
+    while True:
+        changes = list(Change.objects.filter(id__gt=since).order_by('id')[
+            :limit])
+        remaining = deadline - time.monotonic()
+        if changes or remaining <= 0:
+            return changes
+        time.sleep(min(interval, remaining))
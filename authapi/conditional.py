@@ -0,0 +1,54 @@
+import hashlib
+from calendar import timegm
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+def make_etag(request, *parts):
+    '''Returns a weak ETag for a representation that is made from the given
+    parts. The host and the renderer are included, because representations
+    contain absolute URLs, and depend on the format.'''
+    key = repr((
+        request.build_absolute_uri('/'), request.accepted_renderer.format,
+        parts))
+    return 'W/"%s"' % hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(
+            timegm(last_modified.utctimetuple()))
+    return response
+
+
+def conditional_response(request, etag, last_modified, get_data):
+    '''Returns 304 Not Modified if If-None-Match matches the ETag, otherwise
+    calls get_data for the response data. Last-Modified is only informational,
+    because changes to memberships don't change updated_at, so
+    If-Modified-Since is not used.'''
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = Response(data=get_data())
+    return set_validators(response, etag, last_modified)
+
+
+class ConditionalRetrieveMixin(object):
+    '''Adds ETag and Last-Modified headers to retrieve responses. Views
+    implement get_etag_parts, to return everything that the representation
+    of the object depends on, using the data that get_object already
+    fetched, so that the serializer isn't run for 304 responses.'''
+    def get_etag_parts(self, obj):
+        raise NotImplementedError()
+
+    def get_last_modified(self, obj):
+        return getattr(obj, 'updated_at', None)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return conditional_response(
+            request, make_etag(request, *self.get_etag_parts(instance)),
+            self.get_last_modified(instance),
+            lambda: self.get_serializer(instance).data)
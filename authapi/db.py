@@ -0,0 +1,56 @@
+import json
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections, transaction
+
+
+class QueryStats(object):
+    '''A database execute wrapper that counts and times the queries.'''
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+@contextmanager
+def record_queries(stats=None):
+    '''Counts and times the queries made on every database connection in
+    the block, and yields the QueryStats.'''
+    stats = stats or QueryStats()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+        yield stats
+
+
+@contextmanager
+def rolled_back(using=None):
+    '''Runs the block in a transaction that is always rolled back.'''
+    with transaction.atomic(using=using):
+        yield
+        transaction.set_rollback(True, using=using)
+
+
+def explain(queryset, analyze=False):
+    '''Returns the PostgreSQL plan of the queryset, as the parsed output of
+    EXPLAIN (FORMAT JSON). If analyze is true, the query is run, and the plan
+    includes the actual times and row counts.'''
+    connection = connections[queryset.db]
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (%sFORMAT JSON) %s' % (
+            'ANALYZE, ' if analyze else '', sql), params)
+        [[result]] = cursor.fetchall()
+    # psycopg2 only parses the JSON if the json type is registered
+    if isinstance(result, str):
+        result = json.loads(result)
+    [result] = result
+    return result
@@ -0,0 +1,154 @@
+import csv
+import json
+from collections import OrderedDict
+from datetime import datetime
+from itertools import islice
+
+from django.contrib.auth.models import User
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from authapi.models import SeedOrganization, SeedTeam, UserEffectivePermission
+
+
+class Export(object):
+    '''A table that can be exported. columns is a list of (name, field)
+    tuples, for the name of each exported column and the queryset field that
+    it is read from. Columns listed in id_columns are exported as strings,
+    like they are in the API.'''
+    def __init__(self, get_queryset, columns, id_columns=()):
+        self.get_queryset = get_queryset
+        self.columns = columns
+        self.id_columns = id_columns
+
+    @property
+    def fields(self):
+        return [name for name, _ in self.columns]
+
+    def rows(self, chunk_size=2000):
+        '''Yields a tuple of values for each row. The rows are read with a
+        server side cursor where the database supports it, chunk_size rows
+        at a time, so that the whole table is never in memory.'''
+        ids = [name in self.id_columns for name, _ in self.columns]
+        queryset = self.get_queryset().values_list(
+            *[field for _, field in self.columns])
+        for row in queryset.iterator(chunk_size=chunk_size):
+            yield tuple(
+                export_value(value, is_id) for value, is_id in zip(row, ids))
+
+
+def export_value(value, is_id=False):
+    if value is None:
+        return None
+    if is_id:
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+EXPORTS = OrderedDict([
+    ('users', Export(
+        lambda: User.objects.order_by('id'), [
+            ('id', 'id'),
+            ('email', 'email'),
+            ('first_name', 'first_name'),
+            ('last_name', 'last_name'),
+            ('admin', 'is_superuser'),
+            ('active', 'is_active'),
+            ('date_joined', 'date_joined'),
+        ], id_columns=('id',))),
+    ('organizations', Export(
+        lambda: SeedOrganization.objects.order_by('id'), [
+            ('id', 'id'),
+            ('title', 'title'),
+            ('archived', 'archived'),
+            ('created_at', 'created_at'),
+            ('updated_at', 'updated_at'),
+        ], id_columns=('id',))),
+    ('teams', Export(
+        lambda: SeedTeam.objects.order_by('id'), [
+            ('id', 'id'),
+            ('title', 'title'),
+            ('organization', 'organization_id'),
+            ('archived', 'archived'),
+            ('created_at', 'created_at'),
+            ('updated_at', 'updated_at'),
+        ], id_columns=('id', 'organization'))),
+    # A user can have the same permission through more than one team, but
+    # only the effective permissions are exported.
+    ('permissions', Export(
+        lambda: UserEffectivePermission.objects.order_by(
+            'user_id', 'permission_id').distinct(), [
+            ('user', 'user_id'),
+            ('id', 'permission_id'),
+            ('type', 'permission__type'),
+            ('object_id', 'permission__object_id'),
+            ('namespace', 'permission__namespace'),
+        ], id_columns=('user', 'id'))),
+])
+
+
+def ndjson_lines(fields, rows):
+    for row in rows:
+        yield json.dumps(
+            OrderedDict(zip(fields, row)), separators=(',', ':')) + '\n'
+
+
+class Echo(object):
+    '''A file-like object that returns what is written to it, so that the
+    csv writer can be used to format single lines.'''
+    def write(self, value):
+        return value
+
+
+def csv_lines(fields, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+FORMATS = OrderedDict([
+    ('ndjson', ndjson_lines),
+    ('csv', csv_lines),
+])
+
+
+def stream_export(name, fmt, chunk_size=2000, lines_per_chunk=100):
+    '''Yields the export with the given name, in the given format, as strings
+    of lines_per_chunk lines each.'''
+    export = EXPORTS[name]
+    lines = FORMATS[fmt](export.fields, export.rows(chunk_size))
+    while True:
+        chunk = ''.join(islice(lines, lines_per_chunk))
+        if not chunk:
+            break
+        yield chunk
+
+
+class NDJSONRenderer(JSONRenderer):
+    '''Used to select the ndjson format for exports. Responses that aren't
+    streamed, like errors, are rendered as a single line of JSON.'''
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        content = super(NDJSONRenderer, self).render(
+            data, accepted_media_type, renderer_context)
+        return content + b'\n' if content else content
+
+
+class CSVRenderer(BaseRenderer):
+    '''Used to select the CSV format for exports. Responses that aren't
+    streamed, like errors, are rendered as a header and a single row.'''
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, dict):
+            return b''
+        writer = csv.writer(Echo())
+        return (
+            writer.writerow(data.keys()) +
+            writer.writerow(data.values())).encode(self.charset)
@@ -0,0 +1,184 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import (
+    DEFAULT_DB_ALIAS, OperationalError, connections, transaction)
+from django.dispatch import receiver
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from authapi.metrics import HASHING_DURATION, HASHING_REJECTIONS
+
+
+# The advisory locks of the slots for running and waiting hashes. The slot
+# number is the second key of each lock.
+HASHING_LOCK_ID = 0x5eedc4aa
+HASHING_QUEUE_LOCK_ID = 0x5eedc4ab
+
+# The SQLSTATE of an error caused by lock_timeout
+LOCK_NOT_AVAILABLE = '55P03'
+
+
+class HashingPoolSaturated(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many login requests, please try again later.'
+    default_code = 'hashing_pool_saturated'
+    # Used by the exception handler for the Retry-After header
+    wait = 1
+
+
+class LocalSlots(object):
+    '''A number of slots shared by the threads of this process.'''
+    def __init__(self, count):
+        self._semaphore = threading.BoundedSemaphore(count) if count else None
+
+    def try_acquire(self):
+        '''Takes a free slot and returns it, or returns None if there are no
+        free slots.'''
+        if self._semaphore and self._semaphore.acquire(blocking=False):
+            return True
+        return None
+
+    def acquire(self, hint, timeout):
+        '''Waits for up to timeout seconds for a slot, and returns it, or
+        None if the wait timed out.'''
+        if self._semaphore and self._semaphore.acquire(timeout=timeout):
+            return True
+        return None
+
+    def release(self, slot):
+        self._semaphore.release()
+
+
+class AdvisoryLockSlots(object):
+    '''A number of slots shared by all of the processes that use the
+    database. Each slot is a PostgreSQL session advisory lock, which is
+    released if the process dies and its connection is closed.'''
+    def __init__(self, lock_id, count, using=DEFAULT_DB_ALIAS):
+        self.lock_id = lock_id
+        self.count = count
+        self.using = using
+        # CASE evaluates its conditions in order, so this takes the first
+        # free slot, and only that one, in a single query.
+        self.try_acquire_sql = 'SELECT CASE %s END' % ' '.join(
+            'WHEN pg_try_advisory_lock(%d, %d) THEN %d' % (
+                lock_id, slot, slot)
+            for slot in range(count))
+
+    def try_acquire(self):
+        '''Takes a free slot and returns it, or returns None if there are no
+        free slots.'''
+        if not self.count:
+            return None
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(self.try_acquire_sql)
+            return cursor.fetchone()[0]
+
+    def acquire(self, hint, timeout):
+        '''Waits for up to timeout seconds for the slot numbered hint, modulo
+        the number of slots, and returns it, or None if the wait timed out.
+
+        PostgreSQL wakes the waiters for a lock when it is released, so there
+        is no polling. lock_timeout is set in a transaction, or a savepoint
+        when there already is one, so that it doesn't outlast the wait, and
+        so that a timeout doesn't break the request's transaction.'''
+        if not self.count:
+            return None
+        slot = hint % self.count
+        try:
+            with transaction.atomic(using=self.using):
+                with connections[self.using].cursor() as cursor:
+                    cursor.execute(
+                        'SET LOCAL lock_timeout = %s',
+                        ['%dms' % max(1, timeout * 1000)])
+                    cursor.execute(
+                        'SELECT pg_advisory_lock(%s, %s)',
+                        [self.lock_id, slot])
+                    cursor.execute('SET LOCAL lock_timeout TO DEFAULT')
+        except OperationalError as e:
+            if getattr(e.__cause__, 'pgcode', None) == LOCK_NOT_AVAILABLE:
+                return None
+            raise
+        return slot
+
+    def release(self, slot):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_advisory_unlock(%s, %s)', [self.lock_id, slot])
+
+
+class HashingPool(object):
+    '''Limits the number of passwords hashed at once, so that a burst of
+    logins cannot use all of the CPU, or all of the request workers. At most
+    max_workers hashes run at once, and max_queue wait for up to timeout
+    seconds for one to finish. If the queue is full, or the wait times out,
+    HashingPoolSaturated is raised.
+
+    With PostgreSQL, the limits are for all of the processes that use the
+    database, so that they hold with any number of single threaded workers.
+    Otherwise they are for each process.'''
+    def __init__(self, max_workers=2, max_queue=8, timeout=5,
+                 using=DEFAULT_DB_ALIAS):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        if connections[using].vendor == 'postgresql':
+            self._running = AdvisoryLockSlots(
+                HASHING_LOCK_ID, max_workers, using)
+            self._waiting = AdvisoryLockSlots(
+                HASHING_QUEUE_LOCK_ID, max_queue, using)
+        else:
+            self._running = LocalSlots(max_workers)
+            self._waiting = LocalSlots(max_queue)
+
+    def _wait_for_slot(self):
+        '''Waits in the queue for a running slot, and returns it.'''
+        waiting = self._waiting.try_acquire()
+        if waiting is None:
+            raise HashingPoolSaturated()
+        try:
+            # Spread the waiters over the running slots
+            slot = self._running.acquire(waiting, self.timeout)
+        finally:
+            self._waiting.release(waiting)
+        if slot is None:
+            raise HashingPoolSaturated()
+        return slot
+
+    def run(self, fn, *args, **kwargs):
+        '''Runs fn with args and kwargs when there is a free slot, and returns
+        the result.'''
+        start = time.perf_counter()
+        slot = self._running.try_acquire()
+        if slot is None:
+            try:
+                slot = self._wait_for_slot()
+            except HashingPoolSaturated:
+                HASHING_REJECTIONS.inc()
+                raise
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            self._running.release(slot)
+        HASHING_DURATION.observe(time.perf_counter() - start)
+        return result
+
+
+_hashing_pool = None
+
+
+def get_hashing_pool():
+    '''Returns the pool configured in the HASHING_POOL setting.'''
+    global _hashing_pool
+    if _hashing_pool is None:
+        _hashing_pool = HashingPool(**getattr(settings, 'HASHING_POOL', {}))
+    return _hashing_pool
+
+
+@receiver(setting_changed)
+def reset_hashing_pool(setting, **kwargs):
+    global _hashing_pool
+    if setting == 'HASHING_POOL':
+        _hashing_pool = None
@@ -0,0 +1,224 @@
+import json
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import DataError, IntegrityError, transaction
+
+from authapi.models import (
+    SeedOrganization, SeedPermission, SeedTeam, UserEffectivePermission)
+
+
+# The default of fields that must be given
+REQUIRED = object()
+
+# Records can refer to earlier records by their id, as a string or a number
+REF = (str, int)
+
+TYPE_NAMES = {
+    bool: 'true or false',
+    dict: 'an object',
+    int: 'a number',
+    list: 'a list',
+    str: 'a string',
+}
+
+
+class ImportDataError(Exception):
+    def __init__(self, line, message):
+        self.line = line
+        self.message = message
+        super(ImportDataError, self).__init__(
+            'Line %d: %s' % (line, message))
+
+
+class Importer(object):
+    '''Imports records from lines of NDJSON. Each record has a model, which is
+    one of organization, team, user, or permission, and an optional id that
+    later records can use to refer to it.
+
+    Consecutive records of the same model are created together, batch_size
+    at a time, with bulk_create. Each batch is created in its own
+    transaction. If executor is given, passwords are hashed with it, so that
+    hashing can be done in other processes.'''
+    models = ('organization', 'team', 'user', 'permission')
+
+    def __init__(self, batch_size=1000, executor=None, progress=None):
+        self.batch_size = batch_size
+        self.executor = executor
+        self.progress = progress
+        self.refs = dict((model, {}) for model in self.models)
+        self.counts = dict.fromkeys(self.models, 0)
+
+    def run(self, lines):
+        '''Imports all the records in lines. Raises ImportDataError for the
+        first invalid record, after the batches before it are created.'''
+        batch = []
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise ImportDataError(number, 'Invalid JSON')
+            model = record.get('model') if isinstance(record, dict) else None
+            if model not in self.models:
+                raise ImportDataError(
+                    number, 'model must be one of [%s]' % ', '.join(
+                        sorted(self.models)))
+            if batch and (
+                    batch[0][1]['model'] != model or
+                    len(batch) >= self.batch_size):
+                self.create(batch)
+                batch = []
+            batch.append((number, record))
+        if batch:
+            self.create(batch)
+        return self.counts
+
+    def create(self, batch):
+        model = batch[0][1]['model']
+        try:
+            with transaction.atomic():
+                objs = getattr(self, 'create_%ss' % model)(batch)
+        except (DataError, IntegrityError) as e:
+            raise ImportDataError(
+                batch[0][0], 'Could not create the %ss up to line %d: %s' % (
+                    model, batch[-1][0], str(e).strip()))
+        for (_, record), obj in zip(batch, objs):
+            if record.get('id') is not None:
+                self.refs[model][str(record['id'])] = obj.pk
+        self.counts[model] += len(objs)
+        if self.progress is not None:
+            self.progress(model, len(objs), batch[-1][0])
+
+    def get(self, line, record, field, types=str, default=REQUIRED):
+        '''Returns the value of the field, which must be one of types. If
+        the field is missing or null, default is returned, or an error is
+        raised if there is no default.'''
+        value = record.get(field)
+        if value is None:
+            if default is REQUIRED:
+                raise ImportDataError(line, '%s is required' % field)
+            return default
+        if not isinstance(types, tuple):
+            types = (types,)
+        # bool is a subclass of int, but true isn't a valid number here
+        if not isinstance(value, types) or (
+                isinstance(value, bool) and bool not in types):
+            raise ImportDataError(line, '%s must be %s' % (
+                field, ' or '.join(TYPE_NAMES[t] for t in types)))
+        return value
+
+    def get_refs(self, line, record, field, model):
+        '''Returns the database ids of the list of references in the
+        field.'''
+        return [
+            self.resolve(line, model, ref)
+            for ref in self.get(line, record, field, list, [])]
+
+    def resolve(self, line, model, ref):
+        '''Returns the database id of the record with the given id.'''
+        try:
+            return self.refs[model][str(ref)]
+        except KeyError:
+            raise ImportDataError(
+                line, 'Unknown %s %s, it must be before this line' % (
+                    model, ref))
+
+    def hash_passwords(self, passwords):
+        if self.executor is None:
+            return [make_password(p) for p in passwords]
+        return list(self.executor.map(
+            make_password, passwords, chunksize=max(1, len(passwords) // 16)))
+
+    def create_organizations(self, batch):
+        return SeedOrganization.objects.bulk_create([
+            SeedOrganization(
+                title=self.get(line, r, 'title'),
+                archived=self.get(line, r, 'archived', bool, False))
+            for line, r in batch])
+
+    def create_teams(self, batch):
+        return SeedTeam.objects.bulk_create([
+            SeedTeam(
+                title=self.get(line, r, 'title'),
+                organization_id=self.resolve(
+                    line, 'organization',
+                    self.get(line, r, 'organization', REF)),
+                archived=self.get(line, r, 'archived', bool, False))
+            for line, r in batch])
+
+    def create_users(self, batch):
+        '''Users can list the organizations and teams that they are a member
+        of. Passwords are hashed after the batch is validated.'''
+        users = []
+        org_users = []
+        team_users = []
+        for line, r in batch:
+            email = self.get(line, r, 'email')
+            admin = self.get(line, r, 'admin', bool, False)
+            users.append(User(
+                username=email, email=email,
+                first_name=self.get(line, r, 'first_name', str, ''),
+                last_name=self.get(line, r, 'last_name', str, ''),
+                is_active=self.get(line, r, 'active', bool, True),
+                is_staff=admin, is_superuser=admin))
+            org_users.append(
+                self.get_refs(line, r, 'organizations', 'organization'))
+            team_users.append(self.get_refs(line, r, 'teams', 'team'))
+
+        passwords = self.hash_passwords([
+            self.get(line, r, 'password', str, None) for line, r in batch])
+        for user, password in zip(users, passwords):
+            user.password = password
+        User.objects.bulk_create(users)
+
+        OrgUser = SeedOrganization.users.through
+        OrgUser.objects.bulk_create([
+            OrgUser(seedorganization_id=org_id, user_id=user.pk)
+            for user, org_ids in zip(users, org_users)
+            for org_id in set(org_ids)])
+        TeamUser = SeedTeam.users.through
+        team_rows = [
+            TeamUser(seedteam_id=team_id, user_id=user.pk)
+            for user, team_ids in zip(users, team_users)
+            for team_id in set(team_ids)]
+        if team_rows:
+            TeamUser.objects.bulk_create(team_rows)
+            # bulk_create doesn't send m2m_changed
+            UserEffectivePermission.objects.add(
+                user_ids=set(row.user_id for row in team_rows))
+        return users
+
+    def create_permissions(self, batch):
+        '''Each permission belongs to a team. The object id can be given
+        directly with object_id, or with object as a reference to an
+        imported organization or team, like {"model": "team", "id": "1"}.'''
+        permissions = []
+        team_ids = []
+        for line, r in batch:
+            obj = self.get(line, r, 'object', dict, None)
+            if obj is not None:
+                if obj.get('model') not in ('organization', 'team'):
+                    raise ImportDataError(
+                        line, 'object must refer to an organization or team')
+                object_id = str(self.resolve(
+                    line, obj['model'], self.get(line, obj, 'id', REF)))
+            else:
+                object_id = self.get(line, r, 'object_id', REF, None)
+                if object_id is not None:
+                    object_id = str(object_id)
+            permissions.append(SeedPermission(
+                type=self.get(line, r, 'type'), object_id=object_id,
+                namespace=self.get(line, r, 'namespace')))
+            team_ids.append(
+                self.resolve(line, 'team', self.get(line, r, 'team', REF)))
+        SeedPermission.objects.bulk_create(permissions)
+
+        TeamPermission = SeedTeam.permissions.through
+        TeamPermission.objects.bulk_create([
+            TeamPermission(seedteam_id=team_id, seedpermission_id=p.pk)
+            for p, team_id in zip(permissions, team_ids)])
+        UserEffectivePermission.objects.add(
+            permission_ids=[p.pk for p in permissions])
+        return permissions
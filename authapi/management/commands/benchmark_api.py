@@ -0,0 +1,87 @@
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+
+from authapi.benchmark import run_benchmark, seed_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates a test database with a synthetic dataset, benchmarks each '
+        'API endpoint through the WSGI application, and writes the results '
+        'as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organizations', type=int, default=10)
+        parser.add_argument('--teams-per-organization', type=int, default=20)
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--teams-per-user', type=int, default=3)
+        parser.add_argument('--permissions-per-team', type=int, default=5)
+        parser.add_argument(
+            '--team-size-exponent', type=float, default=0,
+            help='The exponent of the power law of team sizes.')
+        parser.add_argument(
+            '--shared-users', type=float, default=1.0,
+            help='The fraction of users whose teams can be in any '
+                 'organization.')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='The random seed for the dataset.')
+        parser.add_argument(
+            '--requests', type=int, default=100,
+            help='The number of requests to time for each endpoint.')
+        parser.add_argument(
+            '--warmup', type=int, default=10,
+            help='The number of requests to make to each endpoint before '
+                 'timing.')
+        parser.add_argument(
+            '--endpoint', action='append', dest='endpoints',
+            help='Only benchmark the endpoint with this name. Can be given '
+                 'more than once.')
+        parser.add_argument(
+            '--output', default='-',
+            help='The file to write the results to. Defaults to stdout.')
+
+    def handle(self, *args, **options):
+        for option in ('organizations', 'teams_per_organization', 'users'):
+            if options[option] < 1:
+                raise CommandError('--%s must be at least 1' % (
+                    option.replace('_', '-')))
+
+        verbosity = options['verbosity']
+        old_config = setup_databases(verbosity - 1, interactive=False)
+        try:
+            dataset_options = dict(
+                (k, options[k]) for k in (
+                    'organizations', 'teams_per_organization', 'users',
+                    'teams_per_user', 'permissions_per_team',
+                    'team_size_exponent', 'shared_users', 'seed'))
+            dataset = seed_dataset(**dataset_options)
+            try:
+                results = run_benchmark(
+                    dataset, options['endpoints'], options['requests'],
+                    options['warmup'])
+            except ValueError as e:
+                raise CommandError(str(e))
+        finally:
+            connection.close()
+            teardown_databases(old_config, verbosity - 1)
+
+        output = json.dumps({
+            'dataset': dataset_options,
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'endpoints': results,
+        }, indent=2, sort_keys=True)
+        if options['output'] == '-':
+            self.stdout.write(output)
+        else:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from authapi.webhooks import WebhookWorker
+
+
+class Command(BaseCommand):
+    help = (
+        'Delivers the changes in the change feed to the active webhooks, '
+        'until interrupted.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Deliver one batch to each webhook that is due, and exit.')
+        parser.add_argument(
+            '--poll-interval', type=float, default=1,
+            help='Seconds to wait when there is nothing to deliver.')
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='The number of deliveries to make at the same time.')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='The maximum number of changes in each delivery.')
+        parser.add_argument(
+            '--timeout', type=float, default=10,
+            help='Seconds to wait for each delivery.')
+        parser.add_argument(
+            '--max-backoff', type=float, default=300,
+            help='The maximum number of seconds between retries.')
+
+    def handle(self, *args, **options):
+        worker = WebhookWorker(
+            max_workers=options['workers'], batch_size=options['batch_size'],
+            timeout=options['timeout'], max_backoff=options['max_backoff'])
+        try:
+            if options['once']:
+                delivered = worker.run_once()
+                self.stdout.write('Made %d deliveries.' % delivered)
+            else:
+                worker.run_forever(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            worker.shutdown()
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from authapi.export import EXPORTS, FORMATS, stream_export
+
+
+class Command(BaseCommand):
+    help = (
+        'Exports users, organizations, teams, or the effective permissions of '
+        'users, as NDJSON or CSV.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=list(EXPORTS))
+        parser.add_argument(
+            '--format', choices=list(FORMATS), default='ndjson',
+            help='The output format. Defaults to ndjson.')
+        parser.add_argument(
+            '--output', default='-',
+            help='The file to write to. Defaults to stdout.')
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='The number of rows to read from the database at a time.')
+
+    def handle(self, *args, **options):
+        chunks = stream_export(
+            options['name'], options['format'], options['chunk_size'])
+        if options['output'] == '-':
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+            for chunk in chunks:
+                f.write(chunk)
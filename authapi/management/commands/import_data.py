@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+from concurrent import futures
+
+from django.core.management.base import BaseCommand, CommandError
+
+from authapi.importer import Importer, ImportDataError
+
+
+class Command(BaseCommand):
+    help = (
+        'Imports organizations, teams, users, and permissions from a file of '
+        'NDJSON records.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'input', help='The file to read from, or - for stdin.')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='The number of records to create in each transaction.')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='The number of processes to hash passwords in. 0 hashes '
+                 'them in this process. Defaults to the number of CPUs.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        if options['workers'] > 0:
+            executor = futures.ProcessPoolExecutor(options['workers'])
+        else:
+            executor = None
+
+        self.start = time.monotonic()
+        importer = self.importer = Importer(
+            batch_size=options['batch_size'], executor=executor,
+            progress=self.progress if options['verbosity'] > 1 else None)
+        try:
+            if options['input'] == '-':
+                importer.run(sys.stdin)
+            else:
+                with open(options['input'], encoding='utf-8') as f:
+                    importer.run(f)
+        except ImportDataError as e:
+            self.report(importer.counts)
+            raise CommandError(str(e))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        self.report(importer.counts)
+
+    def progress(self, model, count, line):
+        self.stdout.write('Line %d: created %d %ss (%.0f records/s)' % (
+            line, count, model, self.rate(sum(self.importer.counts.values()))))
+
+    def rate(self, count):
+        elapsed = time.monotonic() - self.start
+        return count / elapsed if elapsed > 0 else 0
+
+    def report(self, counts):
+        total = sum(counts.values())
+        self.stdout.write(
+            'Imported %d organizations, %d teams, %d users and %d '
+            'permissions in %.1fs (%.0f records/s).' % (
+                counts['organization'], counts['team'], counts['user'],
+                counts['permission'], time.monotonic() - self.start,
+                self.rate(total)))
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from authapi.webhooks import prune_changes
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes changes from the change feed that are older than --days, '
+        'and that have been sent to every active webhook.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=7,
+            help='The number of days of changes to keep. Defaults to 7.')
+
+    def handle(self, *args, **options):
+        if options['days'] < 0:
+            raise CommandError('--days must not be negative')
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted = prune_changes(cutoff)
+        self.stdout.write('Deleted %d changes.' % deleted)
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from authapi.cache import get_permission_cache
+from authapi.models import UserEffectivePermission
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds the table of effective user permissions from the team '
+        'memberships and permissions, or checks that it is consistent.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Only check that the table is consistent, and exit with an '
+                 'error if it is not.')
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            return self.verify()
+
+        with transaction.atomic():
+            UserEffectivePermission.objects.rebuild()
+        get_permission_cache().clear()
+        self.stdout.write('Rebuilt %d effective permissions.' % (
+            UserEffectivePermission.objects.count(),))
+
+    def verify(self):
+        missing, extra = UserEffectivePermission.objects.verify()
+        for team_id, user_id, permission_id in sorted(missing):
+            self.stdout.write(
+                'Missing: team %s, user %s, permission %s' % (
+                    team_id, user_id, permission_id))
+        for team_id, user_id, permission_id in sorted(extra):
+            self.stdout.write(
+                'Extra: team %s, user %s, permission %s' % (
+                    team_id, user_id, permission_id))
+        if missing or extra:
+            raise CommandError(
+                'Effective permissions are inconsistent: %d missing, %d '
+                'extra. Run without --verify to rebuild them.' % (
+                    len(missing), len(extra)))
+        self.stdout.write('Effective permissions are consistent.')
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from authapi.timing import SWITCH_KEY, switch
+
+
+class Command(BaseCommand):
+    help = (
+        'Turns the timing of requests on or off, for all processes that '
+        'share the cache, or shows whether it is on.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'state', nargs='?', choices=('on', 'off', 'default'),
+            help='Turn timing on or off, or back to the REQUEST_TIMING '
+                 'setting. Shows the current state if not given.')
+
+    def handle(self, *args, **options):
+        state = options['state']
+        try:
+            if state is not None:
+                switch.set({'on': True, 'off': False, 'default': None}[state])
+            cache = switch.cache
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+
+        value = None if cache is None else cache.get(SWITCH_KEY)
+        if value is None:
+            self.stdout.write('Request timing is %s (from the setting).' % (
+                'on' if settings.REQUEST_TIMING['ENABLED'] else 'off'))
+        else:
+            self.stdout.write('Request timing is %s.' % (
+                'on' if value else 'off'))
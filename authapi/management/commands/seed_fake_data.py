@@ -0,0 +1,103 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from authapi.benchmark import seed_dataset
+from authapi.cache import get_permission_cache
+from authapi.models import (
+    SeedOrganization, SeedTeam, UserEffectivePermission)
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates a synthetic dataset of organizations, teams, users, and '
+        'permissions in the database, for benchmarking.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organizations', type=int, default=10)
+        parser.add_argument('--teams-per-organization', type=int, default=20)
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--teams-per-user', type=int, default=3)
+        parser.add_argument('--permissions-per-team', type=int, default=5)
+        parser.add_argument(
+            '--team-size-exponent', type=float, default=0,
+            help='The exponent of the power law of team sizes. 0 gives teams '
+                 'of about the same size, and larger values give a few large '
+                 'teams and many small ones.')
+        parser.add_argument(
+            '--shared-users', type=float, default=1.0,
+            help='The fraction of users whose teams can be in any '
+                 'organization. The teams of the other users are all in one '
+                 'organization.')
+        parser.add_argument(
+            '--admin-teams', type=float, default=0.1,
+            help='The fraction of teams that have team:admin for themselves.')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='The random seed for the dataset.')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='The number of users to create at a time.')
+        parser.add_argument(
+            '--allow-non-debug', action='store_true',
+            help='Create the dataset even if DEBUG is off. The dataset has a '
+                 'superuser, and every user has the same known password, so '
+                 'this should never be used on a production database.')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['allow_non_debug']:
+            raise CommandError(
+                'DEBUG is off, so this might be a production database. The '
+                'dataset has a superuser with a known password. Use '
+                '--allow-non-debug to create it anyway.')
+        for option in (
+                'organizations', 'teams_per_organization', 'batch_size'):
+            if options[option] < 1:
+                raise CommandError('--%s must be at least 1' % (
+                    option.replace('_', '-')))
+        for option in ('shared_users', 'admin_teams'):
+            if not 0 <= options[option] <= 1:
+                raise CommandError('--%s must be between 0 and 1' % (
+                    option.replace('_', '-')))
+        if User.objects.filter(username='admin@example.org').exists():
+            raise CommandError(
+                'The database already has a synthetic dataset.')
+
+        self.start = time.monotonic()
+        self.verbosity = options['verbosity']
+        with transaction.atomic():
+            dataset = seed_dataset(
+                organizations=options['organizations'],
+                teams_per_organization=options['teams_per_organization'],
+                users=options['users'],
+                teams_per_user=options['teams_per_user'],
+                permissions_per_team=options['permissions_per_team'],
+                team_size_exponent=options['team_size_exponent'],
+                shared_users=options['shared_users'],
+                admin_teams=options['admin_teams'],
+                seed=options['seed'], batch_size=options['batch_size'],
+                progress=self.progress)
+        get_permission_cache().clear()
+
+        self.stdout.write(
+            'Created %d organizations, %d teams, %d users, %d permissions, '
+            '%d team memberships, %d organization memberships and %d '
+            'effective permissions in %.1fs.' % (
+                len(dataset.organization_ids), len(dataset.team_ids),
+                len(dataset.user_ids), len(dataset.permission_ids),
+                SeedTeam.users.through.objects.count(),
+                SeedOrganization.users.through.objects.count(),
+                UserEffectivePermission.objects.count(),
+                time.monotonic() - self.start))
+        self.stdout.write(
+            'The password of every user is "password". Admin token: %s, '
+            'member token: %s' % (
+                dataset.tokens['admin'], dataset.tokens['member']))
+
+    def progress(self, users):
+        if self.verbosity > 1:
+            self.stdout.write('Created %d users (%.1fs)' % (
+                users, time.monotonic() - self.start))
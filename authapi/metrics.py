@@ -0,0 +1,140 @@
+import hmac
+import os
+import time
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+    generate_latest, multiprocess)
+
+from authapi.db import record_queries
+
+
+# When this environment variable is set, as it must be for multiple worker
+# processes, each process writes its metrics to files in the directory, and
+# the metrics view adds up the metrics of all of the processes.
+MULTIPROC_DIR_ENV = 'prometheus_multiproc_dir'
+
+# Requests with any other method are labelled "other", so that clients can't
+# create any number of label values
+METHODS = frozenset([
+    'CONNECT', 'DELETE', 'GET', 'HEAD', 'OPTIONS', 'PATCH', 'POST', 'PUT',
+    'TRACE'])
+
+REQUEST_DURATION = Histogram(
+    'authapi_request_duration_seconds',
+    'Time taken to return a response, by route name.',
+    ['route', 'method'])
+REQUESTS = Counter(
+    'authapi_requests_total',
+    'Responses returned, by route name and status code.',
+    ['route', 'method', 'status'])
+REQUEST_QUERIES = Histogram(
+    'authapi_request_db_queries',
+    'Database queries made by a request, by route name.',
+    ['route'], buckets=(0, 1, 2, 3, 4, 5, 7, 10, 15, 20, 30, 50, 100))
+REQUEST_DB_DURATION = Histogram(
+    'authapi_request_db_duration_seconds',
+    'Time taken by the database queries of a request, by route name.',
+    ['route'])
+DB_CONNECTIONS = Counter(
+    'authapi_db_connections_opened_total',
+    'Database connections opened, by database alias.',
+    ['alias'])
+CACHE_LOOKUPS = Counter(
+    'authapi_cache_lookups_total',
+    'Lookups in the permission and token caches, by whether they hit.',
+    ['cache', 'result'])
+TOKEN_LOOKUPS = Counter(
+    'authapi_token_lookups_total',
+    'Authentication token lookups, by whether the token was cached, found '
+    'in the database, or invalid.',
+    ['result'])
+HASHING_DURATION = Histogram(
+    'authapi_password_hashing_seconds',
+    'Time taken to hash a password in the hashing pool, including the time '
+    'waiting for a slot.',
+    buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10))
+HASHING_REJECTIONS = Counter(
+    'authapi_hashing_pool_rejections_total',
+    'Password hashes rejected because the hashing pool was saturated.')
+PAGE_SIZES = Histogram(
+    'authapi_page_size',
+    'Results returned in each page of a list, by route name and pagination '
+    'mode.',
+    ['route', 'mode'], buckets=(0, 1, 5, 10, 25, 50, 100, 250, 500, 1000))
+
+
+def get_route(request):
+    '''Returns the name of the route that the request matched, or
+    "unmatched".'''
+    match = getattr(request, 'resolver_match', None)
+    if match is None or not match.view_name:
+        return 'unmatched'
+    return match.view_name
+
+
+def get_method(request):
+    '''Returns the method of the request, or "other" if it isn't a standard
+    HTTP method.'''
+    if request.method in METHODS:
+        return request.method
+    return 'other'
+
+
+class MetricsMiddleware(object):
+    '''Records the duration, status, and database queries of each request,
+    labelled with the name of the route. The duration is the time taken to
+    return the response, so the body of a streaming response isn't
+    included.'''
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with record_queries() as queries:
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        route = get_route(request)
+        method = get_method(request)
+        REQUEST_DURATION.labels(route, method).observe(duration)
+        REQUESTS.labels(route, method, response.status_code).inc()
+        REQUEST_QUERIES.labels(route).observe(queries.count)
+        REQUEST_DB_DURATION.labels(route).observe(queries.duration)
+        return response
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    DB_CONNECTIONS.labels(connection.alias).inc()
+
+
+def get_registry():
+    '''Returns a registry of the metrics of all worker processes, if there
+    are multiple, or of this process.'''
+    if MULTIPROC_DIR_ENV in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def metrics_view(request):
+    '''Returns the metrics in the Prometheus text format. If the
+    METRICS['TOKEN'] setting is set, the request must have it as a bearer
+    token.'''
+    token = settings.METRICS['TOKEN']
+    if token:
+        authorization = request.META.get('HTTP_AUTHORIZATION', '')
+        if not hmac.compare_digest(
+                authorization.encode('utf-8'),
+                ('Bearer ' + token).encode('utf-8')):
+            response = HttpResponse(status=401)
+            response['WWW-Authenticate'] = 'Bearer'
+            return response
+    return HttpResponse(
+        generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
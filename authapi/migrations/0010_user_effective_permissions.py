@@ -0,0 +1,50 @@
+# Generated by Django 2.2.8 on 2026-10-17 04:39
+
+from itertools import islice
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_effective_permissions(apps, schema_editor):
+    SeedTeam = apps.get_model('authapi', 'SeedTeam')
+    UserEffectivePermission = apps.get_model(
+        'authapi', 'UserEffectivePermission')
+    rows = SeedTeam.objects.filter(
+        archived=False, organization__archived=False,
+        users__isnull=False, permissions__isnull=False).values_list(
+            'pk', 'users', 'permissions')
+    rows = rows.iterator()
+    while True:
+        batch = [
+            UserEffectivePermission(team_id=t, user_id=u, permission_id=p)
+            for t, u, p in islice(rows, 1000)]
+        if not batch:
+            break
+        UserEffectivePermission.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('authapi', '0009_auto_20160610_1530'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserEffectivePermission',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('permission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='authapi.SeedPermission')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='authapi.SeedTeam')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'permission', 'team')},
+            },
+        ),
+        migrations.RunPython(
+            populate_effective_permissions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 2.2.8 on 2026-10-17 04:41
+
+from django.db import migrations, models
+
+
+def trigram_available(schema_editor):
+    '''The pg_trgm extension is a contrib module, so it might not be
+    available on all PostgreSQL installations.'''
+    if schema_editor.connection.vendor != 'postgresql':
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def create_trigram_index(apps, schema_editor):
+    '''Index used for the permission_contains filter on teams, which does a
+    LIKE '%...%' query on the permission type.'''
+    if not trigram_available(schema_editor):
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS authapi_perm_type_trgm_idx ON '
+        'authapi_seedpermission USING gin (type gin_trgm_ops)')
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS authapi_perm_type_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authapi', '0010_user_effective_permissions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='seedorganization',
+            index=models.Index(
+                condition=models.Q(archived=False), fields=['id'],
+                name='authapi_org_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='seedpermission',
+            index=models.Index(
+                fields=['namespace', 'type', 'object_id'],
+                name='authapi_perm_lookup_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='seedteam',
+            index=models.Index(
+                condition=models.Q(archived=False),
+                fields=['organization', 'id'],
+                name='authapi_team_active_idx'),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
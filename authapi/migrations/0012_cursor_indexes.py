@@ -0,0 +1,30 @@
+# Generated by Django 2.2.8 on 2026-10-17 04:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('authapi', '0011_permission_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='seedorganization',
+            index=models.Index(
+                fields=['created_at', 'id'], name='authapi_org_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='seedteam',
+            index=models.Index(
+                fields=['created_at', 'id'], name='authapi_team_created_idx'),
+        ),
+        # The user model belongs to django.contrib.auth, so the index used
+        # for cursor pagination of users by date joined is created here.
+        migrations.RunSQL(
+            'CREATE INDEX authapi_user_joined_idx ON auth_user '
+            '(date_joined, id)',
+            'DROP INDEX authapi_user_joined_idx'),
+    ]
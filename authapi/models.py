@@ -1,5 +1,10 @@
+from collections import defaultdict
+from itertools import chain, islice
+
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, models
+from django.db.models.deletion import Collector
 
 
 class SeedOrganization(models.Model):
@@ -9,13 +14,58 @@ class SeedOrganization(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     archived = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['id'], condition=models.Q(archived=False),
+                name='authapi_org_active_idx'),
+            models.Index(
+                fields=['created_at', 'id'], name='authapi_org_created_idx'),
+        ]
+
     def get_active_teams(self):
+        '''Returns the teams that are not archived. Uses the active_teams
+        attribute instead, if they have been prefetched into it.'''
+        if hasattr(self, 'active_teams'):
+            return self.active_teams
         return self.seedteam_set.filter(archived=False)
 
     def get_active_users(self):
+        '''Returns the users that are active. Uses the active_users attribute
+        instead, if they have been prefetched into it.'''
+        if hasattr(self, 'active_users'):
+            return self.active_users
         return self.users.filter(is_active=True)
 
 
+class SeedPermissionQuerySet(models.QuerySet):
+    def delete(self):
+        '''Deletes the permissions, like QuerySet.delete. The pre_delete
+        signal needs the users affected by each permission, so they are found
+        here for all of the permissions at once, instead of in two queries
+        for each permission.'''
+        permissions = list(self)
+        team_ids = defaultdict(set)
+        for permission_id, team_id in SeedTeam.permissions.through.objects \
+                .filter(seedpermission__in=permissions) \
+                .values_list('seedpermission_id', 'seedteam_id'):
+            team_ids[permission_id].add(team_id)
+        user_ids = defaultdict(set)
+        for team_id, user_id in SeedTeam.users.through.objects.filter(
+                seedteam_id__in=set(chain(*team_ids.values()))).values_list(
+                    'seedteam_id', 'user_id'):
+            user_ids[team_id].add(user_id)
+        for permission in permissions:
+            permission._authapi_affected_users = set(chain(*(
+                user_ids[t] for t in team_ids[permission.pk])))
+
+        collector = Collector(using=self.db)
+        collector.collect(permissions)
+        deleted = collector.delete()
+        self._result_cache = None
+        return deleted
+
+
 class SeedPermission(models.Model):
     type = models.TextField()
     object_id = models.TextField(null=True)
@@ -23,6 +73,15 @@ class SeedPermission(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = SeedPermissionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['namespace', 'type', 'object_id'],
+                name='authapi_perm_lookup_idx'),
+        ]
+
 
 class SeedTeam(models.Model):
     title = models.TextField()
@@ -35,5 +94,172 @@ class SeedTeam(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     archived = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['organization', 'id'],
+                condition=models.Q(archived=False),
+                name='authapi_team_active_idx'),
+            models.Index(
+                fields=['created_at', 'id'], name='authapi_team_created_idx'),
+        ]
+
     def get_active_users(self):
+        '''Returns the users that are active. Uses the active_users attribute
+        instead, if they have been prefetched into it.'''
+        if hasattr(self, 'active_users'):
+            return self.active_users
         return self.users.filter(is_active=True)
+
+
+class UserEffectivePermissionManager(models.Manager):
+    batch_size = 1000
+
+    def get_effective_rows(
+            self, team_ids=None, user_ids=None, permission_ids=None):
+        '''Returns a list of (team_id, user_id, permission_id) tuples, for
+        each permission that a user has through an active team of an active
+        organization, optionally restricted to the given teams, users, and
+        permissions.'''
+        # The filters on users and permissions need to be in a single call to
+        # filter, so that they apply to the same joins as the values.
+        filters = {
+            'archived': False,
+            'organization__archived': False,
+            'users__isnull': False,
+            'permissions__isnull': False,
+        }
+        if team_ids is not None:
+            filters['pk__in'] = team_ids
+        if user_ids is not None:
+            filters['users__in'] = user_ids
+        if permission_ids is not None:
+            filters['permissions__in'] = permission_ids
+        return SeedTeam.objects.filter(**filters).values_list(
+            'pk', 'users', 'permissions')
+
+    def add(self, team_ids=None, user_ids=None, permission_ids=None):
+        '''Creates the rows for the given teams, users, and permissions,
+        ignoring rows that already exist.'''
+        rows = self.get_effective_rows(team_ids, user_ids, permission_ids)
+        if connections[self.db].vendor == 'postgresql':
+            self._insert_selected(rows)
+        else:
+            self._create_batched(rows)
+
+    def _insert_selected(self, rows):
+        '''Inserts the rows of the (team_id, user_id, permission_id) values
+        queryset in the database, with a single INSERT ... SELECT, ignoring
+        rows that already exist. This is much faster than fetching and
+        creating each of them, but needs PostgreSQL.'''
+        connection = connections[self.db]
+        try:
+            sql, params = rows.query.sql_with_params()
+        except EmptyResultSet:
+            return
+        columns = ', '.join(
+            connection.ops.quote_name(self.model._meta.get_field(f).column)
+            for f in ('team', 'user', 'permission'))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO %s (%s) %s ON CONFLICT DO NOTHING' % (
+                    connection.ops.quote_name(self.model._meta.db_table),
+                    columns, sql),
+                params)
+
+    def _create_batched(self, rows):
+        '''Fetches the rows of the (team_id, user_id, permission_id) values
+        queryset, and creates them batch_size at a time, ignoring rows that
+        already exist.'''
+        rows = rows.iterator()
+        while True:
+            batch = [
+                self.model(team_id=t, user_id=u, permission_id=p)
+                for t, u, p in islice(rows, self.batch_size)]
+            if not batch:
+                break
+            self.bulk_create(batch, ignore_conflicts=True)
+
+    def remove(self, team_ids=None, user_ids=None, permission_ids=None):
+        '''Deletes the rows for the given teams, users, and permissions.'''
+        rows = self.all()
+        if team_ids is not None:
+            rows = rows.filter(team_id__in=team_ids)
+        if user_ids is not None:
+            rows = rows.filter(user_id__in=user_ids)
+        if permission_ids is not None:
+            rows = rows.filter(permission_id__in=permission_ids)
+        rows.delete()
+
+    def refresh(self, team_ids):
+        '''Recreates all the rows for the given teams.'''
+        self.remove(team_ids=team_ids)
+        self.add(team_ids=team_ids)
+
+    def rebuild(self):
+        '''Recreates all the rows.'''
+        self.remove()
+        self.add()
+
+    def verify(self):
+        '''Returns a tuple of the sets of (team_id, user_id, permission_id)
+        rows that are missing from, and that shouldn't be in, the table.'''
+        expected = set(self.get_effective_rows().iterator())
+        actual = set(self.values_list(
+            'team_id', 'user_id', 'permission_id').iterator())
+        return expected - actual, actual - expected
+
+
+class UserEffectivePermission(models.Model):
+    '''A permission that a user has through a team. Rows only exist for
+    teams and organizations that are not archived. This is a denormalisation
+    of the team relations, kept up to date by authapi.signals, so that the
+    permissions of a user can be looked up by user id.'''
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    permission = models.ForeignKey(SeedPermission, on_delete=models.CASCADE)
+    team = models.ForeignKey(SeedTeam, on_delete=models.CASCADE)
+
+    objects = UserEffectivePermissionManager()
+
+    class Meta:
+        unique_together = ('user', 'permission', 'team')
+
+
+class ChangeManager(models.Manager):
+    def latest_seq(self):
+        '''Returns the sequence number of the latest change, or 0.'''
+        latest = self.order_by('-id').values_list('id', flat=True).first()
+        return latest or 0
+
+
+class Change(models.Model):
+    '''A change to the permissions or memberships of a user, recorded by
+    authapi.changes. The id is the sequence number of the change, and changes
+    are committed in sequence order, so that consumers can fetch the changes
+    after the last sequence number that they have seen.'''
+    id = models.BigAutoField(primary_key=True)
+    type = models.TextField()
+    # Not a foreign key, so that changes are kept for deleted users
+    user_id = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ChangeManager()
+
+
+class Webhook(models.Model):
+    '''A URL that the changes in the change feed are delivered to, by the
+    deliver_webhooks command. last_seq is the sequence number of the last
+    change that was delivered, and starts at the latest change when the
+    webhook is created.'''
+    url = models.URLField()
+    secret = models.TextField(blank=True)
+    active = models.BooleanField(default=True)
+    last_seq = models.BigIntegerField(blank=True)
+    failures = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def save(self, *args, **kwargs):
+        if self.last_seq is None:
+            self.last_seq = Change.objects.latest_seq()
+        return super(Webhook, self).save(*args, **kwargs)
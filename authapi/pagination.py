@@ -1,23 +1,175 @@
+import math
+
+from django.db import connections
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import (
+    BasePagination, CursorPagination, PageNumberPagination, _positive_int)
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from authapi.db import explain
+from authapi.metrics import PAGE_SIZES, get_route
 
 
 class PaginationSettings(object):
     page_size = 100
     page_size_query_param = 'page_size'
     max_page_size = 1000
+    estimate_query_param = 'estimate_count'
+    estimate_header = 'X-Estimated-Count'
+
+    def get_estimated_count(self, queryset, request):
+        '''If the estimate_count query parameter is true, returns the
+        planner's estimate of the number of results. This is only available
+        for PostgreSQL, and avoids counting the results.'''
+        value = request.query_params.get(self.estimate_query_param, 'false')
+        if value.lower() != 'true':
+            return None
+        return estimate_count(queryset)
+
+    def get_headers(self):
+        headers = {}
+        link = link_header(self.get_next_link(), self.get_previous_link())
+        if link is not None:
+            headers['Link'] = link
+        if self.estimated_count is not None:
+            headers[self.estimate_header] = str(self.estimated_count)
+        return headers
+
+    def get_paginated_response(self, data):
+        return Response(data, headers=self.get_headers())
 
 
 class LinkHeaderPagination(PaginationSettings, PageNumberPagination):
     '''
     Extends PageNumberPagination to include next and previous urls in response
-    using a 'Link' header
+    using a 'Link' header.
+
+    The results are not counted. Instead, one more result than the page size
+    is fetched, to find out whether there is a next page. Only the last page,
+    requested with one of last_page_strings as the page number, needs the
+    results to be counted.
+    '''
+
+    def get_page_number(self, request, queryset, page_size):
+        page_number = request.query_params.get(self.page_query_param, 1)
+        if page_number in self.last_page_strings:
+            return max(1, math.ceil(queryset.count() / page_size))
+        try:
+            return _positive_int(page_number, strict=True)
+        except ValueError:
+            raise NotFound(self.invalid_page_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        self.request = request
+        self.page_number = self.get_page_number(request, queryset, page_size)
+        self.estimated_count = self.get_estimated_count(queryset, request)
+
+        offset = (self.page_number - 1) * page_size
+        results = list(queryset[offset:offset + page_size + 1])
+        if not results and self.page_number != 1:
+            raise NotFound(self.invalid_page_message)
+
+        self.has_next = len(results) > page_size
+        return results[:page_size]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.page_number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(
+            url, self.page_query_param, self.page_number - 1)
+
+
+class CursorLinkHeaderPagination(PaginationSettings, CursorPagination):
+    '''
+    Extends CursorPagination to include next and previous urls in response
+    using a 'Link' header. Instead of counting and offsetting, each page seeks
+    from the position of the previous page, so every page takes the same
+    time to fetch.
+
+    The ordering is selected by name with the 'ordering' query parameter,
+    from the view's cursor_orderings, defaulting to the view's
+    cursor_ordering. The position is taken from the first field of the
+    ordering, with the remaining fields breaking ties, so the first field
+    should be nearly unique and indexed.
+    '''
+    ordering_query_param = 'ordering'
+    cursor_orderings = {
+        'id': ('id',),
+        'created_at': ('created_at', 'id'),
+    }
+    default_ordering = 'id'
+
+    def get_ordering(self, request, queryset, view):
+        orderings = getattr(view, 'cursor_orderings', self.cursor_orderings)
+        name = request.query_params.get(
+            self.ordering_query_param,
+            getattr(view, 'cursor_ordering', self.default_ordering))
+        if name in orderings:
+            return tuple(orderings[name])
+        valid = ', '.join(sorted(orderings))
+        raise ValidationError({
+            self.ordering_query_param: ['Must be one of [%s]' % valid],
+        })
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.estimated_count = self.get_estimated_count(queryset, request)
+        return super(CursorLinkHeaderPagination, self).paginate_queryset(
+            queryset, request, view)
+
+
+class SelectableLinkHeaderPagination(BasePagination):
+    '''
+    Uses either page number or cursor pagination. The mode can be selected
+    with the 'pagination' query parameter. If it isn't given, cursor
+    pagination is used if there is a cursor, otherwise the view's
+    pagination_mode is used, which defaults to page number pagination.
     '''
+    pagination_query_param = 'pagination'
+    paginator_classes = {
+        'page': LinkHeaderPagination,
+        'cursor': CursorLinkHeaderPagination,
+    }
+    default_mode = 'page'
+
+    def get_mode(self, request, view):
+        mode = request.query_params.get(self.pagination_query_param)
+        if mode is None:
+            if CursorLinkHeaderPagination.cursor_query_param in (
+                    request.query_params):
+                return 'cursor'
+            return getattr(view, 'pagination_mode', self.default_mode)
+        if mode in self.paginator_classes:
+            return mode
+        valid = ', '.join(sorted(self.paginator_classes))
+        raise ValidationError({
+            self.pagination_query_param: ['Must be one of [%s]' % valid],
+        })
+
+    def paginate_queryset(self, queryset, request, view=None):
+        mode = self.get_mode(request, view)
+        self.paginator = self.paginator_classes[mode]()
+        page = self.paginator.paginate_queryset(queryset, request, view)
+        if page is not None:
+            PAGE_SIZES.labels(get_route(request), mode).observe(len(page))
+        return page
 
     def get_paginated_response(self, data):
-        link = link_header(self.get_next_link(), self.get_previous_link())
-        headers = {'Link': link} if link is not None else {}
-        return Response(data, headers=headers)
+        return self.paginator.get_paginated_response(data)
 
 
 def link_header(next_url, previous_url):
@@ -29,3 +181,12 @@ def link_header(next_url, previous_url):
         return '<%s>; rel="prev"' % (previous_url,)
     else:
         return None
+
+
+def estimate_count(queryset):
+    '''Returns the PostgreSQL planner's estimate of the number of rows that
+    the queryset will return, or None for other databases.'''
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    return explain(queryset)['Plan']['Plan Rows']
@@ -1,4 +1,6 @@
 from django.conf import settings
+from django.db.models import Exists, OuterRef, Q, TextField
+from django.db.models.functions import Cast
 from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import BasePermission
 from restfw_composed_permissions.base import (
@@ -6,8 +8,23 @@ from restfw_composed_permissions.base import (
 from restfw_composed_permissions.generic.components import (
     AllowOnlyAuthenticated, AllowOnlySafeHttpMethod)
 
-from authapi.utils import get_user_permissions, find_permission
-from authapi.models import SeedTeam
+from authapi.utils import get_user_permissions, get_request_permissions
+from authapi.models import SeedOrganization, SeedTeam
+from authapi.timing import timed
+
+
+class TimedComposedPermission(BaseComposedPermision):
+    '''Adds the time taken to evaluate the permission sets to the
+    request's timer.'''
+    @timed('permissions')
+    def has_permission(self, request, view):
+        return super(TimedComposedPermission, self).has_permission(
+            request, view)
+
+    @timed('permissions')
+    def has_object_permission(self, request, view, obj):
+        return super(TimedComposedPermission, self).has_object_permission(
+            request, view, obj)
 
 
 class AllowPermission(BasePermissionComponent):
@@ -18,12 +35,8 @@ class AllowPermission(BasePermissionComponent):
         self.permission_type = permission_type
 
     def has_permission(self, permission, request, view):
-        user = request.user
-        permissions = get_user_permissions(user)
-        permissions = find_permission(
-            permissions, self.permission_type,
-            namespace=settings.PERMISSION_NAMESPACE)
-        return permissions.exists()
+        return get_request_permissions(request).has_permission(
+            self.permission_type, namespace=settings.PERMISSION_NAMESPACE)
 
 
 class AllowObjectPermission(AllowPermission):
@@ -42,13 +55,9 @@ class AllowObjectPermission(AllowPermission):
         return obj.pk
 
     def has_object_permission(self, permission, request, view, obj):
-        user = request.user
-        permissions = get_user_permissions(user)
         obj_id = self.location(obj)
-        permissions = find_permission(
-            permissions, self.permission_type, obj_id,
-            settings.PERMISSION_NAMESPACE)
-        return permissions.exists()
+        return get_request_permissions(request).has_permission(
+            self.permission_type, obj_id, settings.PERMISSION_NAMESPACE)
 
 
 class AllowUpdate(BasePermissionComponent):
@@ -96,7 +105,7 @@ class ObjAttrTrue(BasePermissionComponent):
         return self.attribute(request, obj)
 
 
-class OrganizationPermission(BaseComposedPermision):
+class OrganizationPermission(TimedComposedPermission):
     '''Permissions for the OrganizationViewSet.'''
     def global_permission_set(self):
         '''All users must be authenticated.'''
@@ -122,7 +131,7 @@ class OrganizationPermission(BaseComposedPermision):
         )
 
 
-class OrganizationUsersPermission(BaseComposedPermision):
+class OrganizationUsersPermission(TimedComposedPermission):
     '''Permissions for the OrganizationUsersViewSet.'''
     def global_permission_set(self):
         '''All users must be authenticated.'''
@@ -146,7 +155,7 @@ class OrganizationUsersPermission(BaseComposedPermision):
 TeamCreatePermission = OrganizationUsersPermission
 
 
-class TeamPermission(BaseComposedPermision):
+class TeamPermission(TimedComposedPermission):
     '''Permissions for the TeamViewSet.'''
     def global_permission_set(self):
         '''All users must be authenticated.'''
@@ -167,16 +176,49 @@ class TeamPermission(BaseComposedPermision):
                 AllowOnlySafeHttpMethod,
                 Or(
                     ObjAttrTrue(
-                        lambda r, t: t.users.filter(pk=r.user.pk).exists()),
+                        lambda r, t: get_request_permissions(
+                            r).is_team_member(t.pk)),
                     ObjAttrTrue(
-                        lambda r, t: t.organization.users.filter(
-                            pk=r.user.pk).exists())
+                        lambda r, t: get_request_permissions(
+                            r).is_organization_member(t.organization_id))
                 )
             )
         )
 
+    def filter_queryset(self, request, queryset):
+        '''
+        Filters a queryset of teams down to the teams that the user has read
+        access to, according to the object permission set. This is done in
+        the database, so that the result can still be paginated, counted and
+        ordered without evaluating each team separately.
+        '''
+        user = request.user
+        if user.is_superuser:
+            return queryset
+
+        permissions = get_user_permissions(user).filter(
+            namespace=settings.PERMISSION_NAMESPACE)
+        # Permission object ids are stored as text
+        team_id = Cast(OuterRef('pk'), TextField())
+        org_id = Cast(OuterRef('organization_id'), TextField())
+
+        queryset = queryset.annotate(
+            _team_admin=Exists(permissions.filter(
+                type='team:admin', object_id=team_id)),
+            _org_admin=Exists(permissions.filter(
+                type='org:admin', object_id=org_id)),
+            _team_member=Exists(SeedTeam.users.through.objects.filter(
+                seedteam_id=OuterRef('pk'), user_id=user.pk)),
+            _org_member=Exists(SeedOrganization.users.through.objects.filter(
+                seedorganization_id=OuterRef('organization_id'),
+                user_id=user.pk)),
+        )
+        return queryset.filter(
+            Q(_team_admin=True) | Q(_org_admin=True) |
+            Q(_team_member=True) | Q(_org_member=True))
+
 
-class UserPermission(BaseComposedPermision):
+class UserPermission(TimedComposedPermission):
     '''Permissions for the UserViewSet.'''
     def global_permission_set(self):
         '''All users must be authenticated. Only admins can create other admin
@@ -226,51 +268,68 @@ class UserPermission(BaseComposedPermision):
 
 class TeamPermissionPermission(BasePermission):
     '''Permissions for adding or removing permissions from teams.'''
+    @timed('permissions')
     def has_permission(self, request, view):
         if request.user.is_anonymous:
             return False
         if request.method == 'POST':
+            if getattr(view, 'action', None) in ('add', 'remove'):
+                # The bulk actions check each of the permissions in the view
+                return True
             return self.handle_create(request)
         if request.method == 'DELETE':
             # We don't need to do any checks at the view level, only at the
             # object level.
             return True
 
+    @timed('permissions')
     def has_object_permission(self, request, view, obj):
         return self.handle_delete(request, obj)
 
-    def user_has_permission(self, user, permission_type, object_id=None):
-        permissions = get_user_permissions(user)
-        permissions = find_permission(
-            permissions, permission_type, object_id,
-            settings.PERMISSION_NAMESPACE)
-        return permissions.exists()
+    def user_has_permission(self, request, permission_type, object_id=None):
+        return get_request_permissions(request).has_permission(
+            permission_type, object_id, settings.PERMISSION_NAMESPACE)
 
-    def check_permissions(self, user, ptype, object_id, namespace):
+    @timed('permissions')
+    def check_permissions(self, request, ptype, object_id, namespace):
         if namespace != settings.PERMISSION_NAMESPACE:
             return True
-        if user.is_superuser:
+        if request.user.is_superuser:
             return True
         if ptype == 'org:admin':
-            return self.user_has_permission(user, ptype, object_id)
+            return self.user_has_permission(request, ptype, object_id)
         elif ptype == 'team:admin':
-            if self.user_has_permission(user, 'team:admin', object_id):
+            if self.user_has_permission(request, 'team:admin', object_id):
                 return True
             org_id = get_object_or_404(SeedTeam, pk=object_id).organization_id
-            return self.user_has_permission(user, 'org:admin', org_id)
+            return self.user_has_permission(request, 'org:admin', org_id)
         else:
             return True
 
     def handle_create(self, request):
-        user = request.user
         ptype = request.data.get('type')
         object_id = request.data.get('object_id')
         namespace = request.data.get('namespace')
-        return self.check_permissions(user, ptype, object_id, namespace)
+        return self.check_permissions(request, ptype, object_id, namespace)
 
     def handle_delete(self, request, obj):
-        user = request.user
         ptype = obj.type
         object_id = obj.object_id
         namespace = obj.namespace
-        return self.check_permissions(user, ptype, object_id, namespace)
+        return self.check_permissions(request, ptype, object_id, namespace)
+
+
+class ExportPermission(TimedComposedPermission):
+    '''Permissions for the ExportView.'''
+    def global_permission_set(self):
+        '''Only admins can export data.'''
+        return And(
+            AllowOnlyAuthenticated,
+            AllowAdmin
+        )
+
+    def object_permission_set(self):
+        return AllowAdmin
+
+
+ChangesPermission = ExportPermission
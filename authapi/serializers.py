@@ -1,8 +1,10 @@
+from django.conf import settings
 from django.contrib.auth.models import User
 from rest_framework import serializers
 
-from authapi.models import SeedOrganization, SeedTeam, SeedPermission
-from authapi.utils import get_user_permissions
+from authapi.models import Change, SeedOrganization, SeedTeam, SeedPermission
+from authapi.timing import timed
+from authapi.utils import get_effective_permissions
 from authapi.validators import CreateOnly
 
 
@@ -30,6 +32,15 @@ class IntStrReprField(serializers.IntegerField):
 class BaseModelSerializer(serializers.ModelSerializer):
     id = IntStrReprField(read_only=True)
 
+    @timed('serializer')
+    def run_validation(self, *args, **kwargs):
+        return super(BaseModelSerializer, self).run_validation(
+            *args, **kwargs)
+
+    @timed('serializer')
+    def to_representation(self, instance):
+        return super(BaseModelSerializer, self).to_representation(instance)
+
 
 class OrganizationSummarySerializer(BaseModelSerializer):
     class Meta:
@@ -141,7 +152,11 @@ class PermissionsUserSerializer(BaseUserSerializer):
     permissions = serializers.SerializerMethodField()
 
     def get_permissions(self, user):
-        permissions = get_user_permissions(user)
+        '''Uses the permissions in the context, if the view has already
+        fetched them.'''
+        permissions = self.context.get('permissions')
+        if permissions is None:
+            permissions = get_effective_permissions(user)
         serializer = PermissionSerializer(instance=permissions, many=True)
         return serializer.data
 
@@ -160,3 +175,55 @@ class NewUserSerializer(UserSerializer):
 class CreateTokenSerializer(serializers.Serializer):
     email = serializers.EmailField()
     password = serializers.CharField(style={'input_type': 'password'})
+
+
+class PermissionCheckSerializer(serializers.Serializer):
+    type = serializers.CharField()
+    object_id = serializers.CharField(
+        allow_null=True, required=False, default=None)
+    namespace = serializers.CharField()
+
+
+class PermissionsSerializer(serializers.Serializer):
+    max_permissions = 1000
+    permissions = PermissionSerializer(many=True)
+
+    def validate_permissions(self, value):
+        if len(value) > self.max_permissions:
+            raise serializers.ValidationError(
+                'Ensure this field has no more than %d elements.' % (
+                    self.max_permissions,))
+        return value
+
+
+class PermissionsCheckSerializer(PermissionsSerializer):
+    permissions = PermissionCheckSerializer(many=True)
+
+
+class UserIdsSerializer(serializers.Serializer):
+    users = serializers.ListField(
+        child=serializers.IntegerField(), max_length=10000)
+
+
+class PermissionIdsSerializer(serializers.Serializer):
+    permissions = serializers.ListField(
+        child=serializers.IntegerField(), max_length=10000)
+
+
+class ChangeSerializer(BaseModelSerializer):
+    seq = IntStrReprField(source='id', read_only=True)
+    user = IntStrReprField(source='user_id', read_only=True)
+
+    class Meta:
+        model = Change
+        fields = ('seq', 'type', 'user', 'created_at')
+
+
+class ChangesQuerySerializer(serializers.Serializer):
+    since = serializers.IntegerField(min_value=0, required=False)
+    wait = serializers.FloatField(min_value=0, default=0)
+    limit = serializers.IntegerField(
+        min_value=1, max_value=10000, default=1000)
+
+    def validate_wait(self, value):
+        return min(value, settings.CHANGES['MAX_WAIT'])
@@ -0,0 +1,244 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete, pre_save)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from authapi import changes
+from authapi.cache import invalidate_tokens, invalidate_users
+from authapi.models import (
+    SeedOrganization, SeedPermission, SeedTeam, UserEffectivePermission)
+
+
+def get_team_user_ids(team_ids):
+    '''Returns the ids of all the users that are members of the given
+    teams.'''
+    return set(SeedTeam.users.through.objects.filter(
+        seedteam_id__in=team_ids).values_list('user_id', flat=True))
+
+
+def get_permission_team_ids(permission_ids):
+    '''Returns the ids of all the teams that have the given permissions.'''
+    return set(SeedTeam.permissions.through.objects.filter(
+        seedpermission_id__in=permission_ids).values_list(
+            'seedteam_id', flat=True))
+
+
+@receiver(m2m_changed, sender=SeedTeam.users.through)
+def team_users_changed(instance, action, reverse, pk_set, **kwargs):
+    '''Users being added to or removed from teams changes the permissions of
+    those users.'''
+    if action in ('post_add', 'post_remove') and not pk_set:
+        return
+    if reverse:
+        team_ids, user_ids = pk_set, [instance.pk]
+    else:
+        team_ids, user_ids = [instance.pk], pk_set
+
+    if action == 'pre_clear':
+        if reverse:
+            instance._authapi_affected_users = {instance.pk}
+        else:
+            instance._authapi_affected_users = get_team_user_ids(
+                [instance.pk])
+    elif action == 'post_clear':
+        if reverse:
+            UserEffectivePermission.objects.remove(user_ids=[instance.pk])
+        else:
+            UserEffectivePermission.objects.remove(team_ids=[instance.pk])
+        affected = instance.__dict__.pop('_authapi_affected_users', ())
+        invalidate_users(affected)
+        changes.record_changes(changes.MEMBERSHIP, affected)
+    elif action == 'post_add':
+        UserEffectivePermission.objects.add(
+            team_ids=team_ids, user_ids=user_ids)
+        invalidate_users(user_ids)
+        changes.record_changes(changes.MEMBERSHIP, user_ids)
+    elif action == 'post_remove':
+        UserEffectivePermission.objects.remove(
+            team_ids=team_ids, user_ids=user_ids)
+        invalidate_users(user_ids)
+        changes.record_changes(changes.MEMBERSHIP, user_ids)
+
+
+@receiver(m2m_changed, sender=SeedTeam.permissions.through)
+def team_permissions_changed(instance, action, reverse, pk_set, **kwargs):
+    '''Permissions being added to or removed from teams changes the
+    permissions of the users of those teams.'''
+    if action in ('post_add', 'post_remove') and not pk_set:
+        return
+    if reverse:
+        team_ids, permission_ids = pk_set, [instance.pk]
+    else:
+        team_ids, permission_ids = [instance.pk], pk_set
+
+    if action == 'pre_clear':
+        if reverse:
+            team_ids = get_permission_team_ids([instance.pk])
+        instance._authapi_affected_users = get_team_user_ids(team_ids)
+    elif action == 'post_clear':
+        if reverse:
+            UserEffectivePermission.objects.remove(
+                permission_ids=[instance.pk])
+        else:
+            UserEffectivePermission.objects.remove(team_ids=[instance.pk])
+        affected = instance.__dict__.pop('_authapi_affected_users', ())
+        invalidate_users(affected)
+        changes.record_changes(changes.PERMISSIONS, affected)
+    elif action in ('post_add', 'post_remove'):
+        if action == 'post_add':
+            UserEffectivePermission.objects.add(
+                team_ids=team_ids, permission_ids=permission_ids)
+        else:
+            UserEffectivePermission.objects.remove(
+                team_ids=team_ids, permission_ids=permission_ids)
+        affected = get_team_user_ids(team_ids)
+        invalidate_users(affected)
+        changes.record_changes(changes.PERMISSIONS, affected)
+
+
+@receiver(m2m_changed, sender=SeedOrganization.users.through)
+def organization_users_changed(instance, action, reverse, pk_set, **kwargs):
+    '''Organization memberships don't change permissions, but are recorded
+    in the change feed.'''
+    if action == 'pre_clear':
+        if reverse:
+            instance._authapi_affected_users = {instance.pk}
+        else:
+            instance._authapi_affected_users = set(
+                instance.users.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        changes.record_changes(
+            changes.MEMBERSHIP,
+            instance.__dict__.pop('_authapi_affected_users', ()))
+    elif action in ('post_add', 'post_remove') and pk_set:
+        changes.record_changes(
+            changes.MEMBERSHIP, [instance.pk] if reverse else pk_set)
+
+
+@receiver(pre_save, sender=SeedTeam)
+def team_pre_save(instance, **kwargs):
+    '''Archiving or unarchiving a team, or moving it to another organization,
+    changes the permissions of its users.'''
+    if instance.pk is None:
+        return
+    instance._authapi_changed = SeedTeam.objects.filter(
+        pk=instance.pk).exclude(
+            archived=instance.archived,
+            organization_id=instance.organization_id).exists()
+
+
+@receiver(post_save, sender=SeedTeam)
+def team_post_save(instance, **kwargs):
+    if instance.__dict__.pop('_authapi_changed', False):
+        UserEffectivePermission.objects.refresh([instance.pk])
+        affected = get_team_user_ids([instance.pk])
+        invalidate_users(affected)
+        changes.record_changes(changes.ARCHIVE, affected)
+
+
+@receiver(pre_save, sender=SeedOrganization)
+def organization_pre_save(instance, **kwargs):
+    '''Archiving or unarchiving an organization changes the permissions of the
+    users of all of its teams.'''
+    if instance.pk is None:
+        return
+    instance._authapi_changed = SeedOrganization.objects.filter(
+        pk=instance.pk).exclude(archived=instance.archived).exists()
+
+
+@receiver(post_save, sender=SeedOrganization)
+def organization_post_save(instance, **kwargs):
+    if instance.__dict__.pop('_authapi_changed', False):
+        team_ids = list(instance.seedteam_set.values_list('pk', flat=True))
+        UserEffectivePermission.objects.refresh(team_ids)
+        affected = get_team_user_ids(team_ids)
+        invalidate_users(affected)
+        changes.record_changes(changes.ARCHIVE, affected)
+
+
+@receiver(post_save, sender=SeedPermission)
+def permission_post_save(instance, created, **kwargs):
+    '''Changing a permission changes the permissions of the users of all the
+    teams that have that permission.'''
+    if not created:
+        team_ids = get_permission_team_ids([instance.pk])
+        affected = get_team_user_ids(team_ids)
+        invalidate_users(affected)
+        changes.record_changes(changes.PERMISSIONS, affected)
+
+
+@receiver(pre_delete, sender=SeedPermission)
+@receiver(pre_delete, sender=SeedTeam)
+@receiver(pre_delete, sender=SeedOrganization)
+def pre_delete_affected_users(sender, instance, **kwargs):
+    '''Deleting permissions, teams, or organizations changes the permissions
+    of the users of the affected teams. The relations are removed by the
+    delete, so we need to find those users beforehand.'''
+    if '_authapi_affected_users' in instance.__dict__:
+        # Already found for all of the permissions being deleted, by
+        # SeedPermissionQuerySet.delete
+        return
+    if sender is SeedPermission:
+        team_ids = get_permission_team_ids([instance.pk])
+        if not team_ids:
+            instance._authapi_affected_users = set()
+            return
+    elif sender is SeedTeam:
+        team_ids = [instance.pk]
+    else:
+        team_ids = instance.seedteam_set.values_list('pk', flat=True)
+    instance._authapi_affected_users = get_team_user_ids(team_ids)
+
+
+@receiver(post_delete, sender=SeedPermission)
+@receiver(post_delete, sender=SeedTeam)
+@receiver(post_delete, sender=SeedOrganization)
+def post_delete_affected_users(sender, instance, **kwargs):
+    affected = instance.__dict__.pop('_authapi_affected_users', ())
+    invalidate_users(affected)
+    changes.record_changes(
+        changes.PERMISSIONS if sender is SeedPermission else changes.ARCHIVE,
+        affected)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(instance, **kwargs):
+    '''Deactivating or deleting a user should remove their cached
+    permissions.'''
+    invalidate_users([instance.pk])
+
+
+@receiver(post_save, sender=User)
+def user_change_recorded(instance, created, update_fields, **kwargs):
+    '''Changes to existing users are recorded in the change feed, except for
+    changes to fields that aren't part of the user's details.'''
+    if created or (update_fields is not None and set(update_fields) <= {
+            'password', 'last_login'}):
+        return
+    changes.record_changes(
+        changes.USER if instance.is_active else changes.DEACTIVATION,
+        [instance.pk])
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(instance, **kwargs):
+    changes.record_changes(changes.DEACTIVATION, [instance.pk])
+
+
+@receiver(post_save, sender=User)
+def user_saved(instance, created, **kwargs):
+    '''Deactivating or changing a user should remove their cached tokens.
+    Deleting a user deletes their tokens.'''
+    if created:
+        return
+    invalidate_tokens(
+        Token.objects.filter(user=instance).values_list('key', flat=True))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(instance, **kwargs):
+    '''Deleting a token, such as when a new token is created for the user,
+    should remove it from the cache.'''
+    invalidate_tokens([instance.key])
@@ -1,9 +1,13 @@
+import time
+
 from django.contrib.auth.models import User
+from django.db import connection
 from django.urls import reverse
 from rest_framework.authtoken.models import Token
 from rest_framework.request import Request
 from rest_framework.reverse import reverse as drt_reverse
-from rest_framework.test import APITestCase, APIRequestFactory, APIClient
+from rest_framework.test import (
+    APITestCase, APITransactionTestCase, APIRequestFactory, APIClient)
 
 from authapi.models import SeedOrganization, SeedTeam
 
@@ -27,7 +31,7 @@ class JsonApiClient(APIClient):
         return super(JsonApiClient, self).put(*args, **kwargs)
 
 
-class AuthAPITestCase(APITestCase):
+class AuthAPITestMixin(object):
     def get_context(self, url):
         '''Returns the request context for a given url.'''
         factory = APIRequestFactory()
@@ -72,6 +76,37 @@ class AuthAPITestCase(APITestCase):
             type=permission_type, object_id=object_id, namespace=namespace)
         return team, permission
 
+    def run_commit_hooks(self):
+        '''Runs the on_commit callbacks of the current transaction, which
+        are never run in a TestCase, because its transaction is never
+        committed.'''
+        while connection.run_on_commit:
+            _, func = connection.run_on_commit.pop(0)
+            func()
+
+    def wait_for_advisory_locks(self, lock_id, count):
+        '''Waits until other database sessions hold count of the advisory
+        locks with the first key lock_id.'''
+        while True:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT COUNT(*) FROM pg_locks "
+                    "WHERE locktype = 'advisory' AND granted "
+                    "AND classid = %s AND pid != pg_backend_pid()",
+                    [lock_id])
+                if cursor.fetchone()[0] == count:
+                    return
+            time.sleep(0.01)
+
     def patch_client_data_json(self):
         '''Patches the client to change data to json instead of form data.'''
         self.client = JsonApiClient()
+
+
+class AuthAPITestCase(AuthAPITestMixin, APITestCase):
+    pass
+
+
+class AuthAPITransactionTestCase(AuthAPITestMixin, APITransactionTestCase):
+    '''For tests of things that only happen once a transaction is
+    committed.'''
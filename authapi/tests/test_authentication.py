@@ -0,0 +1,102 @@
+import time
+
+from django.db import connection
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import exceptions, status
+
+from authapi.authentication import CachedTokenAuthentication
+from authapi.cache import get_token_cache
+from authapi.tests.base import AuthAPITestCase
+
+
+@override_settings(TOKEN_CACHE={
+    'BACKEND': 'authapi.cache.LocalMemoryCache'})
+class CachedTokenAuthenticationTests(AuthAPITestCase):
+    def setUp(self):
+        get_token_cache().clear()
+        self.auth = CachedTokenAuthentication()
+
+    def test_cached(self):
+        '''The token and user should only be loaded once.'''
+        user, token = self.create_user()
+        self.assertEqual(
+            self.auth.authenticate_credentials(token.key), (user, token))
+        with self.assertNumQueries(0):
+            cached_user, cached_token = self.auth.authenticate_credentials(
+                token.key)
+        self.assertEqual((cached_user, cached_token), (user, token))
+        self.assertEqual(cached_user.username, user.username)
+        self.assertEqual(get_token_cache().stats()['hits'], 1)
+
+    def test_cached_copy(self):
+        '''Each request should get its own copy of the cached user.'''
+        _, token = self.create_user()
+        user1, _ = self.auth.authenticate_credentials(token.key)
+        user1.first_name = 'changed'
+        user2, _ = self.auth.authenticate_credentials(token.key)
+        self.assertEqual(user2.first_name, '')
+
+    def test_invalid_token(self):
+        '''Invalid tokens should not be cached.'''
+        self.assertRaises(
+            exceptions.AuthenticationFailed,
+            self.auth.authenticate_credentials, 'foo')
+        self.assertEqual(get_token_cache().stats()['size'], 0)
+
+    def test_expires(self):
+        '''Cached tokens should expire, so that tokens deleted by other
+        processes, which don't invalidate this process's cache, stop
+        working.'''
+        with self.settings(TOKEN_CACHE={
+                'BACKEND': 'authapi.cache.LocalMemoryCache',
+                'OPTIONS': {'timeout': 0.05}}):
+            _, token = self.create_user()
+            self.auth.authenticate_credentials(token.key)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'DELETE FROM authtoken_token WHERE key = %s', [token.key])
+            self.auth.authenticate_credentials(token.key)
+
+            time.sleep(0.1)
+            self.assertRaises(
+                exceptions.AuthenticationFailed,
+                self.auth.authenticate_credentials, token.key)
+
+    def test_default_timeout(self):
+        self.assertEqual(get_token_cache().timeout, 60)
+
+    def test_token_rotated(self):
+        '''Creating a new token for a user should invalidate their old
+        token.'''
+        user, token = self.create_user()
+        self.auth.authenticate_credentials(token.key)
+
+        response = self.client.post(reverse('create-token'), data={
+            'email': 'test@example.org', 'password': 'password'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertRaises(
+            exceptions.AuthenticationFailed,
+            self.auth.authenticate_credentials, token.key)
+        self.assertEqual(
+            self.auth.authenticate_credentials(response.data['token'])[0],
+            user)
+
+    def test_user_deactivated(self):
+        '''Deactivating a user should invalidate their token.'''
+        user, token = self.create_user()
+        _, admin_token = self.create_admin_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        response = self.client.get(reverse('get-user-permissions'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.client.credentials(
+            HTTP_AUTHORIZATION='Token ' + admin_token.key)
+        response = self.client.delete(
+            reverse('user-detail', args=[user.pk]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        response = self.client.get(reverse('get-user-permissions'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,158 @@
+import io
+import random
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.urls import resolve
+
+from authapi import urls
+from authapi.benchmark import (
+    TeamSampler, get_endpoints, percentile, run_benchmark, seed_dataset)
+from authapi.models import (
+    SeedOrganization, SeedTeam, UserEffectivePermission)
+from authapi.tests.base import AuthAPITestCase
+
+
+class BenchmarkTests(AuthAPITestCase):
+    def test_seed_dataset(self):
+        '''The dataset should have the requested sizes, with effective
+        permissions for the memberships.'''
+        dataset = seed_dataset(
+            organizations=2, teams_per_organization=3, users=10,
+            teams_per_user=2, permissions_per_team=1)
+        self.assertEqual(len(dataset.organization_ids), 2)
+        self.assertEqual(len(dataset.team_ids), 6)
+        self.assertEqual(len(dataset.user_ids), 10)
+        self.assertEqual(SeedTeam.users.through.objects.count(), 20)
+        self.assertEqual(UserEffectivePermission.objects.verify(), (
+            set(), set()))
+        user = User.objects.get(pk=dataset.user_ids[0])
+        self.assertTrue(user.check_password('password'))
+
+    def test_seed_dataset_distributions(self):
+        '''Users that aren't shared should only be members of teams in one
+        organization.'''
+        dataset = seed_dataset(
+            organizations=3, teams_per_organization=4, users=20,
+            teams_per_user=2, team_size_exponent=2, shared_users=0)
+        for user_id in dataset.user_ids:
+            teams = SeedTeam.objects.filter(users=user_id)
+            self.assertEqual(teams.count(), 2)
+            self.assertEqual(
+                len(set(t.organization_id for t in teams)), 1)
+            self.assertEqual(
+                SeedOrganization.objects.filter(users=user_id).count(), 1)
+        self.assertEqual(UserEffectivePermission.objects.verify(), (
+            set(), set()))
+
+    def test_team_sampler(self):
+        '''Teams should be distinct, and with a positive exponent, team
+        sizes should follow a power law.'''
+        teams = list(range(10))
+        sampler = TeamSampler(random.Random(0), teams, exponent=0)
+        self.assertEqual(len(set(sampler.sample(5))), 5)
+        self.assertEqual(sorted(sampler.sample(20)), teams)
+
+        sampler = TeamSampler(random.Random(0), teams, exponent=2)
+        sizes = Counter()
+        for _ in range(1000):
+            picked = sampler.sample(2)
+            self.assertEqual(len(set(picked)), 2)
+            sizes.update(picked)
+        [(_, largest)] = sizes.most_common(1)
+        self.assertGreater(largest, 10 * min(sizes.values()))
+
+    def test_seed_fake_data(self):
+        out = io.StringIO()
+        call_command(
+            'seed_fake_data', organizations=2, teams_per_organization=3,
+            users=10, teams_per_user=2, allow_non_debug=True, stdout=out)
+        # The users, the admin, the login, and the spare users
+        self.assertEqual(User.objects.count(), 17)
+        self.assertEqual(SeedTeam.users.through.objects.count(), 20)
+        self.assertIn('Created 2 organizations, 6 teams, 10 users', (
+            out.getvalue()))
+
+        # The usernames of the dataset are already taken
+        self.assertRaises(
+            CommandError, call_command, 'seed_fake_data',
+            allow_non_debug=True, stdout=out)
+
+    def test_seed_fake_data_debug(self):
+        '''The dataset should only be created without DEBUG if that is
+        explicitly allowed.'''
+        with self.assertRaisesRegex(CommandError, '--allow-non-debug'):
+            call_command('seed_fake_data', users=1, stdout=io.StringIO())
+        self.assertEqual(User.objects.count(), 0)
+
+        with self.settings(DEBUG=True):
+            call_command(
+                'seed_fake_data', organizations=1, teams_per_organization=1,
+                users=1, stdout=io.StringIO())
+        self.assertTrue(User.objects.filter(
+            username='admin@example.org').exists())
+
+    def test_run_benchmark(self):
+        '''Each endpoint should respond successfully, and have its latency
+        and queries measured.'''
+        dataset = seed_dataset(
+            organizations=2, teams_per_organization=2, users=5,
+            teams_per_user=1, permissions_per_team=1)
+        results = run_benchmark(dataset, requests=2, warmup=0)
+        self.assertEqual(
+            [r['name'] for r in results],
+            [e.name for e in get_endpoints(dataset)])
+        for result in results:
+            self.assertEqual(
+                sum(result['statuses'].values()), 2, result['name'])
+            self.assertTrue(
+                all(s.startswith('2') for s in result['statuses']),
+                result)
+            self.assertGreater(result['latency_ms']['p50'], 0)
+            if result['name'] != 'metrics':
+                self.assertGreater(result['queries']['max'], 0)
+
+    def test_every_route(self):
+        '''Each route in authapi.urls should be requested with each of the
+        methods that its view handles.'''
+        dataset = seed_dataset(
+            organizations=1, teams_per_organization=1, users=1)
+        requested = set(
+            (resolve(urlsplit(e.path).path).url_name, e.method)
+            for e in get_endpoints(dataset))
+
+        def get_routes(patterns):
+            for pattern in patterns:
+                if hasattr(pattern, 'url_patterns'):
+                    yield from get_routes(pattern.url_patterns)
+                else:
+                    yield pattern
+
+        routes = set()
+        for pattern in get_routes(urls.urlpatterns):
+            view = pattern.callback
+            if hasattr(view, 'actions'):
+                methods = view.actions
+            elif hasattr(view, 'view_class'):
+                methods = [
+                    m for m in view.view_class.http_method_names
+                    if m != 'options' and hasattr(view.view_class, m)]
+            else:
+                methods = ['get']
+            routes.update((pattern.name, m.upper()) for m in methods)
+        self.assertEqual(routes - requested, set())
+
+    def test_run_benchmark_unknown_endpoint(self):
+        dataset = seed_dataset(
+            organizations=1, teams_per_organization=1, users=1)
+        self.assertRaises(
+            ValueError, run_benchmark, dataset, ['foo'], requests=1)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([5], 99), 5)
+        self.assertEqual(percentile([], 50), None)
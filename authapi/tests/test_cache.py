@@ -0,0 +1,255 @@
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from authapi.cache import (
+    LocalMemoryCache, SharedCache, get_permission_cache)
+from authapi.models import SeedOrganization, SeedPermission, SeedTeam
+from authapi.tests.base import AuthAPITestCase
+from authapi.utils import get_effective_permissions
+
+
+class LocalMemoryCacheTests(AuthAPITestCase):
+    def test_get_set(self):
+        '''Values that are set should be returned, and the hits and misses
+        should be counted.'''
+        cache = LocalMemoryCache()
+        self.assertEqual(cache.get(1), None)
+        cache.set(1, ['foo'])
+        self.assertEqual(cache.get(1), ['foo'])
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+    def test_least_recently_used(self):
+        '''If the cache is full, the least recently used entry should be
+        removed.'''
+        cache = LocalMemoryCache(max_entries=2)
+        cache.set(1, ['foo'])
+        cache.set(2, ['bar'])
+        cache.get(1)
+        cache.set(3, ['baz'])
+        self.assertEqual(cache.get(1), ['foo'])
+        self.assertEqual(cache.get(2), None)
+        self.assertEqual(cache.get(3), ['baz'])
+
+    def test_timeout(self):
+        '''Entries should expire after the timeout.'''
+        cache = LocalMemoryCache(timeout=0.01)
+        cache.set(1, ['foo'])
+        time.sleep(0.02)
+        self.assertEqual(cache.get(1), None)
+
+    def test_delete_many(self):
+        cache = LocalMemoryCache()
+        cache.set(1, ['foo'])
+        cache.set(2, ['bar'])
+        cache.delete_many([1, 3])
+        self.assertEqual(cache.get(1), None)
+        self.assertEqual(cache.get(2), ['bar'])
+
+    def test_requires_timeout(self):
+        '''Entries should always expire, as they aren't invalidated by other
+        processes.'''
+        self.assertEqual(LocalMemoryCache().timeout, 60)
+        self.assertRaises(
+            ImproperlyConfigured, LocalMemoryCache, timeout=None)
+
+
+class SharedCacheTests(AuthAPITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            },
+            'shared': {
+                'BACKEND':
+                    'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': directory.name,
+            },
+        })
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_get_set_delete(self):
+        '''Values should be stored in the configured django cache.'''
+        cache = SharedCache(cache_alias='shared', key_prefix='test:')
+        cache.set(1, ['foo'])
+        self.assertEqual(cache.cache.get(cache.make_key(1)), ['foo'])
+        self.assertTrue(cache.make_key(1).startswith('test:'))
+        self.assertEqual(cache.get(1), ['foo'])
+        cache.delete_many([1])
+        self.assertEqual(cache.get(1), None)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1})
+
+    def test_clear(self):
+        '''Clearing the cache should remove all of its values, but not the
+        other values in the same django cache.'''
+        cache = SharedCache(cache_alias='shared', key_prefix='test:')
+        cache.cache.set('other', 'bar')
+        cache.set(1, ['foo'])
+        cache.set(2, ['bar'])
+        cache.clear()
+        self.assertEqual(cache.get(1), None)
+        self.assertEqual(cache.get(2), None)
+        self.assertEqual(cache.cache.get('other'), 'bar')
+
+        cache.set(1, ['baz'])
+        self.assertEqual(cache.get(1), ['baz'])
+        self.assertEqual(
+            SharedCache(cache_alias='shared', key_prefix='test:').get(1),
+            ['baz'])
+
+    def test_generation_evicted(self):
+        '''If the generation is lost, values stored with older generations
+        shouldn't be used again.'''
+        cache = SharedCache(cache_alias='shared', key_prefix='test:')
+        cache.set(1, ['foo'])
+        cache.cache.delete(cache.generation_key)
+        # The generation is started from the time in milliseconds
+        time.sleep(0.01)
+        self.assertEqual(cache.get(1), None)
+        cache.cache.delete(cache.generation_key)
+        cache.clear()
+        self.assertEqual(cache.get(1), None)
+
+    def test_not_shared(self):
+        '''Caches that are stored in each process can't be used, as they
+        wouldn't be invalidated by other processes.'''
+        self.assertRaises(ImproperlyConfigured, SharedCache)
+        self.assertRaises(
+            ImproperlyConfigured, SharedCache, cache_alias='shared',
+            timeout=None)
+
+
+@override_settings(PERMISSION_CACHE={
+    'BACKEND': 'authapi.cache.LocalMemoryCache'})
+class PermissionCacheInvalidationTests(AuthAPITestCase):
+    def setUp(self):
+        get_permission_cache().clear()
+        self.user = User.objects.create_user('foo@bar.org')
+        self.org = SeedOrganization.objects.create()
+        self.team = SeedTeam.objects.create(organization=self.org)
+        self.permission = self.team.permissions.create(
+            type='foo', namespace='bar')
+        self.team.users.add(self.user)
+
+    def assert_cached_permissions(self, types):
+        '''Asserts that the user's permissions are cached, and that they are
+        of the given types.'''
+        cache = get_permission_cache()
+        self.assertEqual(
+            sorted(p.type for p in get_effective_permissions(self.user)),
+            types)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                sorted(p.type for p in cache.get(self.user.pk)), types)
+
+    def test_cached(self):
+        '''Permissions should only be loaded once.'''
+        self.assert_cached_permissions(['foo'])
+        with self.assertNumQueries(0):
+            get_effective_permissions(self.user)
+
+    def test_user_permissions_endpoint(self):
+        '''The user permissions endpoint should use the cache.'''
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        self.client.get(reverse('get-user-permissions'))
+        self.assertEqual(get_permission_cache().stats()['size'], 1)
+
+    def test_team_users(self):
+        '''Adding and removing users from teams should invalidate the cache of
+        those users.'''
+        team = SeedTeam.objects.create(organization=self.org)
+        team.permissions.create(type='bar', namespace='bar')
+        self.assert_cached_permissions(['foo'])
+        team.users.add(self.user)
+        self.assert_cached_permissions(['bar', 'foo'])
+        self.user.seedteam_set.remove(team)
+        self.assert_cached_permissions(['foo'])
+        team.users.add(self.user)
+        self.assert_cached_permissions(['bar', 'foo'])
+        team.users.clear()
+        self.assert_cached_permissions(['foo'])
+        self.user.seedteam_set.clear()
+        self.assert_cached_permissions([])
+
+    def test_team_permissions(self):
+        '''Adding, removing, changing, and deleting team permissions should
+        invalidate the cache of the users of that team.'''
+        self.assert_cached_permissions(['foo'])
+        permission = self.team.permissions.create(type='bar', namespace='bar')
+        self.assert_cached_permissions(['bar', 'foo'])
+        permission.type = 'baz'
+        permission.save()
+        self.assert_cached_permissions(['baz', 'foo'])
+        self.team.permissions.remove(permission)
+        self.assert_cached_permissions(['foo'])
+        permission.seedteam_set.add(self.team)
+        self.assert_cached_permissions(['baz', 'foo'])
+        permission.delete()
+        self.assert_cached_permissions(['foo'])
+        self.team.permissions.clear()
+        self.assert_cached_permissions([])
+
+    def test_archive_team(self):
+        '''Archiving and unarchiving a team should invalidate the cache of the
+        users of that team.'''
+        self.assert_cached_permissions(['foo'])
+        self.team.archived = True
+        self.team.save()
+        self.assert_cached_permissions([])
+        self.team.archived = False
+        self.team.save()
+        self.assert_cached_permissions(['foo'])
+
+    def test_move_team(self):
+        '''Moving a team to an archived organization should invalidate the
+        cache of the users of that team.'''
+        self.assert_cached_permissions(['foo'])
+        self.team.organization = SeedOrganization.objects.create(
+            archived=True)
+        self.team.save()
+        self.assert_cached_permissions([])
+
+    def test_archive_organization(self):
+        '''Archiving and unarchiving an organization should invalidate the
+        cache of the users of the organization's teams.'''
+        self.assert_cached_permissions(['foo'])
+        self.org.archived = True
+        self.org.save()
+        self.assert_cached_permissions([])
+        self.org.archived = False
+        self.org.save()
+        self.assert_cached_permissions(['foo'])
+
+    def test_unchanged_saves(self):
+        '''Saves that don't change any permissions shouldn't invalidate the
+        cache.'''
+        self.assert_cached_permissions(['foo'])
+        self.team.title = 'foo'
+        self.team.save()
+        self.org.title = 'foo'
+        self.org.save()
+        self.assertNotEqual(get_permission_cache().get(self.user.pk), None)
+
+    def test_delete(self):
+        '''Deleting organizations should invalidate the cache of the users of
+        their teams.'''
+        self.assert_cached_permissions(['foo'])
+        self.org.delete()
+        self.assertEqual(SeedPermission.objects.count(), 1)
+        self.assert_cached_permissions([])
+
+    def test_user_deactivated(self):
+        '''Deactivating a user should invalidate the cache of that user.'''
+        self.assert_cached_permissions(['foo'])
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(get_permission_cache().get(self.user.pk), None)
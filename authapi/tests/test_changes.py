@@ -0,0 +1,200 @@
+import io
+import threading
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from authapi.changes import record_changes
+from authapi.models import Change, SeedOrganization, SeedTeam
+from authapi.tests.base import (
+    AuthAPITestCase, AuthAPITransactionTestCase)
+
+
+class ChangeRecordingTests(AuthAPITestCase):
+    def get_changes(self):
+        self.run_commit_hooks()
+        return list(Change.objects.order_by('id').values_list(
+            'type', 'user_id'))
+
+    def test_team_changes(self):
+        '''Adding users and permissions to teams, and archiving teams,
+        should record a change for each affected user.'''
+        org = SeedOrganization.objects.create()
+        team = SeedTeam.objects.create(organization=org)
+        user1 = User.objects.create_user('user1')
+        user2 = User.objects.create_user('user2')
+        team.users.add(user1, user2)
+        team.permissions.create(type='foo', namespace='bar')
+        team.users.remove(user2)
+        team.archived = True
+        team.save()
+        self.assertEqual(self.get_changes(), [
+            ('membership', user1.pk),
+            ('membership', user2.pk),
+            ('permissions', user1.pk),
+            ('permissions', user2.pk),
+            ('membership', user2.pk),
+            ('archive', user1.pk),
+        ])
+
+    def test_organization_changes(self):
+        '''Organization memberships and archiving should be recorded.'''
+        org = SeedOrganization.objects.create()
+        team = SeedTeam.objects.create(organization=org)
+        user = User.objects.create_user('user')
+        org.users.add(user)
+        team.users.add(user)
+        self.run_commit_hooks()
+        Change.objects.all().delete()
+
+        org.archived = True
+        org.save()
+        org.users.clear()
+        self.assertEqual(self.get_changes(), [
+            ('archive', user.pk),
+            ('membership', user.pk),
+        ])
+
+    def test_user_changes(self):
+        '''Updating, deactivating, and deleting users should be recorded, but
+        not creating users, or changing their password.'''
+        user = User.objects.create_user('user')
+        user.set_password('foo')
+        user.save(update_fields=['password'])
+        user.first_name = 'Foo'
+        user.save()
+        user.is_active = False
+        user.save()
+        user_id = user.pk
+        user.delete()
+        self.assertEqual(self.get_changes(), [
+            ('user', user_id),
+            ('deactivation', user_id),
+            ('deactivation', user_id),
+        ])
+
+    def test_rollback(self):
+        '''Changes should only be recorded if the transaction commits.'''
+        org = SeedOrganization.objects.create()
+        team = SeedTeam.objects.create(organization=org)
+        user = User.objects.create_user('user')
+        try:
+            with transaction.atomic():
+                team.users.add(user)
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual(self.get_changes(), [])
+
+    def test_prune(self):
+        '''Changes older than the given number of days should be deleted.'''
+        Change.objects.create(type='user', user_id=1)
+        old = Change.objects.create(type='user', user_id=2)
+        Change.objects.filter(pk=old.pk).update(
+            created_at=timezone.now() - timedelta(days=8))
+
+        out = io.StringIO()
+        call_command('prune_changes', days=7, stdout=out)
+        self.assertEqual(out.getvalue(), 'Deleted 1 changes.\n')
+        self.assertEqual(self.get_changes(), [('user', 1)])
+
+
+@override_settings(CHANGES={'POLL_INTERVAL': 0.01, 'MAX_WAIT': 5})
+class ChangesViewTests(AuthAPITestCase):
+    def setUp(self):
+        _, token = self.create_admin_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        self.url = reverse('changes')
+
+    def record_changes(self, change_type, user_ids):
+        record_changes(change_type, user_ids)
+        self.run_commit_hooks()
+
+    def test_latest(self):
+        '''Without since, the latest sequence number should be returned.'''
+        response = self.client.get(self.url)
+        self.assertEqual(response.data, {'seq': '0', 'results': []})
+
+        self.record_changes('user', [1, 2])
+        last = Change.objects.order_by('id').last()
+        response = self.client.get(self.url)
+        self.assertEqual(response.data, {'seq': str(last.id), 'results': []})
+
+    def test_since(self):
+        '''Changes after since should be returned in order, up to limit.'''
+        self.record_changes('membership', [1, 2, 3])
+        first, second, third = Change.objects.order_by('id')
+
+        response = self.client.get(self.url, {'since': first.id, 'limit': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            'seq': str(second.id),
+            'results': [{
+                'seq': str(second.id), 'type': 'membership', 'user': '2',
+                'created_at': response.data['results'][0]['created_at'],
+            }],
+        })
+
+        response = self.client.get(self.url, {'since': second.id})
+        self.assertEqual(
+            [c['seq'] for c in response.data['results']], [str(third.id)])
+
+        response = self.client.get(self.url, {'since': third.id})
+        self.assertEqual(response.data, {'seq': str(third.id), 'results': []})
+
+    def test_wait_timeout(self):
+        '''If there are no changes within wait seconds, no changes should be
+        returned.'''
+        start = time.monotonic()
+        response = self.client.get(self.url, {'since': 0, 'wait': 0.05})
+        self.assertEqual(response.data, {'seq': '0', 'results': []})
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+
+    def test_invalid_query(self):
+        response = self.client.get(
+            self.url, {'since': -1, 'wait': 'foo', 'limit': 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            sorted(response.data.keys()), ['limit', 'since', 'wait'])
+
+    def test_permission(self):
+        '''Only admins should be able to get the changes.'''
+        _, token = self.create_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(CHANGES={'POLL_INTERVAL': 0.01, 'MAX_WAIT': 5})
+class ChangesLongPollTests(AuthAPITransactionTestCase):
+    '''The changes need to be committed, to be seen by the request while it
+    waits.'''
+    def setUp(self):
+        _, token = self.create_admin_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+    def test_wait(self):
+        '''If there are no changes, the request should wait for new
+        changes.'''
+        record_changes('user', [1])
+        since = Change.objects.get().id
+
+        def change():
+            time.sleep(0.1)
+            record_changes('user', [2])
+            connection.close()
+
+        thread = threading.Thread(target=change)
+        thread.start()
+        self.addCleanup(thread.join)
+        response = self.client.get(
+            reverse('changes'), {'since': since, 'wait': 5})
+        self.assertEqual(
+            [c['user'] for c in response.data['results']], ['2'])
@@ -0,0 +1,41 @@
+from django.db import connection
+
+from authapi.db import explain, record_queries, rolled_back
+from authapi.models import SeedOrganization
+from authapi.tests.base import AuthAPITestCase
+
+
+class DatabaseTests(AuthAPITestCase):
+    def test_record_queries(self):
+        '''The queries made in the block should be counted and timed.'''
+        with record_queries() as stats:
+            SeedOrganization.objects.count()
+            SeedOrganization.objects.exists()
+        SeedOrganization.objects.count()
+        self.assertEqual(stats.count, 2)
+        self.assertGreater(stats.duration, 0)
+
+    def test_record_queries_stats(self):
+        '''Queries should be added to the given stats.'''
+        with record_queries() as stats:
+            SeedOrganization.objects.count()
+        with record_queries(stats):
+            SeedOrganization.objects.count()
+        self.assertEqual(stats.count, 2)
+
+    def test_rolled_back(self):
+        '''Changes made in the block should be rolled back.'''
+        with rolled_back():
+            SeedOrganization.objects.create(title='foo')
+            self.assertEqual(SeedOrganization.objects.count(), 1)
+        self.assertEqual(SeedOrganization.objects.count(), 0)
+
+    def test_explain(self):
+        '''The plan of the queryset should be returned.'''
+        if connection.vendor != 'postgresql':
+            self.skipTest('EXPLAIN (FORMAT JSON) needs PostgreSQL')
+        queryset = SeedOrganization.objects.all()
+        plan = explain(queryset)
+        self.assertIn('Plan Rows', plan['Plan'])
+        self.assertNotIn('Execution Time', plan)
+        self.assertIn('Execution Time', explain(queryset, analyze=True))
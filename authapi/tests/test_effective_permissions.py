@@ -0,0 +1,236 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.utils.six import StringIO
+
+from authapi.models import (
+    SeedOrganization, SeedPermission, SeedTeam, UserEffectivePermission)
+from authapi.tests.base import AuthAPITestCase
+from authapi.utils import get_user_permissions
+
+
+class UserEffectivePermissionTests(AuthAPITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('foo@bar.org')
+        self.org = SeedOrganization.objects.create()
+        self.team = SeedTeam.objects.create(organization=self.org)
+        self.permission = self.team.permissions.create(
+            type='foo', namespace='bar')
+        self.team.users.add(self.user)
+
+    def assert_effective(self, *rows):
+        '''Asserts that the table contains exactly the given (team, user,
+        permission) rows, and that it is consistent.'''
+        self.assertEqual(
+            set(UserEffectivePermission.objects.values_list(
+                'team', 'user', 'permission')),
+            set((t.pk, u.pk, p.pk) for t, u, p in rows))
+        self.assertEqual(
+            UserEffectivePermission.objects.verify(), (set(), set()))
+
+    def test_team_users(self):
+        '''Adding and removing users from teams should add and remove their
+        permissions.'''
+        user = User.objects.create_user('bar@bar.org')
+        self.team.users.add(user)
+        self.assert_effective(
+            (self.team, self.user, self.permission),
+            (self.team, user, self.permission))
+        user.seedteam_set.remove(self.team)
+        self.assert_effective((self.team, self.user, self.permission))
+        user.seedteam_set.add(self.team)
+        user.seedteam_set.clear()
+        self.assert_effective((self.team, self.user, self.permission))
+        self.team.users.clear()
+        self.assert_effective()
+
+    def test_team_permissions(self):
+        '''Adding and removing permissions from teams should add and remove
+        them for the users of the team.'''
+        permission = self.team.permissions.create(type='bar', namespace='bar')
+        self.assert_effective(
+            (self.team, self.user, self.permission),
+            (self.team, self.user, permission))
+        permission.seedteam_set.remove(self.team)
+        self.assert_effective((self.team, self.user, self.permission))
+        permission.seedteam_set.add(self.team)
+        permission.seedteam_set.clear()
+        self.assert_effective((self.team, self.user, self.permission))
+        self.team.permissions.clear()
+        self.assert_effective()
+
+    def test_multiple_teams(self):
+        '''A permission granted through multiple teams should only be removed
+        for the team that it is removed from.'''
+        team = SeedTeam.objects.create(organization=self.org)
+        team.permissions.add(self.permission)
+        team.users.add(self.user)
+        team.users.remove(self.user)
+        self.assert_effective((self.team, self.user, self.permission))
+
+    def test_archive_team(self):
+        self.team.archived = True
+        self.team.save()
+        self.assert_effective()
+        self.team.archived = False
+        self.team.save()
+        self.assert_effective((self.team, self.user, self.permission))
+
+    def test_archive_organization(self):
+        self.org.archived = True
+        self.org.save()
+        self.assert_effective()
+        self.team.users.add(User.objects.create_user('bar@bar.org'))
+        self.assert_effective()
+        self.org.archived = False
+        self.org.save()
+        self.assertEqual(UserEffectivePermission.objects.count(), 2)
+        self.assert_effective(*[
+            (self.team, u, self.permission) for u in self.team.users.all()])
+
+    def test_move_team(self):
+        '''Moving a team to an archived organization should remove its
+        permissions.'''
+        self.team.organization = SeedOrganization.objects.create(
+            archived=True)
+        self.team.save()
+        self.assert_effective()
+
+    def test_delete(self):
+        '''Deleting any of the related objects should remove the rows.'''
+        self.permission.delete()
+        self.assert_effective()
+        self.team.permissions.create(type='foo', namespace='bar')
+        self.team.delete()
+        self.assert_effective()
+
+    def test_get_user_permissions(self):
+        '''The user's permissions should be looked up in a single query.'''
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                list(get_user_permissions(self.user)), [self.permission])
+
+    def test_rebuild_command(self):
+        '''The rebuild command should recreate the table.'''
+        UserEffectivePermission.objects.all().delete()
+        SeedPermission.objects.create(type='bar', namespace='bar')
+        out = StringIO()
+        call_command('rebuild_effective_permissions', stdout=out)
+        self.assertEqual(
+            out.getvalue(), 'Rebuilt 1 effective permissions.\n')
+        self.assert_effective((self.team, self.user, self.permission))
+
+    def test_verify_command(self):
+        '''The verify command should report differences, and fail if there
+        are any.'''
+        out = StringIO()
+        call_command(
+            'rebuild_effective_permissions', '--verify', stdout=out)
+        self.assertEqual(
+            out.getvalue(), 'Effective permissions are consistent.\n')
+
+        UserEffectivePermission.objects.all().delete()
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command(
+                'rebuild_effective_permissions', '--verify', stdout=out)
+        self.assertEqual(
+            out.getvalue(), 'Missing: team %s, user %s, permission %s\n' % (
+                self.team.pk, self.user.pk, self.permission.pk))
+
+
+class UserEffectivePermissionManagerTests(AuthAPITestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user('%d@bar.org' % i) for i in range(2)]
+        self.org = SeedOrganization.objects.create()
+        self.teams = [
+            SeedTeam.objects.create(organization=self.org) for _ in range(2)]
+        self.permissions = [
+            SeedPermission.objects.create(type=str(i), namespace='bar')
+            for i in range(2)]
+        for team in self.teams:
+            team.users.add(*self.users)
+            team.permissions.add(*self.permissions)
+        UserEffectivePermission.objects.all().delete()
+
+    def get_rows(self):
+        return set(UserEffectivePermission.objects.values_list(
+            'team', 'user', 'permission'))
+
+    def get_expected(self, teams=None, users=None, permissions=None):
+        return set(
+            (t.pk, u.pk, p.pk)
+            for t in teams or self.teams
+            for u in users or self.users
+            for p in permissions or self.permissions)
+
+    def assert_add(self, add):
+        '''Asserts that the given function of (team_ids, user_ids,
+        permission_ids) adds the selected rows, and ignores the rows that
+        already exist.'''
+        team, user, permission = (
+            self.teams[0], self.users[0], self.permissions[0])
+        add(None, [user.pk], [permission.pk])
+        self.assertEqual(self.get_rows(), self.get_expected(
+            users=[user], permissions=[permission]))
+        add([team.pk], None, None)
+        self.assertEqual(
+            self.get_rows(),
+            self.get_expected(users=[user], permissions=[permission]) |
+            self.get_expected(teams=[team]))
+        add(None, None, None)
+        self.assertEqual(self.get_rows(), self.get_expected())
+        add(None, None, None)
+        self.assertEqual(UserEffectivePermission.objects.count(), 8)
+
+    def test_add(self):
+        '''Only the rows for the given teams, users, and permissions should
+        be added, ignoring rows that already exist.'''
+        self.assert_add(UserEffectivePermission.objects.add)
+
+    def test_add_empty(self):
+        '''Empty selections shouldn't query the database.'''
+        with self.assertNumQueries(0):
+            UserEffectivePermission.objects.add(team_ids=[])
+            UserEffectivePermission.objects.add(permission_ids=[])
+        self.assertEqual(self.get_rows(), set())
+
+    def test_add_archived(self):
+        '''Rows shouldn't be added for archived teams or organizations.'''
+        self.teams[0].archived = True
+        self.teams[0].save()
+        UserEffectivePermission.objects.all().delete()
+        UserEffectivePermission.objects.add()
+        self.assertEqual(
+            self.get_rows(), self.get_expected(teams=self.teams[1:]))
+        self.org.archived = True
+        self.org.save()
+        UserEffectivePermission.objects.add()
+        self.assertEqual(self.get_rows(), set())
+
+    def test_insert_selected(self):
+        '''The selected rows should be inserted in a single query.'''
+        if connection.vendor != 'postgresql':
+            self.skipTest('INSERT ... ON CONFLICT needs PostgreSQL')
+        manager = UserEffectivePermission.objects
+
+        def add(*args):
+            with self.assertNumQueries(1):
+                manager._insert_selected(manager.get_effective_rows(*args))
+        self.assert_add(add)
+
+    def test_create_batched(self):
+        '''The selected rows should be created batch_size at a time.'''
+        manager = UserEffectivePermission.objects
+        manager.batch_size = 3
+        self.addCleanup(delattr, manager, 'batch_size')
+
+        def add(*args):
+            manager._create_batched(manager.get_effective_rows(*args))
+        self.assert_add(add)
+        UserEffectivePermission.objects.all().delete()
+        # One query to fetch, and one for each of the three batches
+        with self.assertNumQueries(4):
+            add(None, None, None)
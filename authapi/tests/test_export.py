@@ -0,0 +1,158 @@
+import csv
+import io
+import json
+import os
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+
+from authapi.export import stream_export
+from authapi.models import SeedOrganization, SeedTeam
+from authapi.tests.base import AuthAPITestCase
+
+
+class ExportTests(AuthAPITestCase):
+    def setUp(self):
+        self.admin, self.token = self.create_admin_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def get_content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def get_ndjson(self, name):
+        response = self.client.get(reverse('export', args=[name]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        return [
+            json.loads(line)
+            for line in self.get_content(response).splitlines()]
+
+    def test_users(self):
+        '''All users should be exported, including inactive users.'''
+        user = User.objects.create_user(
+            'foo@bar.org', email='foo@bar.org', first_name='Foo',
+            is_active=False)
+        rows = self.get_ndjson('users')
+        self.assertEqual(rows, [{
+            'id': str(u.pk), 'email': u.email, 'first_name': u.first_name,
+            'last_name': u.last_name, 'admin': u.is_superuser,
+            'active': u.is_active, 'date_joined': u.date_joined.isoformat(),
+        } for u in (self.admin, user)])
+
+    def test_organizations_and_teams(self):
+        '''All organizations and teams should be exported, including archived
+        ones.'''
+        org = SeedOrganization.objects.create(title='org', archived=True)
+        team = SeedTeam.objects.create(title='team', organization=org)
+
+        [org_row] = self.get_ndjson('organizations')
+        self.assertEqual(org_row['id'], str(org.pk))
+        self.assertEqual(org_row['title'], 'org')
+        self.assertEqual(org_row['archived'], True)
+        self.assertEqual(org_row['created_at'], org.created_at.isoformat())
+
+        [team_row] = self.get_ndjson('teams')
+        self.assertEqual(team_row['id'], str(team.pk))
+        self.assertEqual(team_row['organization'], str(org.pk))
+        self.assertEqual(team_row['archived'], False)
+
+    def test_permissions(self):
+        '''Each effective permission of each user should be exported once,
+        even if the user has it through more than one team.'''
+        user = User.objects.create_user('foo@bar.org')
+        team1, permission = self.add_permission(user, 'foo:bar', '2', 'foo')
+        team2 = SeedTeam.objects.create(organization=team1.organization)
+        team2.users.add(user)
+        team2.permissions.add(permission)
+        archived, _ = self.add_permission(user, 'bar:foo')
+        archived.archived = True
+        archived.save()
+
+        self.assertEqual(self.get_ndjson('permissions'), [{
+            'user': str(user.pk), 'id': str(permission.pk),
+            'type': 'foo:bar', 'object_id': '2', 'namespace': 'foo',
+        }])
+
+    def test_csv(self):
+        '''The format query parameter or the Accept header should select the
+        CSV format.'''
+        response = self.client.get(
+            reverse('export', args=['users']), {'format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(
+            response['Content-Disposition'],
+            'attachment; filename="users.csv"')
+        rows = list(csv.reader(io.StringIO(self.get_content(response))))
+        self.assertEqual(rows, [
+            ['id', 'email', 'first_name', 'last_name', 'admin', 'active',
+             'date_joined'],
+            [str(self.admin.pk), 'admin@example.org', '', '', 'True', 'True',
+             self.admin.date_joined.isoformat()],
+        ])
+
+        response = self.client.get(
+            reverse('export', args=['users']), HTTP_ACCEPT='text/csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+
+    def test_num_queries(self):
+        '''The number of queries should not depend on the number of rows.'''
+        for i in range(5):
+            self.add_permission(
+                User.objects.create_user('user%d' % i), 'foo:bar', str(i))
+        for name in ('users', 'organizations', 'teams', 'permissions'):
+            with self.assertNumQueries(1):
+                rows = list(stream_export(name, 'ndjson', chunk_size=2))
+            self.assertTrue(rows)
+
+    def test_chunks(self):
+        '''Lines should be grouped into chunks.'''
+        for i in range(4):
+            User.objects.create_user('user%d' % i)
+        chunks = list(stream_export('users', 'csv', lines_per_chunk=2))
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(len(''.join(chunks).splitlines()), 6)
+
+    def test_unknown_export(self):
+        '''Unknown exports and formats should return a 404.'''
+        response = self.client.get('/export/tokens/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(
+            reverse('export', args=['users']), {'format': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_permission(self):
+        '''Only admins should be able to export data.'''
+        _, token = self.create_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        response = self.client.get(reverse('export', args=['users']))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.credentials()
+        response = self.client.get(
+            reverse('export', args=['users']), {'format': 'csv'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(
+            response.content,
+            b'detail\r\nAuthentication credentials were not provided.\r\n')
+
+    def test_command(self):
+        '''The command should write the export to stdout, or to a file.'''
+        out = io.StringIO()
+        call_command('export_data', 'users', stdout=out)
+        [row] = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(row['email'], 'admin@example.org')
+
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        call_command(
+            'export_data', 'users', format='csv', output=path, chunk_size=1)
+        with open(path, encoding='utf-8', newline='') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][1], 'admin@example.org')
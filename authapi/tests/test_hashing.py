@@ -0,0 +1,98 @@
+import threading
+
+from django.db import connection
+
+from authapi.hashing import (
+    HASHING_LOCK_ID, HASHING_QUEUE_LOCK_ID, HashingPool, HashingPoolSaturated,
+    LocalSlots)
+from authapi.tests.base import AuthAPITestCase
+
+
+class HashingPoolTests(AuthAPITestCase):
+    def setUp(self):
+        self.pool = HashingPool(max_workers=1, max_queue=1, timeout=5)
+
+    def block_pool(self, count):
+        '''Runs count functions in the pool, each in its own thread and
+        database connection, that block until the returned event is set.'''
+        event = threading.Event()
+
+        def run():
+            try:
+                self.pool.run(event.wait)
+            finally:
+                connection.close()
+
+        self.threads = [threading.Thread(target=run) for _ in range(count)]
+        for thread in self.threads:
+            thread.start()
+        self.addCleanup(lambda: [t.join() for t in self.threads])
+        self.addCleanup(event.set)
+        return event
+
+    def test_run(self):
+        '''The result of the function should be returned.'''
+        self.assertEqual(self.pool.run(sorted, [1, 2], reverse=True), [2, 1])
+
+    def test_wait(self):
+        '''If all the slots are taken, the function should wait in the queue
+        until a slot is free.'''
+        event = self.block_pool(1)
+        self.wait_for_advisory_locks(HASHING_LOCK_ID, 1)
+        timer = threading.Timer(0.1, event.set)
+        timer.start()
+        self.addCleanup(timer.join)
+        self.assertEqual(self.pool.run(sum, [1]), 1)
+
+    def test_saturated(self):
+        '''If the maximum number of hashes are running, and the queue is
+        full, an exception should be raised instead of waiting.'''
+        event = self.block_pool(2)
+        self.wait_for_advisory_locks(HASHING_LOCK_ID, 1)
+        self.wait_for_advisory_locks(HASHING_QUEUE_LOCK_ID, 1)
+        self.assertRaises(HashingPoolSaturated, self.pool.run, sum, [1])
+
+        event.set()
+        for thread in self.threads:
+            thread.join()
+        self.assertEqual(self.pool.run(sum, [1]), 1)
+
+    def test_timeout(self):
+        '''If the function waits for longer than the timeout, an exception
+        should be raised, and the transaction should still be usable.'''
+        self.pool.timeout = 0.01
+        self.block_pool(1)
+        self.wait_for_advisory_locks(HASHING_LOCK_ID, 1)
+        self.assertRaises(HashingPoolSaturated, self.pool.run, sum, [1])
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+    def test_other_processes(self):
+        '''Slots taken by other processes, through other database
+        connections, should count towards the limits.'''
+        other = connection.get_new_connection(
+            connection.get_connection_params())
+        self.addCleanup(other.close)
+        with other.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_advisory_lock(%s, 0), pg_advisory_lock(%s, 0)',
+                [HASHING_LOCK_ID, HASHING_QUEUE_LOCK_ID])
+        self.assertRaises(HashingPoolSaturated, self.pool.run, sum, [1])
+
+        with other.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock_all()')
+        self.assertEqual(self.pool.run(sum, [1]), 1)
+
+
+class LocalSlotsTests(AuthAPITestCase):
+    def test_slots(self):
+        '''Only count slots should be able to be taken at once.'''
+        slots = LocalSlots(2)
+        first, second = slots.try_acquire(), slots.try_acquire()
+        self.assertIsNotNone(first)
+        self.assertIsNotNone(second)
+        self.assertIsNone(slots.try_acquire())
+        self.assertIsNone(slots.acquire(0, 0.01))
+        slots.release(first)
+        self.assertIsNotNone(slots.acquire(0, 0.01))
+        self.assertIsNone(LocalSlots(0).try_acquire())
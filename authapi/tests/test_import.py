@@ -0,0 +1,174 @@
+import io
+import json
+import os
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from authapi.models import SeedOrganization, SeedTeam
+from authapi.tests.base import AuthAPITestCase
+from authapi.utils import get_user_permissions
+
+
+class ImportDataTests(AuthAPITestCase):
+    def import_data(self, records, **options):
+        '''Writes the records to a file, and imports it. Returns the output
+        of the command.'''
+        fd, path = tempfile.mkstemp(suffix='.ndjson')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for record in records:
+                if not isinstance(record, str):
+                    record = json.dumps(record)
+                f.write(record + '\n')
+        out = io.StringIO()
+        options.setdefault('workers', 0)
+        call_command('import_data', path, stdout=out, **options)
+        return out.getvalue()
+
+    def test_import(self):
+        '''Records should be able to refer to earlier records by id.'''
+        output = self.import_data([
+            {'model': 'organization', 'id': 'o1', 'title': 'org'},
+            {'model': 'team', 'id': 't1', 'title': 'team',
+             'organization': 'o1'},
+            {'model': 'team', 'id': 't2', 'title': 'archived',
+             'organization': 'o1', 'archived': True},
+            {'model': 'user', 'id': 'u1', 'email': 'foo@bar.org',
+             'first_name': 'Foo', 'password': 'pass',
+             'organizations': ['o1'], 'teams': ['t1', 't2']},
+            {'model': 'user', 'email': 'admin@bar.org', 'admin': True},
+            {'model': 'permission', 'team': 't1', 'type': 'org:admin',
+             'object': {'model': 'organization', 'id': 'o1'},
+             'namespace': '__auth__'},
+            {'model': 'permission', 'team': 't2', 'type': 'foo:bar',
+             'object_id': 2, 'namespace': 'foo'},
+        ])
+        self.assertIn(
+            'Imported 1 organizations, 2 teams, 2 users and 2 permissions',
+            output)
+
+        org = SeedOrganization.objects.get()
+        team = SeedTeam.objects.get(title='team')
+        user = User.objects.get(email='foo@bar.org')
+        self.assertEqual(user.username, 'foo@bar.org')
+        self.assertEqual(user.first_name, 'Foo')
+        self.assertTrue(user.check_password('pass'))
+        self.assertEqual(list(user.seedorganization_set.all()), [org])
+        self.assertEqual(user.seedteam_set.count(), 2)
+        self.assertEqual(team.organization, org)
+
+        admin = User.objects.get(email='admin@bar.org')
+        self.assertTrue(admin.is_superuser)
+        self.assertFalse(admin.has_usable_password())
+
+        # Only the permission on the active team is effective
+        [permission] = get_user_permissions(user)
+        self.assertEqual(permission.type, 'org:admin')
+        self.assertEqual(permission.object_id, str(org.pk))
+        self.assertEqual(
+            SeedTeam.objects.get(title='archived').permissions.get().object_id,
+            '2')
+
+    def test_process_pool(self):
+        '''Passwords should be hashed in the process pool.'''
+        self.import_data([
+            {'model': 'user', 'email': 'user%d@bar.org' % i,
+             'password': 'pass%d' % i}
+            for i in range(3)], workers=2)
+        for i in range(3):
+            user = User.objects.get(email='user%d@bar.org' % i)
+            self.assertTrue(user.check_password('pass%d' % i))
+
+    def test_batches(self):
+        '''Records should be created in batches of batch_size records of the
+        same model.'''
+        records = [{'model': 'organization', 'id': 'o', 'title': 'org'}]
+        records += [
+            {'model': 'user', 'email': 'user%d@bar.org' % i,
+             'organizations': ['o']}
+            for i in range(5)]
+        output = self.import_data(records, batch_size=2, verbosity=2)
+        self.assertEqual(
+            [line.split(' (')[0] for line in output.splitlines()[:-1]], [
+                'Line 1: created 1 organizations',
+                'Line 3: created 2 users',
+                'Line 5: created 2 users',
+                'Line 6: created 1 users',
+            ])
+        self.assertEqual(SeedOrganization.objects.get().users.count(), 5)
+
+    def test_unknown_reference(self):
+        '''Referring to a record that hasn't been imported should stop the
+        import, after creating the earlier batches.'''
+        with self.assertRaisesRegex(
+                CommandError,
+                'Line 2: Unknown organization o2, it must be before this '
+                'line'):
+            self.import_data([
+                {'model': 'organization', 'id': 'o1', 'title': 'org'},
+                {'model': 'team', 'title': 'team', 'organization': 'o2'},
+            ])
+        self.assertEqual(SeedOrganization.objects.count(), 1)
+        self.assertEqual(SeedTeam.objects.count(), 0)
+
+    def test_invalid_records(self):
+        '''Invalid records should stop the import with the line number.'''
+        with self.assertRaisesRegex(CommandError, 'Line 1: Invalid JSON'):
+            self.import_data(['{'])
+        with self.assertRaisesRegex(
+                CommandError,
+                r'Line 2: model must be one of \[organization, permission, '
+                r'team, user\]'):
+            self.import_data(['', {'model': 'foo'}])
+        with self.assertRaisesRegex(CommandError, 'Line 1: email is required'):
+            self.import_data([{'model': 'user'}])
+
+    def test_invalid_types(self):
+        '''Fields of the wrong type should stop the import with the line
+        number, rather than being converted.'''
+        invalid = [
+            ({'model': 'organization', 'title': 'x', 'archived': 'yes'},
+             'archived must be true or false'),
+            ({'model': 'organization', 'title': 1}, 'title must be a string'),
+            ({'model': 'user', 'email': ['a@b.org']},
+             'email must be a string'),
+            ({'model': 'user', 'email': 'a@b.org', 'teams': 't1'},
+             'teams must be a list'),
+            ({'model': 'user', 'email': 'a@b.org', 'password': 1},
+             'password must be a string'),
+            ({'model': 'team', 'title': 'x', 'organization': True},
+             'organization must be a string or a number'),
+            ({'model': 'permission', 'type': 'foo', 'namespace': 'bar',
+              'team': 't1', 'object': 't1'}, 'object must be an object'),
+        ]
+        for record, message in invalid:
+            with self.assertRaisesRegex(CommandError, 'Line 2: ' + message):
+                self.import_data([
+                    {'model': 'organization', 'title': 'org'}, record])
+        self.assertEqual(User.objects.count(), 0)
+
+    def test_invalid_value(self):
+        '''Values that the database rejects should stop the import with the
+        line number.'''
+        with self.assertRaisesRegex(
+                CommandError, 'Line 1: Could not create the users up to line '
+                '1'):
+            self.import_data([
+                {'model': 'user', 'email': 'a' * 150 + '@bar.org'}])
+        self.assertEqual(User.objects.count(), 0)
+
+    def test_duplicate_user(self):
+        '''If a batch can't be created, none of the batch should be
+        created.'''
+        User.objects.create_user('foo@bar.org')
+        with self.assertRaisesRegex(
+                CommandError, 'Line 1: Could not create the users up to line '
+                '2'):
+            self.import_data([
+                {'model': 'user', 'email': 'bar@bar.org'},
+                {'model': 'user', 'email': 'foo@bar.org'},
+            ])
+        self.assertEqual(User.objects.count(), 1)
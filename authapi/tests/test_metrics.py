@@ -0,0 +1,148 @@
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import override_settings
+from django.urls import reverse
+from prometheus_client import REGISTRY
+
+from authapi import metrics
+from authapi.models import SeedOrganization, SeedTeam
+from authapi.tests.base import AuthAPITestCase
+
+
+class MetricsTests(AuthAPITestCase):
+    def get_value(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def assert_increases(self, name, labels, func, by=1):
+        before = self.get_value(name, **labels)
+        result = func()
+        self.assertEqual(self.get_value(name, **labels) - before, by)
+        return result
+
+    def test_metrics_view(self):
+        '''The metrics should be returned in the Prometheus text format.'''
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        content = response.content.decode('utf-8')
+        self.assertIn('# TYPE authapi_request_duration_seconds histogram', (
+            content))
+        self.assertIn('# TYPE authapi_page_size histogram', content)
+
+    @override_settings(METRICS={'TOKEN': 'secret'})
+    def test_metrics_view_token(self):
+        '''If a token is configured, it should be needed to get the
+        metrics.'''
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+        response = self.client.get(
+            '/metrics', HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 401)
+        response = self.client.get(
+            '/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+    def test_requests(self):
+        '''The duration, status, and database queries of requests should be
+        recorded by route name.'''
+        _, token = self.create_admin_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        org = SeedOrganization.objects.create()
+        SeedTeam.objects.create(organization=org)
+        SeedTeam.objects.create(organization=org)
+        route = {'route': 'seedteam-list'}
+
+        queries_before = self.get_value(
+            'authapi_request_db_queries_sum', **route)
+        page_sizes_before = self.get_value(
+            'authapi_page_size_sum', mode='page', **route)
+        self.assert_increases(
+            'authapi_request_duration_seconds_count',
+            dict(route, method='GET'),
+            lambda: self.client.get(reverse('seedteam-list')))
+        self.assertGreater(self.get_value(
+            'authapi_request_db_queries_sum', **route), queries_before)
+        self.assertEqual(self.get_value(
+            'authapi_page_size_sum', mode='page', **route),
+            page_sizes_before + 2)
+
+        self.assert_increases(
+            'authapi_requests_total',
+            {'route': 'seedteam-detail', 'method': 'GET', 'status': '404'},
+            lambda: self.client.get(reverse('seedteam-detail', args=[0])))
+        self.assert_increases(
+            'authapi_requests_total',
+            {'route': 'unmatched', 'method': 'GET', 'status': '404'},
+            lambda: self.client.get('/foo/bar/'))
+        self.assert_increases(
+            'authapi_requests_total',
+            {'route': 'unmatched', 'method': 'other', 'status': '404'},
+            lambda: self.client.generic('FOO', '/foo/bar/'))
+
+    @override_settings(TOKEN_CACHE={
+        'BACKEND': 'authapi.cache.LocalMemoryCache'})
+    def test_token_lookups(self):
+        '''Token lookups, and the token cache hits and misses, should be
+        counted.'''
+        _, token = self.create_user()
+        url = reverse('get-user-permissions')
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token foo')
+        self.assert_increases(
+            'authapi_token_lookups_total', {'result': 'invalid'},
+            lambda: self.client.get(url))
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        self.assert_increases(
+            'authapi_token_lookups_total', {'result': 'database'},
+            lambda: self.client.get(url))
+        self.assert_increases(
+            'authapi_token_lookups_total', {'result': 'cached'},
+            lambda: self.client.get(url))
+        self.assert_increases(
+            'authapi_cache_lookups_total',
+            {'cache': 'TOKEN_CACHE', 'result': 'hit'},
+            lambda: self.client.get(url))
+
+    def test_password_hashing(self):
+        '''The time taken to hash passwords for logins should be
+        recorded.'''
+        self.create_user(email='user@example.org', password='password')
+        self.assert_increases(
+            'authapi_password_hashing_seconds_count', {},
+            lambda: self.client.post(reverse('create-token'), {
+                'email': 'user@example.org', 'password': 'password'}))
+
+    def test_db_connections(self):
+        self.assert_increases(
+            'authapi_db_connections_opened_total', {'alias': 'default'},
+            lambda: connection_created.send(
+                sender=connection.__class__, connection=connection))
+
+    def test_multiple_processes(self):
+        '''With a metrics directory, the metrics of all of the processes
+        should be added up.'''
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        env = dict(os.environ, **{metrics.MULTIPROC_DIR_ENV: directory.name})
+        code = (
+            'from authapi.metrics import REQUESTS; '
+            'REQUESTS.labels("foo", "GET", 200).inc()')
+        root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        for _ in range(2):
+            subprocess.check_call(
+                [sys.executable, '-c', code], env=env, cwd=root)
+
+        with mock.patch.dict(os.environ, env):
+            registry = metrics.get_registry()
+        self.assertEqual(registry.get_sample_value(
+            'authapi_requests_total',
+            {'route': 'foo', 'method': 'GET', 'status': '200'}), 2)
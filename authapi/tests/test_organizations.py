@@ -144,6 +144,34 @@ class OrganizationTests(AuthAPITestCase):
         response = self.client.get(reverse('seedorganization-list'))
         self.assertEqual(len(response.data[0]['users']), 0)
 
+    def test_get_organization_list_num_queries(self):
+        '''The number of queries for the list of organizations should not
+        depend on the number of organizations, teams, or users.'''
+        _, token = self.create_admin_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        url = reverse('seedorganization-list')
+
+        def create_organization(i):
+            org = SeedOrganization.objects.create()
+            SeedTeam.objects.create(organization=org)
+            SeedTeam.objects.create(organization=org, archived=True)
+            org.users.add(User.objects.create_user('user%d' % i))
+
+        create_organization(0)
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data), 1)
+
+        for i in range(1, 5):
+            create_organization(i)
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual(
+            [len(o['teams']) for o in response.data], [1] * 5)
+        self.assertEqual(
+            [len(o['users']) for o in response.data], [1] * 5)
+
     def test_create_organization_no_required(self):
         '''If the POST request is missing required field, an error should be
         returned.'''
@@ -186,6 +214,43 @@ class OrganizationTests(AuthAPITestCase):
             instance=organization, context=context)
         self.assertEqual(response.data, expected.data)
 
+    def test_get_organization_not_modified(self):
+        '''If the ETag in If-None-Match matches, a 304 response should be
+        returned, until the organization or its members change.'''
+        _, token = self.create_admin_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        org = SeedOrganization.objects.create(title='test org')
+        url = reverse('seedorganization-detail', args=[org.id])
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(4):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+        user = User.objects.create_user('foo@bar.org')
+        org.users.add(user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        etag = response['ETag']
+
+        SeedTeam.objects.create(organization=org)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        org.title = 'new title'
+        org.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_delete_organization(self):
         '''A DELETE request on an organization should archive it.'''
         _, token = self.create_admin_user()
@@ -554,6 +619,103 @@ class OrganizationUserTests(AuthAPITestCase):
         resp = self.client.delete(url)
         self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
 
+    def test_bulk_add_users_to_organization(self):
+        '''Adding a list of users to an organization should add all of the
+        existing users, and give a result for each user.'''
+        _, token = self.create_admin_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        org = SeedOrganization.objects.create()
+        users = [
+            User.objects.create_user('user%d@example.org' % i)
+            for i in range(3)]
+        org.users.add(users[0])
+        missing = users[-1].pk + 100
+
+        response = self.client.post(
+            reverse('seedorganization-users-add', args=[org.pk]),
+            data={'users': [users[0].pk, users[1].pk, missing, users[2].pk]})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'results': [
+            {'id': str(users[0].pk), 'status': 204},
+            {'id': str(users[1].pk), 'status': 204},
+            {'id': str(missing), 'status': 404},
+            {'id': str(users[2].pk), 'status': 204},
+        ]})
+        self.assertEqual(
+            sorted(u.pk for u in org.users.all()),
+            [u.pk for u in users])
+
+    def test_bulk_add_users_to_organization_num_queries(self):
+        '''The number of queries shouldn't depend on the number of users.'''
+        _, token = self.create_admin_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        org = SeedOrganization.objects.create()
+        User.objects.bulk_create(
+            User(username='user%d@example.org' % i) for i in range(100))
+        user_ids = list(User.objects.values_list('pk', flat=True))
+
+        with self.assertNumQueries(5):
+            response = self.client.post(
+                reverse('seedorganization-users-add', args=[org.pk]),
+                data={'users': user_ids})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(org.users.count(), len(user_ids))
+
+    def test_bulk_remove_users_from_organization(self):
+        '''Removing a list of users from an organization should remove all of
+        the users.'''
+        _, token = self.create_admin_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        org = SeedOrganization.objects.create()
+        user1 = User.objects.create_user('user1@example.org')
+        user2 = User.objects.create_user('user2@example.org')
+        org.users.add(user1, user2)
+
+        response = self.client.post(
+            reverse('seedorganization-users-remove', args=[org.pk]),
+            data={'users': [user1.pk]})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'results': [
+            {'id': str(user1.pk), 'status': 204},
+        ]})
+        self.assertEqual(list(org.users.all()), [user2])
+
+    def test_bulk_users_organization_invalid(self):
+        '''The list of users must be a list of user ids.'''
+        _, token = self.create_admin_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        org = SeedOrganization.objects.create()
+
+        response = self.client.post(
+            reverse('seedorganization-users-add', args=[org.pk]),
+            data={'users': ['foo']})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_permission_bulk_users_organization(self):
+        '''Only admins and users with org:admin for the organization should
+        be able to add and remove lists of users.'''
+        org1 = SeedOrganization.objects.create()
+        org2 = SeedOrganization.objects.create()
+        user = User.objects.create_user('user@example.org')
+        authuser, token = self.create_user()
+        self.add_permission(authuser, 'org:admin', org1.pk)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+        for name in ('add', 'remove'):
+            response = self.client.post(
+                reverse('seedorganization-users-%s' % name, args=[org1.pk]),
+                data={'users': [user.pk]})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            response = self.client.post(
+                reverse('seedorganization-users-%s' % name, args=[org2.pk]),
+                data={'users': [user.pk]})
+            self.assertEqual(
+                response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(org2.users.count(), 0)
+
 
 class OrganizationTeamTests(AuthAPITestCase):
     def setUp(self):
@@ -1,10 +1,15 @@
+from datetime import timedelta
+from unittest import skipUnless
+
+from django.db import connection
 from rest_framework.generics import ListAPIView
 from rest_framework.test import APITestCase
 from rest_framework.test import APIRequestFactory
 
 from authapi.serializers import OrganizationSummarySerializer
 from authapi.models import SeedOrganization
-from authapi.pagination import LinkHeaderPagination
+from authapi.pagination import (
+    LinkHeaderPagination, SelectableLinkHeaderPagination)
 
 
 class DummyView(ListAPIView):
@@ -69,3 +74,189 @@ class LinkHeaderPaginationTests(APITestCase):
         resp = self.handle(self.requests.get('/?page=1&page_size=2'))
 
         self.assertTrue('Link' not in resp)
+
+
+class CursorDummyView(DummyView):
+    pagination_class = SelectableLinkHeaderPagination
+
+
+class SelectableLinkHeaderPaginationTests(APITestCase):
+    def setUp(self):
+        self.requests = APIRequestFactory()
+
+    def handle(self, req, **attrs):
+        view = type('View', (CursorDummyView,), attrs)
+        resp = view.as_view()(req)
+        resp.render()
+        return resp
+
+    def get_link(self, resp, rel):
+        '''Returns the url for the given relation from the Link header.'''
+        for link in resp['Link'].split(', '):
+            url, link_rel = link.split('; ')
+            if link_rel == 'rel="%s"' % rel:
+                return url[1:-1]
+
+    def test_page_by_default(self):
+        '''The paginator should use page number pagination by default'''
+        for _ in range(3):
+            SeedOrganization.objects.create()
+
+        resp = self.handle(self.requests.get('/?page_size=2'))
+
+        self.assertEqual(
+            resp['Link'],
+            '<http://testserver/?page=2&page_size=2>; rel="next"')
+
+    def test_cursor_pages(self):
+        '''The paginator should seek through all the results using the
+        cursor in the Link header'''
+        orgs = [SeedOrganization.objects.create() for _ in range(5)]
+
+        resp = self.handle(
+            self.requests.get('/?pagination=cursor&page_size=2'))
+        ids = [int(o['id']) for o in resp.data]
+        self.assertEqual(ids, [orgs[0].id, orgs[1].id])
+        self.assertEqual(self.get_link(resp, 'prev'), None)
+
+        next_url = self.get_link(resp, 'next')
+        self.assertTrue('cursor=' in next_url)
+        resp = self.handle(self.requests.get(next_url))
+        ids = [int(o['id']) for o in resp.data]
+        self.assertEqual(ids, [orgs[2].id, orgs[3].id])
+        self.assertNotEqual(self.get_link(resp, 'prev'), None)
+
+        resp = self.handle(self.requests.get(self.get_link(resp, 'next')))
+        ids = [int(o['id']) for o in resp.data]
+        self.assertEqual(ids, [orgs[4].id])
+        self.assertEqual(self.get_link(resp, 'next'), None)
+
+    def test_cursor_no_next_no_prev(self):
+        '''The paginator should not set the Link header if there is not a next
+        or previous page'''
+        SeedOrganization.objects.create()
+
+        resp = self.handle(self.requests.get('/?pagination=cursor'))
+
+        self.assertTrue('Link' not in resp)
+
+    def test_cursor_view_mode(self):
+        '''The view should be able to select cursor pagination'''
+        for _ in range(3):
+            SeedOrganization.objects.create()
+
+        resp = self.handle(
+            self.requests.get('/?page_size=2'), pagination_mode='cursor')
+
+        self.assertTrue('cursor=' in self.get_link(resp, 'next'))
+
+    def test_cursor_ordering(self):
+        '''The ordering query parameter should select the ordering for the
+        cursor, and be kept in the Link header'''
+        orgs = [SeedOrganization.objects.create() for _ in range(3)]
+        SeedOrganization.objects.filter(pk=orgs[0].pk).update(
+            created_at=orgs[2].created_at + timedelta(seconds=1))
+
+        resp = self.handle(self.requests.get(
+            '/?pagination=cursor&ordering=created_at&page_size=2'))
+        ids = [int(o['id']) for o in resp.data]
+        self.assertEqual(ids, [orgs[1].id, orgs[2].id])
+
+        next_url = self.get_link(resp, 'next')
+        self.assertTrue('ordering=created_at' in next_url)
+        resp = self.handle(self.requests.get(next_url))
+        ids = [int(o['id']) for o in resp.data]
+        self.assertEqual(ids, [orgs[0].id])
+
+    def test_cursor_view_ordering(self):
+        '''The view should be able to select the default cursor ordering'''
+        orgs = [SeedOrganization.objects.create() for _ in range(2)]
+        SeedOrganization.objects.filter(pk=orgs[0].pk).update(
+            created_at=orgs[1].created_at + timedelta(seconds=1))
+
+        resp = self.handle(
+            self.requests.get('/?pagination=cursor'),
+            cursor_ordering='created_at')
+        ids = [int(o['id']) for o in resp.data]
+        self.assertEqual(ids, [orgs[1].id, orgs[0].id])
+
+    def test_invalid_ordering(self):
+        '''An invalid ordering should result in a validation error'''
+        resp = self.handle(
+            self.requests.get('/?pagination=cursor&ordering=title'))
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.data, {
+            'ordering': ['Must be one of [created_at, id]'],
+        })
+
+    def test_invalid_mode(self):
+        '''An invalid pagination mode should result in a validation error'''
+        resp = self.handle(self.requests.get('/?pagination=offset'))
+
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.data, {
+            'pagination': ['Must be one of [cursor, page]'],
+        })
+
+    def test_no_count(self):
+        '''The paginator should not count the results, and fetch the page in a
+        single query'''
+        for _ in range(3):
+            SeedOrganization.objects.create()
+
+        with self.assertNumQueries(1):
+            resp = self.handle(self.requests.get('/?page=1&page_size=2'))
+        self.assertEqual(len(resp.data), 2)
+
+    def test_last_page(self):
+        '''The last page should be returned for page=last, counting the
+        results to find it'''
+        for _ in range(5):
+            SeedOrganization.objects.create()
+
+        with self.assertNumQueries(2):
+            resp = self.handle(self.requests.get('/?page=last&page_size=2'))
+        self.assertEqual(len(resp.data), 1)
+        self.assertEqual(
+            resp['Link'],
+            '<http://testserver/?page=2&page_size=2>; rel="prev"')
+
+    def test_last_page_empty(self):
+        '''The last page of no results should be the empty first page'''
+        resp = self.handle(self.requests.get('/?page=last'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data, [])
+
+    def test_page_out_of_range(self):
+        '''The paginator should return a 404 for an empty page after the first
+        page'''
+        SeedOrganization.objects.create()
+
+        resp = self.handle(self.requests.get('/?page=2'))
+        self.assertEqual(resp.status_code, 404)
+
+        resp = self.handle(self.requests.get('/?page=0'))
+        self.assertEqual(resp.status_code, 404)
+
+    def test_empty_first_page(self):
+        '''The paginator should return an empty first page if there are no
+        results'''
+        resp = self.handle(self.requests.get('/'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data, [])
+        self.assertTrue('Link' not in resp)
+
+    @skipUnless(
+        connection.vendor == 'postgresql', 'Estimates require PostgreSQL')
+    def test_estimated_count(self):
+        '''The paginator should return the estimated number of results in a
+        header if it is asked for'''
+        for _ in range(3):
+            SeedOrganization.objects.create()
+
+        resp = self.handle(self.requests.get('/?page_size=2'))
+        self.assertTrue('X-Estimated-Count' not in resp)
+
+        resp = self.handle(self.requests.get('/?estimate_count=true'))
+        self.assertTrue(int(resp['X-Estimated-Count']) >= 0)
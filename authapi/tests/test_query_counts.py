@@ -0,0 +1,56 @@
+import json
+import os
+
+from django.core.cache import cache
+
+from authapi.benchmark import count_queries, seed_dataset
+from authapi.db import rolled_back
+from authapi.tests.base import AuthAPITestCase
+
+
+# The query counts of the large dataset. To update it after an intended
+# change, run the tests with UPDATE_QUERY_COUNTS=1, and review the diff.
+BASELINE = os.path.join(os.path.dirname(__file__), 'query_counts.json')
+
+SMALL = dict(
+    organizations=2, teams_per_organization=2, users=3, teams_per_user=1,
+    permissions_per_team=1)
+LARGE = dict(
+    organizations=5, teams_per_organization=10, users=40, teams_per_user=4,
+    permissions_per_team=3)
+
+
+class QueryCountTests(AuthAPITestCase):
+    def get_query_counts(self, sizes):
+        '''Returns the query counts of each endpoint for a dataset of the
+        given sizes, which is rolled back afterwards.'''
+        with rolled_back():
+            counts = count_queries(seed_dataset(**sizes))
+        cache.clear()
+        return counts
+
+    def test_no_growth(self):
+        '''The number of queries made by each endpoint shouldn't depend on
+        the number of objects that it returns.'''
+        small = self.get_query_counts(SMALL)
+        large = self.get_query_counts(LARGE)
+        grown = dict(
+            (name, (small[name], count)) for name, count in large.items()
+            if count > small[name])
+        self.assertEqual(
+            grown, {}, 'Query counts grew with the dataset (small, large)')
+
+    def test_baseline(self):
+        '''The number of queries made by each endpoint should match the
+        baseline.'''
+        counts = self.get_query_counts(LARGE)
+        if os.environ.get('UPDATE_QUERY_COUNTS'):
+            with open(BASELINE, 'w') as f:
+                json.dump(counts, f, indent=2)
+                f.write('\n')
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+        self.assertEqual(
+            dict(counts), baseline,
+            'Query counts differ from %s. If this is intended, run the tests '
+            'with UPDATE_QUERY_COUNTS=1 to update it.' % (BASELINE,))
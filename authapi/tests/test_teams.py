@@ -5,8 +5,9 @@ from rest_framework import status
 from authapi.serializers import (
     TeamSerializer, OrganizationSummarySerializer, TeamSummarySerializer,
     PermissionSerializer, UserSummarySerializer)
-from authapi.models import SeedTeam, SeedOrganization, SeedPermission
+from authapi.models import Change, SeedTeam, SeedOrganization, SeedPermission
 from authapi.tests.base import AuthAPITestCase
+from authapi.utils import get_user_permissions
 
 
 class TeamTests(AuthAPITestCase):
@@ -304,6 +305,82 @@ class TeamTests(AuthAPITestCase):
         [resp_team] = response.data
         self.assertTrue(str(team.pk), resp_team['id'])
 
+    def test_permissions_team_list_no_access(self):
+        '''Teams that a user has no access to should not be displayed on the
+        list, even if the user has access to other teams, or has permissions
+        for the team in another namespace.'''
+        url = reverse('seedteam-list')
+
+        user, token = self.create_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+        org = SeedOrganization.objects.create()
+        team1 = SeedTeam.objects.create(organization=org)
+        team2 = SeedTeam.objects.create(organization=org)
+        team1.users.add(user)
+        self.add_permission(user, 'team:admin', team2.pk, namespace='foo')
+        response = self.client.get(url)
+        ids = [t['id'] for t in response.data]
+        self.assertTrue(str(team1.pk) in ids)
+        self.assertTrue(str(team2.pk) not in ids)
+
+    def test_permissions_team_list_paginated(self):
+        '''The teams that a user has access to should be paginated.'''
+        url = reverse('seedteam-list')
+
+        user, token = self.create_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+        org = SeedOrganization.objects.create()
+        org.users.add(user)
+        for _ in range(3):
+            SeedTeam.objects.create(organization=org)
+        SeedTeam.objects.create(organization=SeedOrganization.objects.create())
+
+        response = self.client.get(url, {'page_size': 2})
+        self.assertEqual(len(response.data), 2)
+        self.assertTrue('rel="next"' in response['Link'])
+
+        response = self.client.get(url, {'page_size': 2, 'page': 2})
+        self.assertEqual(len(response.data), 1)
+        self.assertTrue('Link' in response)
+        self.assertFalse('rel="next"' in response['Link'])
+
+    def test_get_team_list_num_queries(self):
+        '''The number of queries for the list of teams should not depend on
+        the number of teams, users, or permissions.'''
+        user, token = self.create_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        org = SeedOrganization.objects.create()
+        org.users.add(user)
+
+        def create_team(i):
+            team = SeedTeam.objects.create(organization=org)
+            team.users.add(User.objects.create_user('user%d' % i))
+            team.users.add(User.objects.create_user(
+                'inactive%d' % i, is_active=False))
+            team.permissions.create(type='foo', namespace='bar')
+
+        for url in [
+                reverse('seedteam-list'),
+                reverse('seedorganization-teams-list', args=[org.pk])]:
+            SeedTeam.objects.all().delete()
+            create_team(0)
+            with self.assertNumQueries(4):
+                response = self.client.get(url)
+            self.assertEqual(len(response.data), 1)
+
+            for i in range(1, 5):
+                create_team(i)
+            with self.assertNumQueries(4):
+                response = self.client.get(url)
+            self.assertEqual(len(response.data), 5)
+            for team in response.data:
+                self.assertEqual(len(team['users']), 1)
+                self.assertEqual(len(team['permissions']), 1)
+                self.assertEqual(team['organization']['id'], str(org.pk))
+            User.objects.exclude(pk=user.pk).delete()
+
     def test_create_team(self):
         '''Creating teams on this endpoint should not be allowed.'''
         _, token = self.create_admin_user()
@@ -496,6 +573,44 @@ class TeamTests(AuthAPITestCase):
         expected = TeamSerializer(instance=team, context=context)
         self.assertEqual(response.data, expected.data)
 
+    def test_get_team_not_modified(self):
+        '''If the ETag in If-None-Match matches, a 304 response should be
+        returned, until the team, its permissions, or its members change.'''
+        _, token = self.create_admin_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        organization = SeedOrganization.objects.create()
+        team = SeedTeam.objects.create(organization=organization)
+        url = reverse('seedteam-detail', args=[team.id])
+
+        response = self.client.get(url)
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        permission = team.permissions.create(type='foo', namespace='bar')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        etag = response['ETag']
+        last_modified = response['Last-Modified']
+
+        user = User.objects.create_user('foo@bar.org')
+        team.users.add(user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        # Membership changes don't change Last-Modified, so it is not used
+        self.assertEqual(response['Last-Modified'], last_modified)
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        permission.type = 'foo:bar'
+        permission.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_permission_get_team_unauthorized(self):
         '''Only authorized users should be able to access team details.'''
         org = SeedOrganization.objects.create()
@@ -947,6 +1062,182 @@ class TeamTests(AuthAPITestCase):
                     args=[team.id, permission.id]))
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
+    def test_bulk_add_permissions_to_team(self):
+        '''Adding a list of permissions to a team should create all of the
+        permissions, link them to the team, and give them to the members of
+        the team.'''
+        _, token = self.create_admin_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        org = SeedOrganization.objects.create()
+        team = SeedTeam.objects.create(organization=org)
+        user = User.objects.create_user('user@example.org')
+        team.users.add(user)
+
+        data = {'permissions': [
+            {'type': 'foo:bar', 'object_id': str(i), 'namespace': 'foo'}
+            for i in range(50)
+        ]}
+        with self.assertNumQueries(9):
+            response = self.client.post(
+                reverse('seedteam-permissions-add', args=[team.pk]),
+                data=data)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        permissions = SeedPermission.objects.order_by('pk')
+        self.assertEqual(response.data, [
+            {
+                'id': str(p.pk),
+                'type': p.type,
+                'object_id': p.object_id,
+                'namespace': p.namespace,
+            } for p in permissions])
+        self.assertEqual(
+            [p['object_id'] for p in response.data],
+            [p['object_id'] for p in data['permissions']])
+        self.assertEqual(team.permissions.count(), 50)
+        self.assertEqual(get_user_permissions(user).count(), 50)
+
+    def test_bulk_add_permissions_invalid(self):
+        '''If any of the permissions are invalid, none should be added.'''
+        _, token = self.create_admin_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        org = SeedOrganization.objects.create()
+        team = SeedTeam.objects.create(organization=org)
+
+        response = self.client.post(
+            reverse('seedteam-permissions-add', args=[team.pk]),
+            data={'permissions': [
+                {'type': 'foo', 'namespace': 'bar'},
+                {'type': 'foo'},
+            ]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(SeedPermission.objects.count(), 0)
+
+    def test_permission_bulk_add_permissions(self):
+        '''Users with team:admin for a team should be able to add a list of
+        permissions to it, but if any of the permissions can't be added by
+        the user, none should be added. Each distinct permission is only
+        checked once.'''
+        user, token = self.create_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        org = SeedOrganization.objects.create()
+        team = SeedTeam.objects.create(organization=org)
+        team2, _ = self.add_permission(user, 'team:admin', team.pk)
+        url = reverse('seedteam-permissions-add', args=[team.pk])
+        count = SeedPermission.objects.count()
+
+        response = self.client.post(url, data={'permissions': [
+            {'type': 'team:admin', 'object_id': team.pk,
+             'namespace': '__auth__'},
+            {'type': 'team:admin', 'object_id': team2.pk,
+             'namespace': '__auth__'},
+        ]})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(SeedPermission.objects.count(), count)
+
+        with self.assertNumQueries(10):
+            response = self.client.post(url, data={'permissions': [
+                {'type': 'team:admin', 'object_id': team.pk,
+                 'namespace': '__auth__'},
+            ] * 10})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(team.permissions.count(), 10)
+
+    def test_bulk_remove_permissions_from_team(self):
+        '''Removing a list of permissions from a team should delete the
+        permissions, remove them from the members of the team, and give a
+        result for each permission.'''
+        _, token = self.create_admin_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        org = SeedOrganization.objects.create()
+        team = SeedTeam.objects.create(organization=org)
+        team2 = SeedTeam.objects.create(organization=org)
+        user = User.objects.create_user('user@example.org')
+        team.users.add(user)
+        permissions = [
+            team.permissions.create(type='foo', namespace='bar')
+            for _ in range(3)]
+        other = team2.permissions.create(type='foo', namespace='bar')
+
+        response = self.client.post(
+            reverse('seedteam-permissions-remove', args=[team.pk]),
+            data={'permissions': [
+                permissions[0].pk, other.pk, permissions[1].pk]})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'results': [
+            {'id': str(permissions[0].pk), 'status': 204},
+            {'id': str(other.pk), 'status': 404},
+            {'id': str(permissions[1].pk), 'status': 204},
+        ]})
+        self.assertEqual(
+            list(SeedPermission.objects.order_by('pk')),
+            [permissions[2], other])
+        self.assertEqual(
+            list(get_user_permissions(user)), [permissions[2]])
+
+    def test_bulk_remove_permissions_queries(self):
+        '''The number of queries made to remove a list of permissions
+        shouldn't depend on the number of permissions.'''
+        _, token = self.create_admin_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        org = SeedOrganization.objects.create()
+        team = SeedTeam.objects.create(organization=org)
+        team.users.add(User.objects.create_user('user@example.org'))
+        url = reverse('seedteam-permissions-remove', args=[team.pk])
+
+        for count in (1, 10):
+            permissions = [
+                team.permissions.create(type='foo', namespace='bar')
+                for _ in range(count)]
+            with self.assertNumQueries(14):
+                response = self.client.post(url, data={
+                    'permissions': [p.pk for p in permissions]})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(SeedPermission.objects.count(), 0)
+
+    def test_delete_permissions_shared_teams(self):
+        '''Deleting permissions that other teams have should still remove
+        them from, and record changes for, the users of those teams.'''
+        org = SeedOrganization.objects.create()
+        team = SeedTeam.objects.create(organization=org)
+        team2 = SeedTeam.objects.create(organization=org)
+        user = User.objects.create_user('user@example.org')
+        team2.users.add(user)
+        permission = team.permissions.create(type='foo', namespace='bar')
+        team2.permissions.add(permission)
+        self.run_commit_hooks()
+        latest = Change.objects.latest_seq()
+
+        SeedPermission.objects.filter(pk=permission.pk).delete()
+        self.run_commit_hooks()
+        self.assertEqual(list(get_user_permissions(user)), [])
+        self.assertEqual(
+            list(Change.objects.filter(id__gt=latest).values_list(
+                'user_id', flat=True)), [user.pk])
+
+    def test_permission_bulk_remove_permissions(self):
+        '''Users with team:admin for a team should not be able to remove
+        org:admin permissions from it.'''
+        user, token = self.create_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        org = SeedOrganization.objects.create()
+        team = SeedTeam.objects.create(organization=org)
+        self.add_permission(user, 'team:admin', team.pk)
+        foo = team.permissions.create(type='foo', namespace='bar')
+        org_admin = team.permissions.create(
+            type='org:admin', object_id=org.pk, namespace='__auth__')
+        url = reverse('seedteam-permissions-remove', args=[team.pk])
+
+        response = self.client.post(
+            url, data={'permissions': [foo.pk, org_admin.pk]})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(team.permissions.count(), 2)
+
+        response = self.client.post(url, data={'permissions': [foo.pk]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(team.permissions.all()), [org_admin])
+
     def test_add_user_to_team(self):
         '''Adding a user to a team should create a relationship between the
         two.'''
@@ -984,6 +1275,80 @@ class TeamTests(AuthAPITestCase):
         team.refresh_from_db()
         self.assertEqual(len(team.users.all()), 1)
 
+    def test_bulk_add_users_to_team(self):
+        '''Adding a list of users to a team should add all of the existing
+        users, give a result for each user, and give the users the team's
+        permissions.'''
+        _, token = self.create_admin_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        org = SeedOrganization.objects.create()
+        team = SeedTeam.objects.create(organization=org)
+        team.permissions.create(type='foo', namespace='bar')
+        user1 = User.objects.create_user('user1@example.org')
+        user2 = User.objects.create_user('user2@example.org')
+        missing = user2.pk + 100
+
+        response = self.client.post(
+            reverse('seedteam-users-add', args=[team.pk]),
+            data={'users': [user1.pk, missing, user2.pk]})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'results': [
+            {'id': str(user1.pk), 'status': 204},
+            {'id': str(missing), 'status': 404},
+            {'id': str(user2.pk), 'status': 204},
+        ]})
+        self.assertEqual(
+            sorted(u.pk for u in team.users.all()), [user1.pk, user2.pk])
+        self.assertEqual(
+            [p.type for p in get_user_permissions(user2)], ['foo'])
+
+    def test_bulk_remove_users_from_team(self):
+        '''Removing a list of users from a team should remove the users, and
+        their permissions from the team.'''
+        _, token = self.create_admin_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        org = SeedOrganization.objects.create()
+        team = SeedTeam.objects.create(organization=org)
+        team.permissions.create(type='foo', namespace='bar')
+        user1 = User.objects.create_user('user1@example.org')
+        user2 = User.objects.create_user('user2@example.org')
+        team.users.add(user1, user2)
+
+        response = self.client.post(
+            reverse(
+                'seedorganization-teams-users-remove', args=[org.pk, team.pk]),
+            data={'users': [user1.pk, user2.pk]})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(team.users.count(), 0)
+        self.assertEqual(get_user_permissions(user1).count(), 0)
+
+    def test_permission_bulk_users_team(self):
+        '''Users with team:admin permission should only be able to add and
+        remove lists of users for that team.'''
+        org = SeedOrganization.objects.create()
+        team1 = SeedTeam.objects.create(organization=org)
+        team2 = SeedTeam.objects.create(organization=org)
+        user = User.objects.create_user('test user')
+
+        authuser, token = self.create_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        self.add_permission(authuser, 'team:admin', team1.pk)
+
+        for name in ('add', 'remove'):
+            response = self.client.post(
+                reverse('seedteam-users-%s' % name, args=[team1.pk]),
+                data={'users': [user.pk]})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            response = self.client.post(
+                reverse('seedteam-users-%s' % name, args=[team2.pk]),
+                data={'users': [user.pk]})
+            self.assertEqual(
+                response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(team2.users.count(), 0)
+
     def test_permission_add_user_to_team_unauthenticated(self):
         '''Unauthenticated users should not be able to add users to teams.'''
         org = SeedOrganization.objects.create()
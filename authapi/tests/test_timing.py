@@ -0,0 +1,156 @@
+import io
+import json
+import tempfile
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+from django.urls import reverse
+
+from authapi import timing
+from authapi.models import SeedOrganization, SeedTeam
+from authapi.tests.base import AuthAPITestCase
+
+
+def timing_settings(enabled, cache_alias=None):
+    return override_settings(REQUEST_TIMING={
+        'ENABLED': enabled,
+        'CACHE_ALIAS': cache_alias,
+        'CHECK_INTERVAL': 0,
+    })
+
+
+class RequestTimingTests(AuthAPITestCase):
+    def setUp(self):
+        _, token = self.create_admin_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        org = SeedOrganization.objects.create()
+        SeedTeam.objects.create(organization=org)
+
+    def parse_server_timing(self, header):
+        metrics = {}
+        for metric in header.split(', '):
+            name, duration = metric.split(';')[:2]
+            metrics[name] = float(duration[len('dur='):])
+        return metrics
+
+    @timing_settings(False)
+    def test_disabled(self):
+        '''When timing is off, there should be no Server-Timing header.'''
+        response = self.client.get(reverse('seedteam-list'))
+        self.assertNotIn('Server-Timing', response)
+
+    @timing_settings(True)
+    def test_enabled(self):
+        '''When timing is on, the times should be returned in the
+        Server-Timing header, and logged as JSON.'''
+        with self.assertLogs('authapi.timing', 'INFO') as logs:
+            response = self.client.get(reverse('seedteam-list'))
+
+        metrics = self.parse_server_timing(response['Server-Timing'])
+        self.assertEqual(
+            sorted(metrics), ['db', 'permissions', 'serializer', 'total'])
+        self.assertIn('queries"', response['Server-Timing'])
+        for name in ('db', 'permissions', 'serializer'):
+            self.assertGreater(metrics[name], 0, name)
+            self.assertLessEqual(metrics[name], metrics['total'], name)
+
+        [record] = logs.records
+        data = json.loads(record.getMessage())
+        self.assertEqual(data, record.request_timing)
+        self.assertEqual(data['method'], 'GET')
+        self.assertEqual(data['path'], reverse('seedteam-list'))
+        self.assertEqual(data['view'], 'seedteam-list')
+        self.assertEqual(data['status'], 200)
+        self.assertGreater(data['queries'], 0)
+        self.assertEqual(
+            sorted(data), [
+                'db_ms', 'method', 'path', 'permissions_ms', 'queries',
+                'serializer_ms', 'status', 'total_ms', 'view'])
+
+    def override_shared_cache(self):
+        '''Adds a "shared" CACHES entry that is shared between processes.'''
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        caches = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            },
+            'shared': {
+                'BACKEND':
+                    'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': directory.name,
+            },
+        })
+        caches.enable()
+        self.addCleanup(caches.disable)
+
+    def test_runtime_switch(self):
+        '''Timing should be able to be turned on and off with the
+        request_timing command.'''
+        self.override_shared_cache()
+        timing_override = timing_settings(False, 'shared')
+        timing_override.enable()
+        self.addCleanup(timing_override.disable)
+        self.addCleanup(timing.switch.set, None)
+        out = io.StringIO()
+        call_command('request_timing', stdout=out)
+        call_command('request_timing', 'on', stdout=out)
+        response = self.client.get(reverse('seedteam-list'))
+        self.assertIn('Server-Timing', response)
+
+        call_command('request_timing', 'off', stdout=out)
+        response = self.client.get(reverse('seedteam-list'))
+        self.assertNotIn('Server-Timing', response)
+
+        with timing_settings(True, 'shared'):
+            call_command('request_timing', 'default', stdout=out)
+            response = self.client.get(reverse('seedteam-list'))
+            self.assertIn('Server-Timing', response)
+        self.assertEqual(out.getvalue().splitlines(), [
+            'Request timing is off (from the setting).',
+            'Request timing is on.',
+            'Request timing is off.',
+            'Request timing is on (from the setting).',
+        ])
+
+    @timing_settings(False, 'default')
+    def test_cache_not_shared(self):
+        '''The switch can't be stored in a cache that is stored in each
+        process, as the server processes would never see it.'''
+        self.assertRaises(
+            CommandError, call_command, 'request_timing', 'on',
+            stdout=io.StringIO())
+        self.assertRaises(
+            ImproperlyConfigured, timing.RequestTimingMiddleware, None)
+
+    @timing_settings(False)
+    def test_no_runtime_switch(self):
+        '''Without a cache for the switch, the command should only be able
+        to show the setting.'''
+        out = io.StringIO()
+        call_command('request_timing', stdout=out)
+        self.assertEqual(
+            out.getvalue(), 'Request timing is off (from the setting).\n')
+        self.assertRaises(
+            CommandError, call_command, 'request_timing', 'on', stdout=out)
+
+    def test_timed_nested(self):
+        '''Nested calls to timed functions of the same part should only be
+        counted once, and nothing should be timed outside of requests.'''
+        calls = []
+
+        @timing.timed('serializer')
+        def serialize(depth):
+            calls.append(depth)
+            if depth:
+                serialize(depth - 1)
+
+        serialize(1)
+        timer = timing._local.timer = timing.RequestTimer()
+        self.addCleanup(delattr, timing._local, 'timer')
+        serialize(2)
+        self.assertEqual(calls, [1, 0, 2, 1, 0])
+        self.assertEqual(timer.active, set())
+        self.assertGreater(timer.parts['serializer'], 0)
+        self.assertEqual(timer.parts['permissions'], 0)
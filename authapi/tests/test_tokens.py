@@ -1,8 +1,14 @@
+import threading
+
+from django.contrib.auth import user_login_failed
 from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 
+from authapi.hashing import HASHING_LOCK_ID, get_hashing_pool
 from authapi.tests.base import AuthAPITestCase
 
 
@@ -71,3 +77,48 @@ class TokenTests(AuthAPITestCase):
         [token] = Token.objects.filter(user=user)
         self.assertEqual(token.key, response.data['token'])
         self.assertNotEqual(first_token.key, token.key)
+
+    def test_create_token_login_failed_signal(self):
+        '''Passwords should be checked by the authentication backends, so
+        that user_login_failed is sent for a wrong password.'''
+        User.objects.create_user(
+            username='test@example.org', password='testpass')
+        failures = []
+        handler = (lambda sender, **kwargs: failures.append(kwargs))
+        user_login_failed.connect(handler)
+        self.addCleanup(user_login_failed.disconnect, handler)
+
+        response = self.client.post(reverse('create-token'), data={
+            'email': 'test@example.org', 'password': 'wrong'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        [failure] = failures
+        self.assertEqual(
+            failure['credentials']['username'], 'test@example.org')
+
+    @override_settings(HASHING_POOL={'max_workers': 1, 'max_queue': 0})
+    def test_create_token_hashing_pool_saturated(self):
+        '''If the hashing pool is full, a service unavailable response should
+        be returned without checking the password.'''
+        User.objects.create_user(
+            username='test@example.org', password='testpass')
+        pool = get_hashing_pool()
+        event = threading.Event()
+
+        def run():
+            try:
+                pool.run(event.wait)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(event.set)
+        # Wait for the blocking function to take the only slot
+        self.wait_for_advisory_locks(HASHING_LOCK_ID, 1)
+
+        response = self.client.post(reverse('create-token'), data={
+            'email': 'test@example.org', 'password': 'testpass'})
+        self.assertEqual(
+            response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
@@ -1,4 +1,5 @@
 from django.contrib.auth.models import User
+from django.test import override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.authtoken.models import Token
@@ -6,6 +7,7 @@ from rest_framework.authtoken.models import Token
 from authapi.serializers import PermissionSerializer
 from authapi.models import SeedTeam, SeedOrganization
 from authapi.tests.base import AuthAPITestCase
+from authapi.utils import get_effective_permissions
 
 
 class UserPermissionsTests(AuthAPITestCase):
@@ -100,8 +102,105 @@ class UserPermissionsTests(AuthAPITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    def test_get_permissions_not_modified(self):
+        '''If the ETag in If-None-Match matches, a 304 response should be
+        returned, until the user or their permissions change.'''
+        user, token = self.create_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        url = reverse('get-user-permissions')
+
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertNotIn('Last-Modified', response)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.add_permission(user, 'foo:bar')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['permissions']), 1)
+        etag = response['ETag']
+
+        user.first_name = 'Foo'
+        user.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # The ETag is different for other users
+        _, token = self.create_user('bar@example.org')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_get_permssions_from_unauthorized_users(self):
         '''If there is no token in the authentication error, we should return
         an unauthorized response.'''
         response = self.client.get(reverse('get-user-permissions'))
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class UserPermissionsCheckTests(AuthAPITestCase):
+    def setUp(self):
+        self.patch_client_data_json()
+        self.user, token = self.create_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        self.url = reverse('check-user-permissions')
+
+    def test_check_permissions(self):
+        '''A list of whether the user has each permission should be returned,
+        in the same order.'''
+        team, _ = self.add_permission(self.user, 'foo', '1', 'bar')
+        team.permissions.create(type='create', namespace='bar')
+
+        with self.assertNumQueries(2):
+            response = self.client.post(self.url, data={'permissions': [
+                {'type': 'foo', 'object_id': '1', 'namespace': 'bar'},
+                {'type': 'foo', 'object_id': 2, 'namespace': 'bar'},
+                {'type': 'foo', 'object_id': 1, 'namespace': 'bar'},
+                {'type': 'foo', 'object_id': '1', 'namespace': 'baz'},
+                {'type': 'create', 'object_id': None, 'namespace': 'bar'},
+                {'type': 'create', 'namespace': 'bar'},
+                {'type': 'foo', 'namespace': 'bar'},
+            ]})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {
+            'results': [True, False, True, False, True, True, False],
+        })
+
+    def test_check_permissions_cached(self):
+        '''If the user's permissions are cached, they should be used.'''
+        self.add_permission(self.user, 'foo', '1', 'bar')
+        with override_settings(PERMISSION_CACHE={
+                'BACKEND': 'authapi.cache.LocalMemoryCache'}):
+            get_effective_permissions(self.user)
+            with self.assertNumQueries(1):
+                response = self.client.post(self.url, data={'permissions': [
+                    {'type': 'foo', 'object_id': '1', 'namespace': 'bar'},
+                    {'type': 'foo', 'object_id': '2', 'namespace': 'bar'},
+                ]})
+        self.assertEqual(response.data, {'results': [True, False]})
+
+    def test_check_permissions_empty(self):
+        response = self.client.post(self.url, data={'permissions': []})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'results': []})
+
+    def test_check_permissions_invalid(self):
+        '''The type and namespace of each permission are required.'''
+        response = self.client.post(self.url, data={'permissions': [
+            {'type': 'foo'}]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'permissions': [
+            {'namespace': ['This field is required.']}]})
+
+    def test_check_permissions_too_many(self):
+        '''There is a limit on the number of permissions to check.'''
+        response = self.client.post(self.url, data={'permissions': [
+            {'type': 'foo', 'namespace': 'bar'}] * 1001})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_check_permissions_unauthenticated(self):
+        self.client.credentials()
+        response = self.client.post(self.url, data={'permissions': []})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -1,3 +1,5 @@
+from datetime import timedelta
+
 from django.contrib.auth.hashers import check_password
 from django.contrib.auth.models import User
 from django.urls import reverse
@@ -31,6 +33,53 @@ class UserTests(AuthAPITestCase):
             sorted(expected, key=lambda i: i['id']),
             sorted(response.data, key=lambda i: i['id']))
 
+    def test_get_user_list_num_queries(self):
+        '''The number of queries for a page of users should be the same,
+        regardless of the number of users, teams, and organizations.'''
+        _, token = self.create_admin_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        url = '%s?page_size=1000' % reverse('user-list')
+
+        with self.assertNumQueries(4):
+            self.client.get(url)
+
+        SeedOrganization.objects.bulk_create(
+            SeedOrganization() for _ in range(3))
+        orgs = list(SeedOrganization.objects.all())
+        teams = [SeedTeam.objects.create(organization=o) for o in orgs]
+        User.objects.bulk_create(
+            User(username='user%d@example.org' % i) for i in range(2000))
+        users = User.objects.filter(username__startswith='user')
+        SeedTeam.users.through.objects.bulk_create(
+            SeedTeam.users.through(seedteam=team, user=user)
+            for user in users for team in teams)
+        SeedOrganization.users.through.objects.bulk_create(
+            SeedOrganization.users.through(seedorganization=org, user=user)
+            for user in users for org in orgs)
+
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data), 1000)
+        for user in response.data:
+            if user['email'] != 'admin@example.org':
+                self.assertEqual(len(user['teams']), 3)
+                self.assertEqual(len(user['organizations']), 3)
+
+    def test_get_user_list_cursor_date_joined(self):
+        '''Cursor pagination of users ordered by creation time should use the
+        date joined.'''
+        admin, token = self.create_admin_user()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        user = User.objects.create_user('user@example.org')
+        User.objects.filter(pk=admin.pk).update(
+            date_joined=user.date_joined + timedelta(seconds=1))
+
+        response = self.client.get(
+            '%s?pagination=cursor&ordering=created_at&page_size=1' %
+            reverse('user-list'))
+        self.assertEqual([u['id'] for u in response.data], [str(user.pk)])
+        self.assertTrue('cursor=' in response['Link'])
+
     def test_get_user_list_no_inactive(self):
         '''If there are any inactive users, they shouldn't appear in the list
         of users.'''
@@ -0,0 +1,132 @@
+from django.contrib.auth.models import AnonymousUser
+from django.test import override_settings
+from rest_framework.request import Request, clone_request
+from rest_framework.test import APIRequestFactory
+
+from authapi.models import SeedOrganization, SeedTeam
+from authapi.tests.base import AuthAPITestCase
+from authapi.utils import UserPermissionSet, get_request_permissions
+
+
+class UserPermissionSetTests(AuthAPITestCase):
+    def test_has_permission_object_id(self):
+        '''If an object id is given, the type, object id, and namespace must
+        all match. Object ids should match regardless of their type.'''
+        user, _ = self.create_user()
+        self.add_permission(user, 'org:admin', '2', namespace='foo')
+        permissions = UserPermissionSet(user)
+
+        self.assertTrue(permissions.has_permission('org:admin', 2, 'foo'))
+        self.assertTrue(permissions.has_permission('org:admin', '2', 'foo'))
+        self.assertFalse(permissions.has_permission('org:admin', 3, 'foo'))
+        self.assertFalse(permissions.has_permission('org:admin', 2, 'bar'))
+        self.assertFalse(permissions.has_permission('team:admin', 2, 'foo'))
+
+    def test_has_permission_no_object_id(self):
+        '''If no object id is given, only the permission type should be
+        checked.'''
+        user, _ = self.create_user()
+        self.add_permission(user, 'org:admin', '2', namespace='foo')
+        permissions = UserPermissionSet(user)
+
+        self.assertTrue(permissions.has_permission('org:admin'))
+        self.assertTrue(permissions.has_permission('org:admin', None, 'bar'))
+        self.assertFalse(permissions.has_permission('team:admin'))
+
+    def test_inactive_teams_and_organizations(self):
+        '''Permissions from archived teams or organizations should not be
+        included.'''
+        user, _ = self.create_user()
+        team, _ = self.add_permission(user, 'foo')
+        team.archived = True
+        team.save()
+        team, _ = self.add_permission(user, 'bar')
+        team.organization.archived = True
+        team.organization.save()
+
+        permissions = UserPermissionSet(user)
+        self.assertFalse(permissions.has_permission('foo'))
+        self.assertFalse(permissions.has_permission('bar'))
+
+    def test_memberships(self):
+        '''The team and organization memberships of the user should be
+        available.'''
+        user, _ = self.create_user()
+        org = SeedOrganization.objects.create()
+        org.users.add(user)
+        team = SeedTeam.objects.create(organization=org)
+        team.users.add(user)
+        other = SeedTeam.objects.create(organization=org)
+
+        permissions = UserPermissionSet(user)
+        self.assertTrue(permissions.is_team_member(team.pk))
+        self.assertFalse(permissions.is_team_member(other.pk))
+        self.assertTrue(permissions.is_organization_member(org.pk))
+
+    def test_loaded_once(self):
+        '''The permissions and memberships should be loaded together in a
+        single query, regardless of the number of checks.'''
+        user, _ = self.create_user()
+        self.add_permission(user, 'org:admin', '1')
+        permissions = UserPermissionSet(user)
+
+        with self.assertNumQueries(1):
+            for i in range(5):
+                permissions.has_permission('org:admin', i, '__auth__')
+                permissions.is_team_member(i)
+                permissions.is_organization_member(i)
+
+    def test_memberships_first(self):
+        '''Checking a membership first should also load the permissions.'''
+        user, _ = self.create_user()
+        team, _ = self.add_permission(user, 'org:admin', '1')
+        permissions = UserPermissionSet(user)
+
+        with self.assertNumQueries(1):
+            self.assertTrue(permissions.is_team_member(team.pk))
+            self.assertTrue(
+                permissions.has_permission('org:admin', 1, '__auth__'))
+
+    @override_settings(PERMISSION_CACHE={
+        'BACKEND': 'authapi.cache.LocalMemoryCache'})
+    def test_cached_permissions(self):
+        '''Cached permissions shouldn't be queried, and shouldn't cause the
+        memberships to be loaded.'''
+        user, _ = self.create_user()
+        team, _ = self.add_permission(user, 'org:admin', '1')
+        team.organization.users.add(user)
+        UserPermissionSet(user).has_permission('org:admin')
+
+        permissions = UserPermissionSet(user)
+        with self.assertNumQueries(0):
+            self.assertTrue(permissions.has_permission('org:admin'))
+        with self.assertNumQueries(1):
+            self.assertTrue(permissions.is_team_member(team.pk))
+            self.assertTrue(
+                permissions.is_organization_member(team.organization_id))
+
+    def test_anonymous_user(self):
+        '''Anonymous users have no permissions, and shouldn't query the
+        database.'''
+        permissions = UserPermissionSet(AnonymousUser())
+        with self.assertNumQueries(0):
+            self.assertFalse(permissions.has_permission('org:admin'))
+            self.assertFalse(permissions.is_team_member(1))
+
+    def test_get_request_permissions(self):
+        '''The permission set should be shared between a request and its
+        clones, and should be reloaded if the user changes.'''
+        user, _ = self.create_user()
+        request = Request(APIRequestFactory().get('/'))
+        request.user = user
+
+        permissions = get_request_permissions(request)
+        self.assertEqual(permissions.user, user)
+        self.assertTrue(get_request_permissions(request) is permissions)
+        self.assertTrue(
+            get_request_permissions(clone_request(request, 'PUT')) is
+            permissions)
+
+        admin, _ = self.create_admin_user()
+        request.user = admin
+        self.assertEqual(get_request_permissions(request).user, admin)
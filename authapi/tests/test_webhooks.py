@@ -0,0 +1,255 @@
+import io
+import json
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.utils import timezone
+
+from authapi.models import Change, SeedOrganization, SeedTeam, Webhook
+from authapi.tests.base import AuthAPITestCase, AuthAPITransactionTestCase
+from authapi.webhooks import WebhookWorker, prune_changes, sign
+
+
+class StubServer(HTTPServer):
+    '''A local HTTP server that records the requests made to it, and
+    responds with the queued statuses, or 200.'''
+    def __init__(self):
+        self.requests = []
+        self.statuses = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(handler):
+                length = int(handler.headers['Content-Length'])
+                self.requests.append(
+                    (handler.headers, handler.rfile.read(length)))
+                status = self.statuses.pop(0) if self.statuses else 200
+                handler.send_response(status)
+                handler.send_header('Content-Length', '0')
+                handler.end_headers()
+
+            def log_message(handler, *args):
+                pass
+
+        super(StubServer, self).__init__(('127.0.0.1', 0), Handler)
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/hook/' % self.server_address[1]
+
+    @property
+    def payloads(self):
+        return [json.loads(body.decode('utf-8')) for _, body in self.requests]
+
+
+class WebhookTestMixin(object):
+    def setUp(self):
+        self.server = StubServer()
+        thread = threading.Thread(
+            target=self.server.serve_forever, kwargs={'poll_interval': 0.01})
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.worker = WebhookWorker(max_workers=2, timeout=5)
+        self.addCleanup(self.worker.shutdown)
+        self.webhook = Webhook.objects.create(url=self.server.url)
+
+
+class WebhookWorkerTests(WebhookTestMixin, AuthAPITestCase):
+
+    def add_changes(self, *changes):
+        return Change.objects.bulk_create([
+            Change(type=change_type, user_id=user_id)
+            for change_type, user_id in changes])
+
+    def test_new_webhook(self):
+        '''New webhooks should only get changes made after they are
+        created.'''
+        self.add_changes(('user', 1))
+        webhook = Webhook.objects.create(url=self.server.url)
+        self.assertEqual(webhook.last_seq, Change.objects.latest_seq())
+        self.assertEqual(self.webhook.last_seq, 0)
+
+    def test_deliver(self):
+        '''Changes should be delivered coalesced per user, with a
+        signature if there is a secret.'''
+        self.webhook.secret = 'secret'
+        self.webhook.save()
+        changes = self.add_changes(
+            ('membership', 1), ('permissions', 2), ('permissions', 1),
+            ('membership', 1))
+
+        self.assertEqual(self.worker.run_once(), 1)
+        [(headers, body)] = self.server.requests
+        self.assertEqual(json.loads(body.decode('utf-8')), {
+            'seq': str(changes[-1].id),
+            'users': [
+                {'user': '1', 'types': ['membership', 'permissions']},
+                {'user': '2', 'types': ['permissions']},
+            ],
+        })
+        self.assertEqual(headers['Content-Type'], 'application/json')
+        self.assertEqual(
+            headers['X-Seed-Auth-Signature'],
+            'sha256=' + sign('secret', body))
+        self.webhook.refresh_from_db()
+        self.assertEqual(self.webhook.last_seq, changes[-1].id)
+
+        # Nothing is delivered again until there are new changes
+        self.assertEqual(self.worker.run_once(), 0)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_batches(self):
+        '''Changes should be delivered in order, batch_size at a time.'''
+        self.worker.batch_size = 2
+        changes = self.add_changes(('user', 1), ('user', 2), ('user', 3))
+        self.worker.run_once()
+        self.worker.run_once()
+        self.assertEqual(
+            [p['seq'] for p in self.server.payloads],
+            [str(changes[1].id), str(changes[2].id)])
+        self.assertEqual(
+            [[u['user'] for u in p['users']] for p in self.server.payloads],
+            [['1', '2'], ['3']])
+
+    def test_retry(self):
+        '''Failed deliveries should be retried with exponential backoff, and
+        the same changes should be sent again.'''
+        self.worker.backoff = 10
+        self.add_changes(('user', 1))
+        self.server.statuses = [500, 500]
+
+        self.assertEqual(self.worker.run_once(), 0)
+        self.webhook.refresh_from_db()
+        self.assertEqual(self.webhook.failures, 1)
+        self.assertAlmostEqual(
+            self.webhook.next_attempt_at,
+            timezone.now() + timedelta(seconds=10),
+            delta=timedelta(seconds=5))
+
+        # Not retried until next_attempt_at
+        self.worker.run_once()
+        self.assertEqual(len(self.server.requests), 1)
+
+        Webhook.objects.update(next_attempt_at=timezone.now())
+        self.worker.run_once()
+        self.webhook.refresh_from_db()
+        self.assertEqual(self.webhook.failures, 2)
+        self.assertAlmostEqual(
+            self.webhook.next_attempt_at,
+            timezone.now() + timedelta(seconds=20),
+            delta=timedelta(seconds=5))
+
+        Webhook.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(self.worker.run_once(), 1)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(
+            self.server.payloads[0], self.server.payloads[2])
+        self.webhook.refresh_from_db()
+        self.assertEqual(self.webhook.failures, 0)
+        self.assertIsNone(self.webhook.next_attempt_at)
+
+    def test_max_backoff(self):
+        '''The time between retries should be limited to max_backoff.'''
+        self.worker.max_backoff = 60
+        Webhook.objects.update(failures=20)
+        self.webhook.refresh_from_db()
+        self.worker.delivery_failed(self.webhook, Exception())
+        self.webhook.refresh_from_db()
+        self.assertAlmostEqual(
+            self.webhook.next_attempt_at,
+            timezone.now() + timedelta(seconds=60),
+            delta=timedelta(seconds=5))
+
+    def test_unreachable(self):
+        '''Connection errors should be retried like error responses.'''
+        self.add_changes(('user', 1))
+        Webhook.objects.update(url='http://127.0.0.1:1/')
+        self.assertEqual(self.worker.run_once(), 0)
+        self.webhook.refresh_from_db()
+        self.assertEqual(self.webhook.failures, 1)
+
+    def test_inactive(self):
+        '''Inactive webhooks should not get deliveries.'''
+        Webhook.objects.update(active=False)
+        self.add_changes(('user', 1))
+        self.assertEqual(self.worker.run_once(), 0)
+        self.assertEqual(self.server.requests, [])
+
+    def test_permission_change(self):
+        '''Changes to a user's permissions should be delivered.'''
+        org = SeedOrganization.objects.create()
+        team = SeedTeam.objects.create(organization=org)
+        user = User.objects.create_user('foo@bar.org')
+        team.users.add(user)
+        self.run_commit_hooks()
+
+        self.worker.run_once()
+        self.assertEqual(self.server.payloads[0]['users'], [
+            {'user': str(user.pk), 'types': ['membership']}])
+
+    def test_command(self):
+        '''The command should be able to deliver a single batch.'''
+        self.add_changes(('user', 1))
+        out = io.StringIO()
+        call_command('deliver_webhooks', once=True, stdout=out)
+        self.assertEqual(out.getvalue(), 'Made 1 deliveries.\n')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_prune_undelivered(self):
+        '''Changes that an active webhook hasn't been sent yet shouldn't be
+        pruned, however old they are.'''
+        changes = self.add_changes(('user', 1), ('user', 2), ('user', 3))
+        Change.objects.update(created_at=timezone.now() - timedelta(days=8))
+        Webhook.objects.filter(pk=self.webhook.pk).update(
+            last_seq=changes[0].id)
+        Webhook.objects.create(url=self.server.url, active=False, last_seq=0)
+
+        self.assertEqual(prune_changes(timezone.now()), 1)
+        self.assertEqual(
+            list(Change.objects.values_list('user_id', flat=True)), [2, 3])
+
+        self.worker.run_once()
+        self.assertEqual(self.server.payloads[0]['users'], [
+            {'user': '2', 'types': ['user']},
+            {'user': '3', 'types': ['user']}])
+
+
+class WebhookLockingTests(WebhookTestMixin, AuthAPITransactionTestCase):
+    '''The webhook needs to be committed, to be locked by another
+    connection.'''
+    def setUp(self):
+        super(WebhookLockingTests, self).setUp()
+        Change.objects.create(type='user', user_id=1)
+
+    def test_locked(self):
+        '''Webhooks that another worker is delivering to should be
+        skipped.'''
+        locked = threading.Event()
+        release = threading.Event()
+
+        def lock():
+            with transaction.atomic():
+                list(Webhook.objects.select_for_update())
+                locked.set()
+                release.wait(5)
+            connection.close()
+
+        thread = threading.Thread(target=lock)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(release.set)
+        locked.wait(5)
+
+        self.assertEqual(self.worker.run_once(), 0)
+        self.assertEqual(self.server.requests, [])
+
+        release.set()
+        thread.join()
+        self.assertEqual(self.worker.run_once(), 1)
+        self.assertEqual(len(self.server.requests), 1)
@@ -0,0 +1,181 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from authapi.cache import is_shared_cache
+from authapi.db import QueryStats, record_queries
+
+
+logger = logging.getLogger(__name__)
+
+# The key of the runtime switch in the REQUEST_TIMING['CACHE_ALIAS'] cache
+SWITCH_KEY = 'authapi:request_timing'
+
+# The parts of a request that are timed, other than the database
+PARTS = ('serializer', 'permissions')
+
+_local = threading.local()
+
+
+class RequestTimer(object):
+    '''Records the time spent on the database, and on each of the PARTS, of
+    a request, in seconds.'''
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.total = None
+        self.queries = QueryStats()
+        self.parts = OrderedDict((part, 0.0) for part in PARTS)
+        self.active = set()
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start
+
+    def as_dict(self):
+        '''Returns the times in milliseconds, and the query count.'''
+        times = OrderedDict([
+            ('total_ms', self.total), ('db_ms', self.queries.duration)])
+        for part, duration in self.parts.items():
+            times['%s_ms' % part] = duration
+        result = OrderedDict(
+            (name, round(duration * 1000, 3))
+            for name, duration in times.items())
+        result['queries'] = self.queries.count
+        return result
+
+    def server_timing(self):
+        '''Returns the value of the Server-Timing header.'''
+        metrics = [
+            'total;dur=%.3f' % (self.total * 1000),
+            'db;dur=%.3f;desc="%d queries"' % (
+                self.queries.duration * 1000, self.queries.count),
+        ]
+        metrics.extend(
+            '%s;dur=%.3f' % (part, duration * 1000)
+            for part, duration in self.parts.items())
+        return ', '.join(metrics)
+
+
+def timed(part):
+    '''Decorates a function to add the time it takes to the part of the
+    current request's timer. Calls made while the part is already being timed,
+    like those of nested serializers, aren't counted twice.'''
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            timer = getattr(_local, 'timer', None)
+            if timer is None or part in timer.active:
+                return func(*args, **kwargs)
+            timer.active.add(part)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timer.parts[part] += time.perf_counter() - start
+                timer.active.discard(part)
+        return wrapper
+    return decorator
+
+
+class TimingSwitch(object):
+    '''Whether requests are timed. The REQUEST_TIMING['ENABLED'] setting can
+    be overridden at runtime by a value stored in the CACHE_ALIAS cache, which
+    each process checks for every CHECK_INTERVAL seconds. The cache must be
+    shared between processes, or the value wouldn't reach them.'''
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.enabled = False
+        self.next_check = 0
+
+    @property
+    def cache(self):
+        '''Returns the cache that the switch is stored in, or None if there
+        is no runtime switch.'''
+        alias = settings.REQUEST_TIMING['CACHE_ALIAS']
+        if alias is None:
+            return None
+        if not is_shared_cache(alias):
+            raise ImproperlyConfigured(
+                "REQUEST_TIMING['CACHE_ALIAS'] must be a cache that is shared "
+                "between processes, but %r is stored in each process" % (
+                    alias,))
+        return caches[alias]
+
+    def is_enabled(self):
+        now = time.monotonic()
+        if now >= self.next_check:
+            value = None
+            if self.cache is not None:
+                value = self.cache.get(SWITCH_KEY)
+            if value is None:
+                value = settings.REQUEST_TIMING['ENABLED']
+            self.enabled = value
+            self.next_check = now + settings.REQUEST_TIMING['CHECK_INTERVAL']
+        return self.enabled
+
+    def set(self, enabled):
+        '''Turns timing on or off for all processes that share the cache, or
+        back to the setting if enabled is None.'''
+        if self.cache is None:
+            raise ImproperlyConfigured(
+                "Request timing can't be switched at runtime without "
+                "REQUEST_TIMING['CACHE_ALIAS']")
+        if enabled is None:
+            self.cache.delete(SWITCH_KEY)
+        else:
+            self.cache.set(SWITCH_KEY, enabled, None)
+        self.next_check = 0
+
+
+switch = TimingSwitch()
+
+
+@receiver(setting_changed)
+def reset_switch(setting, **kwargs):
+    if setting in ('REQUEST_TIMING', 'CACHES'):
+        switch.reset()
+
+
+class RequestTimingMiddleware(object):
+    '''Times each request when the switch is on, and returns the times in a
+    Server-Timing header, and logs them as JSON.
+
+    The total is the time taken to return the response, so the body of a
+    streaming response isn't included.'''
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Raises ImproperlyConfigured if the switch's cache isn't shared
+        switch.cache
+
+    def __call__(self, request):
+        if not switch.is_enabled():
+            return self.get_response(request)
+
+        timer = _local.timer = RequestTimer()
+        try:
+            with record_queries(timer.queries):
+                response = self.get_response(request)
+        finally:
+            del _local.timer
+        timer.finish()
+
+        response['Server-Timing'] = timer.server_timing()
+        record = OrderedDict([
+            ('method', request.method),
+            ('path', request.path),
+            ('view', getattr(request.resolver_match, 'view_name', None)),
+            ('status', response.status_code),
+        ])
+        record.update(timer.as_dict())
+        logger.info(json.dumps(record), extra={'request_timing': record})
+        return response
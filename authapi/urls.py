@@ -2,6 +2,8 @@ from django.conf.urls import include, url
 from rest_framework_extensions import routers
 
 from authapi import views
+from authapi.metrics import metrics_view
+from authapi.export import EXPORTS
 
 router = routers.ExtendedSimpleRouter()
 
@@ -42,5 +44,14 @@ urlpatterns = [
     url(
         r'^user/$', views.UserPermissionsView.as_view(),
         name='get-user-permissions'),
+    url(
+        r'^user/permissions/check/$', views.UserPermissionsCheckView.as_view(),
+        name='check-user-permissions'),
+    url(r'^changes/$', views.ChangesView.as_view(), name='changes'),
+    url(
+        r'^export/(?P<name>%s)/$' % '|'.join(EXPORTS),
+        views.ExportView.as_view(), name='export'),
     url(r'^user/tokens/$', views.TokenView.as_view(), name='create-token'),
+    # Without a trailing slash, as this is the default path for Prometheus
+    url(r'^metrics$', metrics_view, name='metrics'),
 ]
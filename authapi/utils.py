@@ -1,17 +1,24 @@
-from authapi.models import SeedPermission
+from collections import defaultdict, namedtuple
+
+from django.db.models import F, IntegerField, Q, TextField, Value
+
+from authapi.cache import get_permission_cache
+from authapi.models import SeedOrganization, SeedPermission, SeedTeam
+from authapi.timing import timed
+
+
+EffectivePermission = namedtuple(
+    'EffectivePermission', ['id', 'type', 'object_id', 'namespace'])
+
+# The kinds of the rows returned by get_user_rows
+MEMBERSHIP_PERMISSION, MEMBERSHIP_TEAM, MEMBERSHIP_ORGANIZATION = range(3)
 
 
 def get_user_permissions(user):
-    '''Returns the queryset of permissions for the given user.'''
-    permissions = SeedPermission.objects.all()
-    # User must be on a team that grants the permission
-    permissions = permissions.filter(seedteam__users=user)
-    # The team must be active
-    permissions = permissions.filter(seedteam__archived=False)
-    # The organization of that team must be active
-    permissions = permissions.filter(
-        seedteam__organization__archived=False)
-    return permissions
+    '''Returns the queryset of permissions for the given user. These are the
+    permissions of the active teams, of active organizations, that the user
+    is a member of, which are kept in UserEffectivePermission.'''
+    return SeedPermission.objects.filter(usereffectivepermission__user=user)
 
 
 def find_permission(
@@ -22,3 +29,186 @@ def find_permission(
         return permissions.filter(
             type=permission_type, object_id=object_id, namespace=namespace)
     return permissions.filter(type=permission_type)
+
+
+def get_effective_permissions(user):
+    '''Returns a list of EffectivePermission tuples for the given user, from
+    the permission cache if it is present there.'''
+    cache = get_permission_cache()
+    permissions = cache.get(user.pk)
+    if permissions is None:
+        permissions = [
+            EffectivePermission(*p) for p in
+            get_user_permissions(user).values_list(
+                'id', 'type', 'object_id', 'namespace')]
+        cache.set(user.pk, permissions)
+    return permissions
+
+
+def get_user_rows(user, permissions=True):
+    '''Returns a queryset of (id, kind, type, object_id, namespace) rows, so
+    that the team and organization memberships of the user, and their
+    effective permissions if permissions is true, can be fetched in a single
+    query. The kind is one of the MEMBERSHIP_ constants, and the type,
+    object_id, and namespace are null for teams and organizations.'''
+    none = Value(None, TextField())
+
+    def rows(queryset, kind, id_field, **fields):
+        # The fields are annotated, so that they are selected after the id
+        # in the same order in each query of the union
+        return queryset.annotate(
+            kind=Value(kind, IntegerField()), **fields).values_list(
+                id_field, 'kind', 'row_type', 'row_object_id',
+                'row_namespace')
+
+    queries = [
+        rows(
+            SeedTeam.users.through.objects.filter(user_id=user.pk),
+            MEMBERSHIP_TEAM, 'seedteam_id', row_type=none,
+            row_object_id=none, row_namespace=none),
+        rows(
+            SeedOrganization.users.through.objects.filter(user_id=user.pk),
+            MEMBERSHIP_ORGANIZATION, 'seedorganization_id', row_type=none,
+            row_object_id=none, row_namespace=none),
+    ]
+    if permissions:
+        queries.insert(0, rows(
+            get_user_permissions(user), MEMBERSHIP_PERMISSION, 'id',
+            row_type=F('type'), row_object_id=F('object_id'),
+            row_namespace=F('namespace')))
+    return queries[0].union(*queries[1:], all=True)
+
+
+@timed('permissions')
+def check_permissions(user, checks):
+    '''Given a list of (type, object_id, namespace) tuples, returns a list of
+    whether the user has each permission. The object id and namespace must
+    match exactly, so an object id of None only matches permissions without
+    an object id.
+
+    The user's cached permissions are used if they are cached, otherwise
+    only the permissions being checked are fetched, in a single query.'''
+    checks = [tuple(c) for c in checks]
+    if not checks:
+        return []
+    permissions = get_permission_cache().get(user.pk)
+    if permissions is not None:
+        granted = set(
+            (p.type, p.object_id, p.namespace) for p in permissions)
+    else:
+        query = Q()
+        for permission_type, object_id, namespace in set(checks):
+            query |= Q(
+                type=permission_type, object_id=object_id,
+                namespace=namespace)
+        granted = set(get_user_permissions(user).filter(query).values_list(
+            'type', 'object_id', 'namespace'))
+    return [c in granted for c in checks]
+
+
+class UserPermissionSet(object):
+    '''An in-memory index of the effective permissions and memberships of a
+    user. The permissions are taken from the permission cache if they are
+    cached. Whatever else is needed is loaded with a single query the first
+    time that it is needed, and is then reused for all further checks.'''
+    def __init__(self, user):
+        self.user = user
+        self._permissions = None
+        self._team_ids = None
+        self._organization_ids = None
+        if not user.is_authenticated:
+            self._permissions = {}
+            self._team_ids = self._organization_ids = frozenset()
+
+    @property
+    def permissions(self):
+        '''A dictionary of permission type to a set of (object_id, namespace)
+        tuples.'''
+        if self._permissions is None and not self._load_cached_permissions():
+            self._load()
+        return self._permissions
+
+    @property
+    def team_ids(self):
+        '''The set of ids of the teams that the user is a member of.'''
+        if self._team_ids is None:
+            self._load_memberships()
+        return self._team_ids
+
+    @property
+    def organization_ids(self):
+        '''The set of ids of the organizations that the user is a member
+        of.'''
+        if self._organization_ids is None:
+            self._load_memberships()
+        return self._organization_ids
+
+    def _set_permissions(self, permissions):
+        index = defaultdict(set)
+        for p in permissions:
+            index[p.type].add((p.object_id, p.namespace))
+        self._permissions = dict(index)
+
+    def _load_cached_permissions(self):
+        '''Sets the permissions from the permission cache, and returns
+        whether they were cached.'''
+        permissions = get_permission_cache().get(self.user.pk)
+        if permissions is None:
+            return False
+        self._set_permissions(permissions)
+        return True
+
+    def _load_memberships(self):
+        if self._permissions is None:
+            # Only load the permissions along with the memberships if they
+            # aren't cached
+            self._load_cached_permissions()
+        self._load()
+
+    def _load(self):
+        '''Loads the membership ids, and the permissions if they aren't
+        loaded yet, in a single query. Loaded permissions are cached.'''
+        load_permissions = self._permissions is None
+        permissions = []
+        ids = {MEMBERSHIP_TEAM: set(), MEMBERSHIP_ORGANIZATION: set()}
+        rows = get_user_rows(self.user, permissions=load_permissions)
+        for pk, kind, permission_type, object_id, namespace in rows:
+            if kind == MEMBERSHIP_PERMISSION:
+                permissions.append(EffectivePermission(
+                    pk, permission_type, object_id, namespace))
+            else:
+                ids[kind].add(pk)
+        if load_permissions:
+            get_permission_cache().set(self.user.pk, permissions)
+            self._set_permissions(permissions)
+        self._team_ids = frozenset(ids[MEMBERSHIP_TEAM])
+        self._organization_ids = frozenset(ids[MEMBERSHIP_ORGANIZATION])
+
+    def has_permission(
+            self, permission_type, object_id=None, namespace=None):
+        '''Returns whether the user has the permission. This matches in the
+        same way as find_permission, so if object_id is None, only the
+        permission type is checked.'''
+        entries = self.permissions.get(permission_type, ())
+        if object_id is None:
+            return len(entries) > 0
+        # Object ids are stored as text
+        return (str(object_id), namespace) in entries
+
+    def is_team_member(self, team_id):
+        return team_id in self.team_ids
+
+    def is_organization_member(self, organization_id):
+        return organization_id in self.organization_ids
+
+
+def get_request_permissions(request):
+    '''Returns the UserPermissionSet for the user of the request. The set is
+    stored on the underlying HTTP request, so that it is shared between
+    all of the permission checks, including those on cloned requests.'''
+    http_request = getattr(request, '_request', request)
+    permission_set = getattr(http_request, '_seed_permission_set', None)
+    if permission_set is None or permission_set.user is not request.user:
+        permission_set = UserPermissionSet(request.user)
+        http_request._seed_permission_set = permission_set
+    return permission_set
@@ -1,6 +1,10 @@
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
 from rest_framework import viewsets, status, serializers
+from rest_framework.decorators import action
 from rest_framework.authtoken.models import Token
 from rest_framework.generics import get_object_or_404
 from rest_framework.request import clone_request
@@ -13,11 +17,20 @@ from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet
 from rest_framework_extensions.mixins import NestedViewSetMixin
 
-from authapi.models import SeedOrganization, SeedTeam, SeedPermission
+from authapi.changes import wait_for_changes
+from authapi.conditional import (
+    ConditionalRetrieveMixin, conditional_response, make_etag)
+from authapi.export import CSVRenderer, NDJSONRenderer, stream_export
+from authapi.hashing import get_hashing_pool
+from authapi.models import (
+    Change, SeedOrganization, SeedTeam, SeedPermission)
 from authapi import permissions
 from authapi.serializers import (
     OrganizationSerializer, TeamSerializer, UserSerializer, NewUserSerializer,
-    PermissionSerializer, CreateTokenSerializer, PermissionsUserSerializer)
+    PermissionSerializer, CreateTokenSerializer, PermissionsUserSerializer,
+    PermissionsCheckSerializer, UserIdsSerializer, PermissionIdsSerializer,
+    PermissionsSerializer, ChangeSerializer, ChangesQuerySerializer)
+from authapi.utils import check_permissions, get_effective_permissions
 
 
 def get_true_false_both(query_params, field_name, default):
@@ -33,7 +46,7 @@ def get_true_false_both(query_params, field_name, default):
     })
 
 
-class OrganizationViewSet(viewsets.ModelViewSet):
+class OrganizationViewSet(ConditionalRetrieveMixin, viewsets.ModelViewSet):
     queryset = SeedOrganization.objects.all()
     serializer_class = OrganizationSerializer
     permission_classes = (permissions.OrganizationPermission,)
@@ -43,15 +56,32 @@ class OrganizationViewSet(viewsets.ModelViewSet):
         shouldn't show up on list views.
 
         We have an archived query param, where 'true' shows archived, 'false'
-        omits them, and 'both' shows both.'''
+        omits them, and 'both' shows both.
+
+        The active teams and users are prefetched for the serializer.'''
+        queryset = self.queryset.prefetch_related(
+            Prefetch(
+                'seedteam_set', to_attr='active_teams',
+                queryset=SeedTeam.objects.filter(archived=False).only(
+                    'id', 'organization')),
+            Prefetch(
+                'users', to_attr='active_users',
+                queryset=User.objects.filter(is_active=True).only('id')),
+        )
         if self.action == 'list':
             archived = get_true_false_both(
                 self.request.query_params, 'archived', 'false')
             if archived == 'true':
-                return self.queryset.filter(archived=True)
+                return queryset.filter(archived=True)
             if archived == 'false':
-                return self.queryset.filter(archived=False)
-        return self.queryset
+                return queryset.filter(archived=False)
+        return queryset
+
+    def get_etag_parts(self, org):
+        return (
+            org.pk, org.updated_at,
+            sorted(t.pk for t in org.get_active_teams()),
+            sorted(u.pk for u in org.get_active_users()))
 
     def destroy(self, request, pk=None):
         '''For DELETE actions, archive the organization, don't delete.'''
@@ -61,11 +91,56 @@ class OrganizationViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class OrganizationUsersViewSet(NestedViewSetMixin, viewsets.ViewSet):
+class BulkUsersMixin(object):
+    '''Adds add and remove actions to a users viewset, to add or remove a list
+    of users in a single request.'''
+    def get_users_relation(self, request, **kwargs):
+        '''Checks the permissions for the parent object, and returns the
+        relation to add the users to, or remove them from.'''
+        raise NotImplementedError()
+
+    def bulk_users(self, request, method, **kwargs):
+        serializer = UserIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_ids = serializer.validated_data['users']
+
+        relation = self.get_users_relation(request, **kwargs)
+        found = set(
+            User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+        getattr(relation, method)(*found)
+
+        return Response(data={'results': [
+            {
+                'id': str(user_id),
+                'status': (
+                    status.HTTP_204_NO_CONTENT if user_id in found
+                    else status.HTTP_404_NOT_FOUND),
+            } for user_id in user_ids
+        ]})
+
+    @action(detail=False, methods=['post'])
+    def add(self, request, **kwargs):
+        '''Add a list of users.'''
+        return self.bulk_users(request, 'add', **kwargs)
+
+    @action(detail=False, methods=['post'])
+    def remove(self, request, **kwargs):
+        '''Remove a list of users.'''
+        return self.bulk_users(request, 'remove', **kwargs)
+
+
+class OrganizationUsersViewSet(
+        BulkUsersMixin, NestedViewSetMixin, viewsets.ViewSet):
     '''Nested viewset that allows users to add or remove users from
     organizations.'''
     permission_classes = (permissions.OrganizationUsersPermission,)
 
+    def get_users_relation(self, request, parent_lookup_organization=None):
+        org = get_object_or_404(
+            SeedOrganization, pk=parent_lookup_organization)
+        self.check_object_permissions(request, org)
+        return org.users
+
     def update(self, request, pk=None, parent_lookup_organization=None):
         '''Add a user to an organization.'''
         user = get_object_or_404(User, pk=pk)
@@ -86,8 +161,8 @@ class OrganizationUsersViewSet(NestedViewSetMixin, viewsets.ViewSet):
 
 
 class BaseTeamViewSet(
-        NestedViewSetMixin, RetrieveModelMixin, UpdateModelMixin,
-        DestroyModelMixin, ListModelMixin, GenericViewSet):
+        ConditionalRetrieveMixin, NestedViewSetMixin, RetrieveModelMixin,
+        UpdateModelMixin, DestroyModelMixin, ListModelMixin, GenericViewSet):
     queryset = SeedTeam.objects.all()
     serializer_class = TeamSerializer
     permission_classes = (permissions.TeamPermission,)
@@ -101,8 +176,17 @@ class BaseTeamViewSet(
 
         We also have the query params permission_contains and object_id, which
         allow users to filter the teams based on the permissions they
-        contain.'''
+        contain.
+
+        The organization, active users, and permissions are fetched with the
+        teams for the serializer.'''
         queryset = super(BaseTeamViewSet, self).get_queryset()
+        queryset = queryset.select_related('organization').prefetch_related(
+            Prefetch(
+                'users', to_attr='active_users',
+                queryset=User.objects.filter(is_active=True).only('id')),
+            'permissions',
+        )
         if self.action == 'list':
             archived = get_true_false_both(
                 self.request.query_params, 'archived', 'false')
@@ -127,13 +211,22 @@ class BaseTeamViewSet(
                 queryset = queryset.filter(
                     permissions__namespace=namespace).distinct()
 
-            permission = permissions.TeamPermission()
-            queryset = [
-                team for team in queryset if
-                permission.has_object_permission(self.request, self, team)]
+            queryset = permissions.TeamPermission().filter_queryset(
+                self.request, queryset)
 
         return queryset
 
+    def get_etag_parts(self, team):
+        return (
+            team.pk, team.updated_at, team.organization_id,
+            sorted((p.pk, p.updated_at) for p in team.permissions.all()),
+            sorted(u.pk for u in team.get_active_users()))
+
+    def get_last_modified(self, team):
+        return max(
+            [team.updated_at] +
+            [p.updated_at for p in team.permissions.all()])
+
     def perform_destroy(self, instance):
         instance.archived = True
         instance.save()
@@ -204,12 +297,86 @@ class TeamPermissionViewSet(
             request, pk, parent_lookup_seedteam,
             parent_lookup_seedteam__organization)
 
+    def check_permission_types(self, request, types):
+        '''Checks that the user can add or remove permissions of each of the
+        given (type, object_id, namespace), checking each distinct one
+        once.'''
+        permission = permissions.TeamPermissionPermission()
+        for ptype, object_id, namespace in set(types):
+            if not permission.check_permissions(
+                    request, ptype, object_id, namespace):
+                self.permission_denied(
+                    request, message=getattr(permission, 'message', None)
+                )
+
+    @action(detail=False, methods=['post'])
+    def add(
+            self, request, parent_lookup_seedteam=None,
+            parent_lookup_seedteam__organization=None):
+        '''Add a list of permissions to a team.'''
+        team = self.check_team_permissions(
+            request, parent_lookup_seedteam,
+            parent_lookup_seedteam__organization)
+
+        serializer = PermissionsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data['permissions']
+        self.check_permission_types(request, [
+            (p['type'], p.get('object_id'), p['namespace']) for p in data])
+
+        with transaction.atomic():
+            created = SeedPermission.objects.bulk_create(
+                SeedPermission(**p) for p in data)
+            team.permissions.add(*created)
+        serializer = self.get_serializer(instance=created, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-class TeamUsersViewSet(NestedViewSetMixin, GenericViewSet):
+    @action(detail=False, methods=['post'])
+    def remove(
+            self, request, parent_lookup_seedteam=None,
+            parent_lookup_seedteam__organization=None):
+        '''Remove a list of permissions from a team.'''
+        team = self.check_team_permissions(
+            request, parent_lookup_seedteam,
+            parent_lookup_seedteam__organization)
+
+        serializer = PermissionIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        permission_ids = serializer.validated_data['permissions']
+        found = list(self.get_queryset().filter(pk__in=permission_ids))
+        self.check_permission_types(request, [
+            (p.type, p.object_id, p.namespace) for p in found])
+
+        # Removing the permissions from the team first updates the users'
+        # effective permissions for all of the permissions at once.
+        found_ids = set(p.pk for p in found)
+        with transaction.atomic():
+            team.permissions.remove(*found)
+            SeedPermission.objects.filter(pk__in=found_ids).delete()
+
+        return Response(data={'results': [
+            {
+                'id': str(permission_id),
+                'status': (
+                    status.HTTP_204_NO_CONTENT if permission_id in found_ids
+                    else status.HTTP_404_NOT_FOUND),
+            } for permission_id in permission_ids
+        ]})
+
+
+class TeamUsersViewSet(BulkUsersMixin, NestedViewSetMixin, GenericViewSet):
     '''Nested viewset that allows users to add or remove users from teams.'''
     queryset = User.objects.all()
     permission_classes = (IsAuthenticated,)
 
+    def get_users_relation(
+            self, request, parent_lookup_seedteam=None,
+            parent_lookup_seedteam__organization=None):
+        team = self.check_team_permissions(
+            request, parent_lookup_seedteam,
+            parent_lookup_seedteam__organization)
+        return team.users
+
     def check_team_permissions(self, request, teamid, orgid=None):
         if orgid is not None:
             team = get_object_or_404(
@@ -251,6 +418,10 @@ class TeamUsersViewSet(NestedViewSetMixin, GenericViewSet):
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     permission_classes = (permissions.UserPermission,)
+    cursor_orderings = {
+        'id': ('id',),
+        'created_at': ('date_joined', 'id'),
+    }
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -263,15 +434,24 @@ class UserViewSet(viewsets.ModelViewSet):
         shouldn't show up on list views.
 
         We have an archived query param, where 'true' shows archived, 'false'
-        omits them, and 'both' shows both.'''
+        omits them, and 'both' shows both.
+
+        The ids of the teams and organizations are prefetched for the
+        serializer.'''
+        queryset = self.queryset.prefetch_related(
+            Prefetch('seedteam_set', queryset=SeedTeam.objects.only('id')),
+            Prefetch(
+                'seedorganization_set',
+                queryset=SeedOrganization.objects.only('id')),
+        )
         if self.action == 'list':
             active = get_true_false_both(
                 self.request.query_params, 'active', 'true')
             if active == 'true':
-                return self.queryset.filter(is_active=True)
+                return queryset.filter(is_active=True)
             if active == 'false':
-                return self.queryset.filter(is_active=False)
-        return self.queryset
+                return queryset.filter(is_active=False)
+        return queryset
 
     def destroy(self, request, pk=None):
         '''For DELETE actions, actually deactivate the user, don't delete.'''
@@ -286,13 +466,17 @@ class TokenView(APIView):
 
     def post(self, request):
         '''Create a token, given an email and password. Removes all other
-        tokens for that user.'''
+        tokens for that user.
+
+        The password is checked in the hashing pool, and a 503 response is
+        returned if the pool is full.'''
         serializer = CreateTokenSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
         email = serializer.validated_data.get('email')
         password = serializer.validated_data.get('password')
-        user = authenticate(username=email, password=password)
+        user = get_hashing_pool().run(
+            authenticate, request, username=email, password=password)
         if not user:
             return Response(status=status.HTTP_401_UNAUTHORIZED)
 
@@ -309,6 +493,66 @@ class UserPermissionsView(APIView):
     def get(self, request):
         '''Get user information, with a list of permissions for that user.'''
         user = request.user
-        serializer = PermissionsUserSerializer(
-            instance=user, context={'request': request})
-        return Response(data=serializer.data)
+        permissions = get_effective_permissions(user)
+        etag = make_etag(
+            request, user.pk, user.email, user.first_name, user.last_name,
+            user.is_superuser, user.is_active,
+            sorted(permissions, key=lambda p: p.id))
+        return conditional_response(
+            request, etag, None, lambda: PermissionsUserSerializer(
+                instance=user, context={
+                    'request': request, 'permissions': permissions}).data)
+
+
+class UserPermissionsCheckView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        '''Check whether the user has each of a list of permissions.'''
+        serializer = PermissionsCheckSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        checks = [
+            (p['type'], p['object_id'], p['namespace'])
+            for p in serializer.validated_data['permissions']]
+        return Response(data={
+            'results': check_permissions(request.user, checks),
+        })
+
+
+class ExportView(APIView):
+    permission_classes = (permissions.ExportPermission,)
+    renderer_classes = (NDJSONRenderer, CSVRenderer)
+
+    def get(self, request, name):
+        '''Stream all the rows of an export, in the format chosen with the
+        format query parameter or the Accept header.'''
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            stream_export(name, renderer.format),
+            content_type='%s; charset=utf-8' % renderer.media_type)
+        response['Content-Disposition'] = (
+            'attachment; filename="%s.%s"' % (name, renderer.format))
+        return response
+
+
+class ChangesView(APIView):
+    permission_classes = (permissions.ChangesPermission,)
+
+    def get(self, request):
+        '''Get the changes after the since sequence number. If there are no
+        changes yet, waits for up to wait seconds for them. Without since,
+        returns the latest sequence number, to start from.'''
+        query = ChangesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        since = query.validated_data.get('since')
+        if since is None:
+            return Response(data={
+                'seq': str(Change.objects.latest_seq()), 'results': []})
+
+        changes = wait_for_changes(
+            since, query.validated_data['limit'],
+            query.validated_data['wait'])
+        return Response(data={
+            'seq': str(changes[-1].id if changes else since),
+            'results': ChangeSerializer(instance=changes, many=True).data,
+        })
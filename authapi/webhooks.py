@@ -0,0 +1,157 @@
+import hashlib
+import hmac
+import json
+import logging
+import time
+import urllib.request
+from collections import OrderedDict
+from concurrent import futures
+from datetime import timedelta
+
+from django.db import close_old_connections, transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from authapi.models import Change, Webhook
+
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = 'X-Seed-Auth-Signature'
+
+
+def coalesce_changes(changes):
+    '''Returns the payload for a list of changes, with one entry for each
+    user, listing the types of their changes in the order that they first
+    happened.'''
+    users = OrderedDict()
+    for change in changes:
+        types = users.setdefault(change.user_id, [])
+        if change.type not in types:
+            types.append(change.type)
+    return {
+        'seq': str(changes[-1].id),
+        'users': [
+            {'user': str(user_id), 'types': types}
+            for user_id, types in users.items()],
+    }
+
+
+def sign(secret, body):
+    '''Returns the HMAC-SHA256 hex digest of the body.'''
+    return hmac.new(
+        secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+def post_payload(url, secret, payload, timeout):
+    '''POSTs the payload as JSON. Raises an exception if the request fails,
+    or the response has an error status.'''
+    body = json.dumps(payload).encode('utf-8')
+    request = urllib.request.Request(
+        url, data=body, method='POST',
+        headers={'Content-Type': 'application/json'})
+    if secret:
+        request.add_header(SIGNATURE_HEADER, 'sha256=' + sign(secret, body))
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+
+
+def prune_changes(before):
+    '''Deletes the changes created before the given time, except for those
+    that an active webhook hasn't been sent yet. Returns the number of
+    changes deleted.'''
+    changes = Change.objects.filter(created_at__lt=before)
+    oldest_pending = Webhook.objects.filter(active=True).aggregate(
+        seq=Min('last_seq'))['seq']
+    if oldest_pending is not None:
+        changes = changes.filter(id__lte=oldest_pending)
+    deleted, _ = changes.delete()
+    return deleted
+
+
+class WebhookWorker(object):
+    '''Delivers the changes in the change feed to the active webhooks.
+
+    Each delivery is up to batch_size changes, coalesced per user. Database
+    queries are made in the calling thread, and the requests are made in a
+    pool of max_workers threads, so that a slow webhook doesn't hold up the
+    others for longer than timeout.
+
+    If a delivery fails, it is retried after backoff seconds, doubling for
+    each further failure, up to max_backoff seconds. Changes are delivered in
+    order, so a webhook only gets later changes once the earlier ones have
+    been delivered.
+
+    Each webhook is locked while its changes are delivered, and workers skip
+    webhooks that are locked, so that more than one worker can run without
+    delivering the same changes twice.'''
+    def __init__(
+            self, max_workers=4, batch_size=1000, timeout=10, backoff=1,
+            max_backoff=300, post=post_payload):
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.post = post
+        self.executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+
+    def get_due_webhooks(self):
+        '''Locks and returns the webhooks that are due, skipping those that
+        another worker has locked. This must be called in a transaction.'''
+        return Webhook.objects.filter(active=True).filter(
+            Q(next_attempt_at__isnull=True) |
+            Q(next_attempt_at__lte=timezone.now())).order_by(
+                'id').select_for_update(skip_locked=True)
+
+    def run_once(self):
+        '''Delivers the next batch of changes to each webhook that is due.
+        Returns the number of successful deliveries.'''
+        with transaction.atomic():
+            return self.deliver(self.get_due_webhooks())
+
+    def deliver(self, webhooks):
+        '''Delivers the next batch of changes to each of the webhooks, and
+        returns the number of successful deliveries.'''
+        pending = []
+        for webhook in webhooks:
+            changes = list(Change.objects.filter(
+                id__gt=webhook.last_seq).order_by('id')[:self.batch_size])
+            if not changes:
+                continue
+            future = self.executor.submit(
+                self.post, webhook.url, webhook.secret,
+                coalesce_changes(changes), self.timeout)
+            pending.append((webhook, changes[-1].id, future))
+
+        delivered = 0
+        for webhook, seq, future in pending:
+            try:
+                future.result()
+            except Exception as e:
+                self.delivery_failed(webhook, e)
+            else:
+                Webhook.objects.filter(pk=webhook.pk).update(
+                    last_seq=seq, failures=0, next_attempt_at=None)
+                delivered += 1
+        return delivered
+
+    def delivery_failed(self, webhook, error):
+        failures = webhook.failures + 1
+        delay = min(self.backoff * 2 ** (failures - 1), self.max_backoff)
+        Webhook.objects.filter(pk=webhook.pk).update(
+            failures=failures,
+            next_attempt_at=timezone.now() + timedelta(seconds=delay))
+        logger.warning(
+            'Delivery to webhook %s failed %d times, retrying in %ss: %s',
+            webhook.url, failures, delay, error)
+
+    def run_forever(self, poll_interval=1):
+        '''Delivers changes until interrupted, waiting for poll_interval
+        seconds whenever there was nothing to deliver.'''
+        while True:
+            close_old_connections()
+            if not self.run_once():
+                time.sleep(poll_interval)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,145 @@
+'''
+Shows the PostgreSQL query plans for the permission lookups, with and
+without the indexes added in authapi.migrations.0011_permission_indexes, on a
+seeded dataset.
+
+All changes are made inside a transaction that is rolled back, so this can be
+run against any database that has been migrated:
+
+    DJANGO_SETTINGS_MODULE=seed_auth_api.settings \\
+        python benchmarks/query_plans.py --organizations 100 --teams 50
+'''
+import argparse
+import os
+import random
+import sys
+
+import django
+
+
+INDEXES = [
+    'authapi_org_active_idx',
+    'authapi_perm_lookup_idx',
+    'authapi_perm_type_trgm_idx',
+    'authapi_team_active_idx',
+]
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        '--organizations', type=int, default=200,
+        help='Number of organizations to create')
+    parser.add_argument(
+        '--teams', type=int, default=50,
+        help='Number of teams to create per organization')
+    parser.add_argument(
+        '--permissions', type=int, default=5,
+        help='Number of permissions to create per team')
+    parser.add_argument(
+        '--users', type=int, default=0,
+        help='Number of users to create, with memberships of teams')
+    parser.add_argument(
+        '--archived', type=float, default=0.5,
+        help='Fraction of organizations and teams that are archived')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def seed(args):
+    '''Creates a dataset with authapi.benchmark.seed_dataset, the same as
+    the API benchmarks, and archives the --archived fraction of its
+    organizations and teams. Returns an organization id and team id to look
+    up.'''
+    from authapi.benchmark import seed_dataset
+    from authapi.models import SeedOrganization, SeedTeam
+
+    dataset = seed_dataset(
+        organizations=args.organizations, teams_per_organization=args.teams,
+        users=args.users, permissions_per_team=args.permissions,
+        seed=args.seed)
+    rand = random.Random(args.seed)
+    for model, ids in (
+            (SeedOrganization, dataset.organization_ids),
+            (SeedTeam, dataset.team_ids)):
+        model.objects.filter(pk__in=[
+            pk for pk in ids if rand.random() < args.archived
+        ]).update(archived=True)
+
+    return (
+        rand.choice(dataset.organization_ids), rand.choice(dataset.team_ids))
+
+
+def get_queries(org_id, team_id):
+    '''Returns a list of (name, queryset) for the lookups to explain.'''
+    from authapi.models import SeedOrganization, SeedPermission, SeedTeam
+    from authapi.utils import find_permission
+
+    return [
+        ('find_permission', find_permission(
+            SeedPermission.objects.all(), 'team:admin', str(team_id),
+            '__auth__')),
+        ('active organizations', SeedOrganization.objects.filter(
+            archived=False).order_by('id')[:100]),
+        ('active teams of organization', SeedTeam.objects.filter(
+            organization_id=org_id, archived=False)),
+        ('permission_contains', SeedTeam.objects.filter(
+            permissions__type__contains='write').distinct()),
+    ]
+
+
+def scan_types(plan):
+    '''Returns the set of scan node types in the JSON plan.'''
+    types = set()
+    if plan['Node Type'].endswith('Scan'):
+        scan = plan['Node Type']
+        # Bitmap index scans and subquery scans don't have a relation
+        if 'Relation Name' in plan:
+            scan += ' on %s' % (plan['Relation Name'],)
+        if 'Index Name' in plan:
+            scan += ' using %s' % (plan['Index Name'],)
+        types.add(scan)
+    for child in plan.get('Plans', []):
+        types |= scan_types(child)
+    return types
+
+
+def report(name, label, result):
+    print('%-30s %-8s %8.3fms  %s' % (
+        name, label, result['Execution Time'],
+        ', '.join(sorted(scan_types(result['Plan'])))))
+
+
+def main(argv):
+    args = parse_args(argv)
+    os.environ.setdefault(
+        'DJANGO_SETTINGS_MODULE', 'seed_auth_api.settings')
+    sys.path.insert(
+        0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    django.setup()
+
+    from django.db import connection
+
+    from authapi.db import explain, rolled_back
+
+    if connection.vendor != 'postgresql':
+        sys.exit('Query plans can only be shown for PostgreSQL')
+
+    with rolled_back(), connection.cursor() as cursor:
+        org_id, team_id = seed(args)
+        cursor.execute('ANALYZE')
+        queries = get_queries(org_id, team_id)
+
+        with_indexes = [explain(q, analyze=True) for _, q in queries]
+        for index in INDEXES:
+            cursor.execute('DROP INDEX IF EXISTS %s' % index)
+        without_indexes = [explain(q, analyze=True) for _, q in queries]
+
+        for (name, _), before, after in zip(
+                queries, without_indexes, with_indexes):
+            report(name, 'before', before)
+            report(name, 'after', after)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -55,6 +55,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'authapi.metrics.MetricsMiddleware',
+    'authapi.timing.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -121,9 +123,10 @@ STATICFILES_FINDERS = (
 
 
 REST_FRAMEWORK = {
-    'DEFAULT_PAGINATION_CLASS': 'authapi.pagination.LinkHeaderPagination',
+    'DEFAULT_PAGINATION_CLASS':
+        'authapi.pagination.SelectableLinkHeaderPagination',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'authapi.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.AllowAny',
@@ -132,3 +135,106 @@ REST_FRAMEWORK = {
 
 # Set the namespace to use for internal permissions.
 PERMISSION_NAMESPACE = '__auth__'
+
+# Django's caches. The default is stored in the memory of each process, so
+# CACHE_BACKEND and CACHE_LOCATION should be set to a cache that is shared
+# between processes, like memcached, to use authapi.cache.SharedCache.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    },
+}
+
+# Cache for the effective permissions of each user. The cache is invalidated
+# whenever a change is made that affects a user's permissions.
+# 'authapi.cache.LocalMemoryCache' keeps a least recently used cache
+# in each process, and is only invalidated by changes made in that process, so
+# its entries expire after the timeout, 60 seconds by default.
+# 'authapi.cache.SharedCache' stores values in the CACHES entry given by the
+# 'cache_alias' option, which must be shared between processes. Its entries
+# expire after 300 seconds by default.
+PERMISSION_CACHE = {
+    'BACKEND': os.environ.get(
+        'PERMISSION_CACHE_BACKEND', 'authapi.cache.DummyCache'),
+    'OPTIONS': {},
+}
+if os.environ.get('PERMISSION_CACHE_TIMEOUT'):
+    PERMISSION_CACHE['OPTIONS']['timeout'] = int(
+        os.environ['PERMISSION_CACHE_TIMEOUT'])
+
+# Cache for the tokens, and their users, used to authenticate requests. The
+# cache is invalidated when a token is deleted, or the user is changed. The
+# same backends are available as for PERMISSION_CACHE. With LocalMemoryCache,
+# a token deleted, or a user deactivated, by another process can still be
+# used until the token expires from this process's cache, so
+# TOKEN_CACHE_TIMEOUT should be kept short.
+TOKEN_CACHE = {
+    'BACKEND': os.environ.get(
+        'TOKEN_CACHE_BACKEND', 'authapi.cache.DummyCache'),
+    'OPTIONS': {},
+}
+if os.environ.get('TOKEN_CACHE_TIMEOUT'):
+    TOKEN_CACHE['OPTIONS']['timeout'] = int(
+        os.environ['TOKEN_CACHE_TIMEOUT'])
+if TOKEN_CACHE['BACKEND'] == 'authapi.cache.SharedCache':
+    TOKEN_CACHE['OPTIONS']['key_prefix'] = 'authapi:tokens:'
+
+# Limits on checking passwords when creating tokens. At most max_workers
+# passwords are checked at once, and max_queue wait for up to timeout seconds;
+# other logins get a 503 response. With PostgreSQL these limits are for all of
+# the processes that use the database, not for each process, so that a burst
+# of logins can occupy at most max_workers + max_queue request workers. Keep
+# that well below the total number of workers, and max_workers no more than
+# the number of CPUs that can be spent on hashing.
+HASHING_POOL = {
+    'max_workers': int(os.environ.get('HASHING_POOL_MAX_WORKERS', 2)),
+    'max_queue': int(os.environ.get('HASHING_POOL_MAX_QUEUE', 8)),
+    'timeout': float(os.environ.get('HASHING_POOL_TIMEOUT', 5)),
+}
+
+# Long polling of the change feed. Requests wait for at most MAX_WAIT seconds
+# for new changes, checking for them every POLL_INTERVAL seconds. A waiting
+# request holds a worker, so keep MAX_WAIT short unless the workers are
+# threaded or asynchronous.
+CHANGES = {
+    'POLL_INTERVAL': float(os.environ.get('CHANGES_POLL_INTERVAL', 1)),
+    'MAX_WAIT': float(os.environ.get('CHANGES_MAX_WAIT', 5)),
+}
+
+# Timing of requests. When enabled, the total, database, serializer, and
+# permission check times of each request are returned in a Server-Timing
+# header, and logged as JSON to the authapi.timing logger. If CACHE_ALIAS is
+# set, it can be turned on and off at runtime with the request_timing command,
+# which stores the switch in that CACHES entry. Each process checks the switch
+# every CHECK_INTERVAL seconds, so the cache must be shared between processes.
+REQUEST_TIMING = {
+    'ENABLED': os.environ.get('REQUEST_TIMING', 'False').lower() == 'true',
+    'CACHE_ALIAS': os.environ.get('REQUEST_TIMING_CACHE_ALIAS'),
+    'CHECK_INTERVAL': float(
+        os.environ.get('REQUEST_TIMING_CHECK_INTERVAL', 10)),
+}
+
+# Access to the /metrics endpoint. If TOKEN is set, requests need an
+# "Authorization: Bearer <TOKEN>" header. If it isn't, anyone who can reach the
+# service can read the metrics, so the endpoint must not be exposed publicly.
+METRICS = {
+    'TOKEN': os.environ.get('METRICS_TOKEN', ''),
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'authapi': {
+            'handlers': ['console'],
+            'level': os.environ.get('AUTHAPI_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
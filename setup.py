@@ -43,6 +43,7 @@ setup(
         'drf-extensions==0.4.0',
         'djangorestframework-composed-permissions==0.2.1',
         'raven==6.10.0',
+        'prometheus_client==0.7.1',
     ],
     classifiers=[
         'Development Status :: 4 - Beta',